@@ -1,13 +1,73 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from sqlmodel import Session, SQLModel
 
 from .routes.archers import router as archers_router
+from .routes.event_log import router as event_log_router
+from .routes.events import router as events_router
+from .routes.jobs import router as jobs_router
 from .routes.matches import router as matches_router
+from .routes.metrics import router as metrics_router
+from .routes.profiles import router as profiles_router
 from .routes.teams import router as teams_router
 from .routes.tournaments import router as tournaments_router
 from .routes.websocket import router as websocket_router
+from .utils.arrow_journal import arrow_journal
+from .utils.compression import CompressionMiddleware
+from .utils.jobs import job_runner
+from .utils.live_store import live_store
+from .utils.metrics import (
+    METRICS_ENABLED,
+    MetricsMiddleware,
+    instrument_engine,
+    monitor_event_loop_lag,
+)
+from .utils.profiling import PROFILING_ENABLED, ProfilingMiddleware
+from .utils.query_budget import QUERY_CHECK_ENABLED, QueryBudgetMiddleware
+from .utils.query_budget import instrument_engine as instrument_engine_queries
+from .utils.result_snapshots import result_snapshots
+from .utils.slow_queries import SLOW_QUERY_ENABLED, SlowQueryMiddleware, configure_log
+from .utils.slow_queries import instrument_engine as instrument_engine_slow_queries
+from .utils.sqlite import engine, ensure_columns, ensure_indexes, shard_router
+from .utils.ws_manager_insance import ws_instance
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Creates the tables, columns and indexes added since the database was seeded
+    SQLModel.metadata.create_all(engine)
+    ensure_columns(engine)
+    ensure_indexes(engine)
+    await ws_instance.start()
+    await job_runner.start(ws_instance.broadcast)
+    if arrow_journal is not None:
+        # Replays the arrows journaled before a crash
+        await arrow_journal.start()
+    result_snapshots.start()
+    with Session(engine) as session:
+        live_store.warm(session)
+        result_snapshots.warm(session)
+
+    background_tasks = []
+    if METRICS_ENABLED:
+        background_tasks.append(asyncio.create_task(monitor_event_loop_lag()))
+
+    yield
+
+    for task in background_tasks:
+        task.cancel()
 
-app = FastAPI()
+    if arrow_journal is not None:
+        await arrow_journal.stop()
+    result_snapshots.stop()
+    await job_runner.stop()
+    await ws_instance.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -15,9 +75,37 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+if QUERY_CHECK_ENABLED:
+    instrument_engine_queries(engine)
+    if shard_router is not None:
+        shard_router.instrument(instrument_engine_queries)
+    app.add_middleware(QueryBudgetMiddleware)
+
+if SLOW_QUERY_ENABLED:
+    configure_log()
+    instrument_engine_slow_queries(engine)
+    if shard_router is not None:
+        shard_router.instrument(instrument_engine_slow_queries)
+    app.add_middleware(SlowQueryMiddleware)
+
+if METRICS_ENABLED:
+    instrument_engine(engine)
+    if shard_router is not None:
+        shard_router.instrument(instrument_engine)
+    app.add_middleware(MetricsMiddleware)
 
 app.include_router(archers_router)
 app.include_router(tournaments_router)
 app.include_router(matches_router)
 app.include_router(teams_router)
 app.include_router(websocket_router)
+app.include_router(metrics_router)
+app.include_router(profiles_router)
+app.include_router(event_log_router)
+app.include_router(events_router)
+app.include_router(jobs_router)
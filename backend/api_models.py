@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from .models.constants import (
     ArcherPosition,
@@ -9,7 +9,7 @@ from .models.constants import (
     TournamentStatus,
     MatchFormat,
 )
-from .models.models import ArcherPublic, TournamentWithArchersAndTeams
+from .models.models import ArcherPublic, MatchWithSeries, TournamentWithArchersAndTeams
 
 
 class ArrowInput(BaseModel):
@@ -22,6 +22,25 @@ class MatchArrowInput(BaseModel):
     arrow: int
 
 
+class ScorerArrowInput(BaseModel):
+    seq: int  # Increases with every arrow recorded by the client
+    match_id: int
+    archer_id: int
+    arrow: int
+
+
+class ScorerSyncInput(BaseModel):
+    client_id: str = Field(min_length=1, max_length=64)
+    arrows: List[ScorerArrowInput] = Field(max_length=1000)
+
+
+class ScorerSyncResult(BaseModel):
+    client_id: str
+    applied: List[int]  # Sequence numbers applied by this upload
+    duplicates: List[int]  # Sequence numbers already applied before
+    last_seq: Optional[int]  # Highest sequence number applied for the client
+
+
 class MatchEnkinInput(BaseModel):
     place: int
 
@@ -64,6 +83,12 @@ class PaginatedTournaments(Paginated):
     data: List[TournamentWithArchersAndTeams]
 
 
+class CursorPaginatedMatches(BaseModel):
+    limit: int
+    next_cursor: Optional[str]  # None on the last page
+    data: List[MatchWithSeries]
+
+
 class PaginatedArcher(Paginated):
     data: List[ArcherPublic]
 
@@ -79,9 +104,34 @@ class AdvancingParticipant(BaseModel):
 
 
 class TournamentNextStageInput(BaseModel):
-    advancing_participants: List[AdvancingParticipant]
+    # Computed from the series of the stage when omitted
+    advancing_participants: Optional[List[AdvancingParticipant]] = None
     tie_breaker_needed: bool = False
 
 
 class TournamentTieBreakParticipantsInput(BaseModel):
     stage: TournamentStage
+
+
+class JobInput(BaseModel):
+    kind: str
+    # Validated against the parameters model of the job kind
+    params: dict = {}
+
+
+class TournamentExportParams(BaseModel):
+    tournament_id: int
+
+
+class ImportedArcher(BaseModel):
+    name: str
+    position: ArcherPosition = ArcherPosition.ZASHA
+
+
+class ArcherImportParams(BaseModel):
+    archers: List[ImportedArcher]
+
+
+class SeriesRecountParams(BaseModel):
+    # Tournaments whose series are recounted, all of them when omitted
+    tournament_ids: Optional[List[int]] = None
@@ -0,0 +1,327 @@
+import asyncio
+import itertools
+import os
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from sqlmodel import Session, select, update
+
+from ..models.constants import TournamentFormat, TournamentStage, TournamentStatus
+from ..models.models import (
+    ArcherTournamentLink,
+    Match,
+    Series,
+    Tournament,
+    TournamentWithEverything,
+)
+from ..models.read_models import (
+    TOURNAMENT_RELATIONS,
+    Shape,
+    live_summary,
+    tournaments_with_everything,
+)
+from ..routes.tournaments import next_stage, pick_match_archers, pick_team_archers
+from ..utils.arrow_journal import ArrowJournal
+from ..utils.live_store import LiveStore
+from ..utils.responses import json_response, model_response, raw_json_response
+from ..utils.result_snapshots import ResultSnapshots
+from ..utils.scoring import append_arrow
+from .fixtures import (
+    ROUND_COUNT,
+    TARGET_COUNT,
+    build_archers,
+    build_arrow_lists,
+    build_raw_series,
+    build_rotating_matches,
+    create_file_engine,
+    create_memory_engine,
+    immediate_broadcasts,
+    seed_tournament,
+)
+
+# A case receives the participant count and returns the function to time and
+# an optional reset function run (untimed) before every call.
+Case = Callable[[int], Tuple[Callable[[], object], Optional[Callable[[], None]]]]
+
+CASES: Dict[str, Case] = {}
+
+
+def case(name: str):
+    def register(fn: Case):
+        CASES[name] = fn
+        return fn
+
+    return register
+
+
+@case("pick_match_archers")
+def bench_pick_match_archers(participants: int):
+    archers = build_archers(participants)
+    # Leave the last round incomplete so the "left to play" branch is taken
+    matches = build_rotating_matches(archers, TARGET_COUNT, ROUND_COUNT)
+    matches = matches[: len(matches) - 1]
+
+    return lambda: pick_match_archers(TARGET_COUNT, archers, matches), None
+
+
+@case("pick_team_archers")
+def bench_pick_team_archers(participants: int):
+    engine = create_memory_engine()
+    session = Session(engine)
+    tournament_id = seed_tournament(session, participants, TournamentFormat.TEAM)
+    tournament = session.get(Tournament, tournament_id)
+    teams = sorted(tournament.teams, key=lambda t: t.number)
+    matches = tournament.matches
+
+    # Load the rosters and match archers up front, only the picking is timed
+    for team in teams:
+        team.archers
+    for match in matches:
+        match.archers
+
+    return (
+        lambda: pick_team_archers(session, TARGET_COUNT, teams, matches),
+        None,
+    )
+
+
+@case("match_verify_finish")
+def bench_match_verify_finish(participants: int):
+    archers = build_archers(participants)
+    matches = build_rotating_matches(archers, TARGET_COUNT, ROUND_COUNT)
+
+    return lambda: [match.verify_finish for match in matches], None
+
+
+@case("series_arrows_parse")
+def bench_series_arrows_parse(participants: int):
+    series = [
+        Series(arrows_raw=raw) for raw in build_raw_series(participants * ROUND_COUNT)
+    ]
+
+    return lambda: [s.arrows for s in series], None
+
+
+@case("series_arrows_serialize")
+def bench_series_arrows_serialize(participants: int):
+    arrows = build_arrow_lists(participants * ROUND_COUNT)
+    series = [Series() for _ in arrows]
+
+    def run():
+        for s, a in zip(series, arrows):
+            s.arrows = a
+
+    return run, None
+
+
+@case("next_stage")
+def bench_next_stage(participants: int):
+    """
+    Closes the qualifiers, the participants advancing computed by the server.
+    """
+    engine = create_memory_engine()
+    session = Session(engine)
+    tournament_id = seed_tournament(session, participants)
+    loop = asyncio.new_event_loop()
+    immediate_broadcasts()
+
+    def reset():
+        session.exec(
+            update(ArcherTournamentLink)
+            .where(ArcherTournamentLink.tournament_id == tournament_id)
+            .values(
+                qualifiers_place=None, tie_break_qualifiers=False, finals_place=None
+            )
+        )
+        session.exec(
+            update(Tournament)
+            .where(Tournament.id == tournament_id)
+            .values(
+                current_stage=TournamentStage.QUALIFIERS,
+                status=TournamentStatus.LIVE,
+                had_qualifiers_tie_break=False,
+            )
+        )
+        session.commit()
+        session.expire_all()
+
+    return (
+        lambda: loop.run_until_complete(next_stage(tournament_id, None, session)),
+        reset,
+    )
+
+
+@case("tournament_with_everything_dump")
+def bench_tournament_with_everything_dump(participants: int):
+    tournament = load_tournament(participants)
+
+    return (
+        lambda: TournamentWithEverything.model_validate(tournament).model_dump_json(),
+        None,
+    )
+
+
+def load_tournament(participants: int):
+    engine = create_memory_engine()
+    session = Session(engine)
+    tournament = session.get(Tournament, seed_tournament(session, participants))
+
+    # Warm up once so lazy loads are excluded from the timings
+    TournamentWithEverything.model_validate(tournament)
+
+    return tournament
+
+
+# The response cases load the tournament from a fresh session on every call,
+# as a request does.
+
+
+@case("tournament_response_fastapi")
+def bench_tournament_response_fastapi(participants: int):
+    """
+    What FastAPI does when a route returns ORM objects with a `response_model`.
+    """
+    engine = create_memory_engine()
+    with Session(engine) as session:
+        tournament_id = seed_tournament(session, participants)
+    field = create_model_field(
+        name="response", type_=TournamentWithEverything, mode="serialization"
+    )
+    loop = asyncio.new_event_loop()
+
+    def run():
+        with Session(engine) as session:
+            content = loop.run_until_complete(
+                serialize_response(
+                    field=field, response_content=session.get(Tournament, tournament_id)
+                )
+            )
+            return JSONResponse(content).body
+
+    return run, None
+
+
+@case("tournament_response_model_dump_json")
+def bench_tournament_response_model_dump_json(participants: int):
+    engine = create_memory_engine()
+    with Session(engine) as session:
+        tournament_id = seed_tournament(session, participants)
+
+    def run():
+        with Session(engine) as session:
+            tournament = session.get(Tournament, tournament_id)
+            return model_response(TournamentWithEverything, tournament).body
+
+    return run, None
+
+
+@case("tournament_response_read_model")
+def bench_tournament_response_read_model(participants: int):
+    engine = create_memory_engine()
+    with Session(engine) as session:
+        tournament_id = seed_tournament(session, participants)
+
+    def run():
+        with Session(engine) as session:
+            content = tournaments_with_everything(session, [tournament_id])[0]
+            return json_response(content).body
+
+    return run, None
+
+
+@case("tournament_live_summary")
+def bench_tournament_live_summary(participants: int):
+    engine = create_memory_engine()
+    with Session(engine) as session:
+        tournament_id = seed_tournament(session, participants)
+
+    def run():
+        with Session(engine) as session:
+            return json_response(live_summary(session, tournament_id)).body
+
+    return run, None
+
+
+@case("tournament_response_live_store")
+def bench_tournament_response_live_store(participants: int):
+    engine = create_memory_engine()
+    store = LiveStore(enabled=True)
+    with Session(engine) as session:
+        tournament_id = seed_tournament(session, participants)
+        store.put(tournaments_with_everything(session, [tournament_id])[0])
+    shape = Shape(TOURNAMENT_RELATIONS)
+
+    return lambda: json_response(store.tournament(tournament_id, shape)).body, None
+
+
+@case("tournament_response_result_snapshot")
+def bench_tournament_response_result_snapshot(participants: int):
+    """
+    Finished tournament read from its memory-mapped result snapshot.
+    """
+    engine = create_file_engine()
+    snapshots = ResultSnapshots(os.path.dirname(engine.url.database), enabled=True)
+    with Session(engine) as session:
+        tournament_id = seed_tournament(session, participants)
+        snapshots.build(session, tournament_id)
+    shape = Shape(TOURNAMENT_RELATIONS)
+
+    return lambda: raw_json_response(snapshots.tournament(tournament_id, shape)).body, None
+
+
+def seed_arrow_targets(participants: int):
+    """
+    File database with one tournament, and an endless rotation over its
+    matches and their archers to shoot arrows at.
+    """
+    engine = create_file_engine()
+    with Session(engine) as session:
+        tournament_id = seed_tournament(session, participants, finished_rounds=1)
+        targets = session.exec(
+            select(Match, ArcherTournamentLink.archer_id)
+            .join(Series, Series.match_id == Match.id)
+            .join(ArcherTournamentLink, ArcherTournamentLink.archer_id == Series.archer_id)
+            .where(Match.tournament_id == tournament_id)
+        ).all()
+        session.expunge_all()
+    return engine, itertools.cycle(targets)
+
+
+@case("arrows_direct")
+def bench_arrows_direct(participants: int):
+    """
+    One arrow per call, committed on its own like `add_arrow_to_match`.
+    """
+    engine, targets = seed_arrow_targets(participants)
+
+    def run():
+        match, archer_id = next(targets)
+        with Session(engine) as session:
+            append_arrow(session, session.merge(match, load=False), archer_id, 1)
+            session.commit()
+
+    return run, None
+
+
+@case("arrows_write_behind")
+def bench_arrows_write_behind(participants: int):
+    """
+    One arrow per call, journaled and written in group commits of the default
+    size.
+    """
+    engine, targets = seed_arrow_targets(participants)
+    journal = ArrowJournal(
+        os.path.join(os.path.dirname(engine.url.database), "arrows.log"), engine=engine
+    )
+    journal.open()
+
+    def run():
+        match, archer_id = next(targets)
+        # What `append` runs in a thread
+        journal.journal(match.id, archer_id, 1)
+        if len(journal.pending) >= journal.flush_arrows:
+            journal.flush()
+
+    return run, None
@@ -0,0 +1,180 @@
+import json
+import math
+import os
+import random
+import tempfile
+from datetime import datetime
+
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine
+
+from ..models.constants import (
+    HitOutcome,
+    MatchFormat,
+    TournamentFormat,
+    TournamentStage,
+    TournamentStatus,
+)
+from ..models.models import (
+    Archer,
+    ArcherTeamLink,
+    ArcherTournamentLink,
+    Match,
+    Series,
+    Team,
+    Tournament,
+)
+from ..utils.ws_manager_insance import ws_instance
+
+TARGET_COUNT = 5
+ROUND_COUNT = 4
+TEAM_SIZE = 3
+SEED = 42
+
+
+def build_archers(count: int):
+    return [Archer(id=i + 1, name=f"Archer {i + 1}") for i in range(count)]
+
+
+def build_rotating_matches(archers, target_count: int, round_count: int):
+    """
+    Builds transient matches where every archer shoots once per round, the same
+    way the rotation in `setup.py` does.
+    """
+    rng = random.Random(SEED)
+    matches_per_round = math.ceil(len(archers) / target_count)
+    matches = []
+
+    for _ in range(round_count):
+        for m in range(matches_per_round):
+            match = Match(format=MatchFormat.STANDARD)
+            match.archers = archers[m * target_count : (m + 1) * target_count]
+            match.series = [
+                Series(
+                    archer_id=archer.id,
+                    arrows_raw=json.dumps(
+                        [rng.choice([0, 1]) for _ in range(4)]
+                    ),
+                )
+                for archer in match.archers
+            ]
+            matches.append(match)
+
+    return matches
+
+
+def build_raw_series(count: int):
+    rng = random.Random(SEED)
+    return [json.dumps([rng.choice([0, 1, 2]) for _ in range(4)]) for _ in range(count)]
+
+
+def build_arrow_lists(count: int):
+    rng = random.Random(SEED)
+    return [
+        [HitOutcome(rng.choice([0, 1])) for _ in range(4)] for _ in range(count)
+    ]
+
+
+def immediate_broadcasts():
+    """
+    Makes the routes run by a case publish their broadcasts right away: a
+    coalescing task would be left pending on the case's throwaway event loop.
+    """
+    ws_instance.coalesce_window = 0
+
+
+def create_memory_engine():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def create_file_engine():
+    """
+    Engine on a fresh database file, for cases where commits (and their
+    fsyncs) are what is measured.
+    """
+    path = os.path.join(tempfile.mkdtemp(prefix="seisha-bench-"), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def seed_tournament(
+    session: Session,
+    participants: int,
+    format: TournamentFormat = TournamentFormat.INDIVIDUAL,
+    finished_rounds: int = ROUND_COUNT,
+):
+    """
+    Seeds one live tournament with `participants` archers (or teams of
+    `TEAM_SIZE` archers) and `finished_rounds` rounds of finished qualifier
+    matches.
+
+    :return: The id of the seeded tournament.
+    """
+    rng = random.Random(SEED)
+    archer_count = participants * (TEAM_SIZE if format == TournamentFormat.TEAM else 1)
+
+    tournament = Tournament(
+        name=f"Benchmark {participants}",
+        format=format,
+        start_date=datetime(2025, 1, 1),
+        end_date=datetime(2025, 1, 1),
+        status=TournamentStatus.LIVE,
+        current_stage=TournamentStage.QUALIFIERS,
+        advancing_count=max(1, participants // 4),
+        qualifiers_round_count=ROUND_COUNT,
+        finals_round_count=ROUND_COUNT,
+        target_count=TARGET_COUNT,
+    )
+    session.add(tournament)
+    session.flush()
+
+    archers = [Archer(name=f"Archer {i + 1}") for i in range(archer_count)]
+    session.add_all(archers)
+    session.flush()
+
+    if format == TournamentFormat.INDIVIDUAL:
+        session.add_all(
+            ArcherTournamentLink(
+                archer_id=archer.id, tournament_id=tournament.id, number=i + 1
+            )
+            for i, archer in enumerate(archers)
+        )
+    else:
+        for t in range(participants):
+            team = Team(name=f"Team {t + 1}", number=t + 1, tournament_id=tournament.id)
+            session.add(team)
+            session.flush()
+            members = archers[t * TEAM_SIZE : (t + 1) * TEAM_SIZE]
+            session.add_all(
+                ArcherTeamLink(archer_id=archer.id, team_id=team.id, number=j + 1)
+                for j, archer in enumerate(members)
+            )
+
+    matches_per_round = math.ceil(archer_count / TARGET_COUNT)
+    for _ in range(finished_rounds):
+        for m in range(matches_per_round):
+            match = Match(
+                format=MatchFormat.STANDARD,
+                stage=TournamentStage.QUALIFIERS,
+                finished=True,
+                tournament_id=tournament.id,
+            )
+            match.archers = archers[m * TARGET_COUNT : (m + 1) * TARGET_COUNT]
+            match.series = [
+                Series(
+                    archer_id=archer.id,
+                    arrows_raw=json.dumps([rng.choice([0, 1]) for _ in range(4)]),
+                )
+                for archer in match.archers
+            ]
+            session.add(match)
+
+    session.commit()
+    return tournament.id
@@ -0,0 +1,126 @@
+"""
+Micro-benchmarks for the backend hot paths.
+
+Run from the repository root:
+
+    python -m backend.benchmarks.run                   # run and compare to the baseline
+    python -m backend.benchmarks.run --save-baseline   # record a new baseline
+    python -m backend.benchmarks.run -k next_stage --sizes 10 100
+
+The process exits with status 1 when a case is slower than its baseline by more
+than `--threshold` (20% by default).
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from .cases import CASES
+
+SIZES = [10, 100, 1000]
+BASELINE_FILE = Path(__file__).parent / "baseline.json"
+MIN_SAMPLE_TIME = 0.02
+
+
+def autorange(fn) -> int:
+    """
+    Returns the number of calls needed for one sample to last at least
+    `MIN_SAMPLE_TIME` seconds, like `timeit.Timer.autorange`.
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= MIN_SAMPLE_TIME:
+            return number
+        number *= 2
+
+
+def measure(fn, reset, repeat: int) -> float:
+    """
+    Returns the median time of one call to `fn` in seconds. Stateful cases
+    provide a `reset` function and are timed one call at a time.
+    """
+    samples = []
+
+    if reset is None:
+        number = autorange(fn)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            samples.append((time.perf_counter() - start) / number)
+    else:
+        for _ in range(repeat):
+            reset()
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+
+    return statistics.median(samples)
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("µs", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def load_baseline(path: Path) -> dict:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-k", "--filter", default="", help="Only run cases containing this string")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline)
+    results = {}
+    regressions = []
+
+    for name, case in CASES.items():
+        if args.filter not in name:
+            continue
+
+        for size in args.sizes:
+            key = f"{name}[{size}]"
+            fn, reset = case(size)
+            elapsed = measure(fn, reset, args.repeat)
+            results[key] = elapsed
+
+            line = f"{key:<45} {format_time(elapsed):>12} {1 / elapsed:>12,.0f}/s"
+            if key in baseline:
+                ratio = elapsed / baseline[key]
+                line += f"   {ratio:6.2f}x baseline"
+                if ratio > 1 + args.threshold:
+                    line += "   REGRESSION"
+                    regressions.append(key)
+            print(line, flush=True)
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps({**baseline, **results}, indent=2) + "\n")
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
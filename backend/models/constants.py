@@ -47,3 +47,26 @@ class MatchArrows(int, Enum):
     EMPEROR = 2
     ENKIN = 1
     IZUME = 1
+
+
+class TournamentEventKind(str, Enum):
+    MATCH_CREATED = "match_created"
+    MATCH_FINISHED = "match_finished"
+    MATCH_DELETED = "match_deleted"
+    ARROW = "arrow"
+    ARROW_CORRECTION = "arrow_correction"
+    ENKIN_PLACE = "enkin_place"
+    STAGE_CHANGED = "stage_changed"
+    TOURNAMENT_UPDATED = "tournament_updated"
+    PARTICIPANT_ADDED = "participant_added"
+    PARTICIPANT_REMOVED = "participant_removed"
+    TEAM_ADDED = "team_added"
+    TEAM_REMOVED = "team_removed"
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
@@ -2,16 +2,18 @@ import json
 from datetime import datetime
 from typing import List, Optional
 
-from sqlalchemy import Column, DateTime, func
+from sqlalchemy import Column, DateTime, Index, event, func
 from sqlmodel import Field, Relationship, SQLModel
 
 from .constants import (
     ArcherPosition,
     HitOutcome,
+    JobStatus,
     MatchFormat,
     MatchArrows,
     TournamentFormat,
     TournamentStage,
+    TournamentEventKind,
     TournamentStatus,
     TournamentType,
 )
@@ -100,6 +102,11 @@ class SeriesBase(SQLModel):
 
 
 class Series(SeriesBase, table=True):
+    __table_args__ = (
+        # Covers the per-archer totals of the matches of a stage
+        Index("ix_series_match_counters", "match_id", "archer_id", "hits", "arrows_shot"),
+    )
+
     id: int = Field(default=None, primary_key=True)
 
     archer_id: int = Field(default=None, foreign_key="archer.id")
@@ -108,6 +115,12 @@ class Series(SeriesBase, table=True):
     match_id: int = Field(default=None, foreign_key="match.id")
     match: Optional["Match"] = Relationship(back_populates="series")
 
+    # Denormalized from `arrows_raw` on every write, for aggregates in SQL. In
+    # Enkin, the first arrow is a place: aggregates skip those matches.
+    hits: int = Field(default=0)
+    ensures: int = Field(default=0)
+    arrows_shot: int = Field(default=0)
+
     @property
     def arrows(self) -> List[HitOutcome]:
         return json.loads(self.arrows_raw)
@@ -116,6 +129,28 @@ class Series(SeriesBase, table=True):
     def arrows(self, value: List[HitOutcome]):
         self.arrows_raw = json.dumps(value)
 
+    def count_arrows(self):
+        for name, value in arrow_counters(self.arrows).items():
+            setattr(self, name, value)
+
+
+def arrow_counters(arrows: List[HitOutcome]) -> dict:
+    """
+    The `Series` counters of a list of arrows, for the bulk inserts that
+    bypass the ORM and its `count_series_arrows` listener.
+    """
+    return {
+        "hits": arrows.count(HitOutcome.HIT),
+        "ensures": arrows.count(HitOutcome.ENSURE),
+        "arrows_shot": len(arrows),
+    }
+
+
+@event.listens_for(Series, "before_insert")
+@event.listens_for(Series, "before_update")
+def count_series_arrows(mapper, connection, series: Series):
+    series.count_arrows()
+
 
 class SeriesPublic(SeriesBase):
     id: int
@@ -137,6 +172,19 @@ class MatchBase(SQLModel):
 
 
 class Match(MatchBase, table=True):
+    __table_args__ = (
+        # Live views read the unfinished matches of one tournament
+        Index("ix_match_tournament_finished", "tournament_id", "finished"),
+        # Match listings filter on stage and state, in creation order
+        Index(
+            "ix_match_tournament_stage_finished",
+            "tournament_id",
+            "stage",
+            "finished",
+            "created_at",
+        ),
+    )
+
     id: int = Field(default=None, primary_key=True)
 
     series: List["Series"] = Relationship(back_populates="match", cascade_delete=True)
@@ -234,6 +282,8 @@ class TournamentBase(SQLModel):
 
 class Tournament(TournamentBase, table=True):
     id: int = Field(default=None, primary_key=True)
+    # Rows of the finished tournament moved to its result snapshot
+    purged: bool = Field(default=False)
 
     matches: List["Match"] = Relationship(back_populates="tournament")
     archers: List["ArcherTournamentLink"] = Relationship(
@@ -242,6 +292,130 @@ class Tournament(TournamentBase, table=True):
     teams: List["Team"] = Relationship(back_populates="tournament", cascade_delete=True)
 
 
+class TournamentEvent(SQLModel, table=True):
+    """
+    Append-only log of every change made to a tournament, the id is the
+    sequence number of the event.
+    """
+
+    id: int = Field(default=None, primary_key=True)
+    tournament_id: int = Field(foreign_key="tournament.id", index=True)
+    kind: TournamentEventKind
+    match_id: int | None = Field(default=None, nullable=True)
+    archer_id: int | None = Field(default=None, nullable=True)
+    payload_raw: str = Field(default="{}")
+    created_at: datetime = Field(sa_column=Column(DateTime, default=func.now()))
+
+    @property
+    def payload(self) -> dict:
+        return json.loads(self.payload_raw)
+
+
+class TournamentEventPublic(SQLModel):
+    id: int
+    tournament_id: int
+    kind: TournamentEventKind
+    match_id: int | None
+    archer_id: int | None
+    payload: dict
+    created_at: datetime
+
+
+class TournamentSnapshot(SQLModel, table=True):
+    """
+    State of a tournament after applying every event up to `event_id`.
+    """
+
+    id: int = Field(default=None, primary_key=True)
+    tournament_id: int = Field(foreign_key="tournament.id", index=True)
+    event_id: int
+    state_raw: str
+    # Number of events recorded after `event_id`
+    tail_count: int = Field(default=0)
+    created_at: datetime = Field(sa_column=Column(DateTime, default=func.now()))
+
+
+class ScorerReceipt(SQLModel, table=True):
+    """
+    Arrow uploaded by a scorer client, identified by the client id and the
+    client's sequence number so that retried uploads are applied only once.
+    """
+
+    client_id: str = Field(primary_key=True)
+    seq: int = Field(primary_key=True)
+    match_id: int = Field(foreign_key="match.id")
+    archer_id: int = Field(foreign_key="archer.id")
+    series_id: int
+    arrow: int
+    created_at: datetime = Field(sa_column=Column(DateTime, default=func.now()))
+
+
+class ArrowJournalCheckpoint(SQLModel, table=True):
+    """
+    Last entry of an arrow journal written to the tables, committed with the
+    arrows so that a journal replayed after a crash never applies one twice.
+    """
+
+    epoch: str = Field(primary_key=True)
+    last_id: int
+
+
+class ShardRoute(SQLModel, table=True):
+    """
+    Catalog entry of a match or team stored in a tournament shard. Ids are
+    allocated here so they stay unique across shards, and requests addressing
+    a match or a team are routed to its tournament's shard.
+    """
+
+    id: int = Field(default=None, primary_key=True)
+    kind: str
+    tournament_id: int = Field(index=True)
+
+
+class Job(SQLModel, table=True):
+    """
+    Long-running operation run in a job worker process, polled by the client
+    that started it. `progress` goes from 0 to 1, `result_raw` holds the JSON
+    result of a succeeded job and `error` the reason of a failed one.
+    """
+
+    id: int = Field(default=None, primary_key=True)
+    kind: str
+    status: JobStatus = Field(default=JobStatus.QUEUED, index=True)
+    progress: float = Field(default=0.0)
+    message: str | None = Field(default=None, nullable=True)
+    params_raw: str = Field(default="{}")
+    result_raw: str | None = Field(default=None, nullable=True)
+    error: str | None = Field(default=None, nullable=True)
+    cancel_requested: bool = Field(default=False)
+    created_at: datetime = Field(sa_column=Column(DateTime, default=func.now()))
+    started_at: datetime | None = Field(default=None, nullable=True)
+    finished_at: datetime | None = Field(default=None, nullable=True)
+
+    @property
+    def params(self) -> dict:
+        return json.loads(self.params_raw)
+
+    @property
+    def result(self):
+        return json.loads(self.result_raw) if self.result_raw is not None else None
+
+
+class JobPublic(SQLModel):
+    id: int
+    kind: str
+    status: JobStatus
+    progress: float
+    message: str | None
+    params: dict
+    result: dict | list | None
+    error: str | None
+    cancel_requested: bool
+    created_at: datetime
+    started_at: datetime | None
+    finished_at: datetime | None
+
+
 class TournamentPublic(TournamentBase):
     id: int
     name: str
@@ -283,5 +457,32 @@ class TournamentWithEverything(TournamentPublic):
     archers: List[ArcherWithTournamentData] = []
 
 
+class Standing(SQLModel):
+    id: int  # Archer id, or team id in team tournaments
+    name: str
+    number: int
+    hits: int
+    arrows: int
+
+
+class TournamentLiveSummary(TournamentPublic):
+    matches: List[MatchWithSeries] = []
+    teams: List[TeamWithArchers] = []
+    archers: List[ArcherWithTournamentData] = []
+    standings: List[Standing] = []
+
+
+class MatchArrowMatrix(SQLModel):
+    match_id: int
+    archer_ids: List[int]
+    arrows: List[List[int]]  # Every arrow shot in the match, one row per archer
+
+
+class TournamentResults(SQLModel):
+    qualifiers: List[Standing] = []
+    finals: List[Standing] = []
+    arrows: List[MatchArrowMatrix] = []
+
+
 class ArcherWithTournaments(ArcherPublic):
     tournaments: List[TournamentPublic] = []
@@ -0,0 +1,574 @@
+import base64
+import json
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import String, and_, case, literal, literal_column, tuple_, type_coerce
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, func, select
+
+from .constants import MatchFormat, TournamentFormat, TournamentStage
+from .models import (
+    Archer,
+    ArcherMatchLink,
+    ArcherPublic,
+    ArcherTeamLink,
+    ArcherTournamentLink,
+    ArcherWithTournamentData,
+    Match,
+    MatchPublic,
+    Series,
+    SeriesPublic,
+    Team,
+    TeamPublic,
+    Tournament,
+    TournamentPublic,
+)
+
+# Prebuilt read models: the JSON documents of `TournamentWithEverything` and
+# `MatchWithSeries` assembled from a handful of Core queries instead of walking
+# (and lazily loading) the ORM graph. The field lists come from the public
+# models so both representations stay identical.
+ARCHER_FIELDS = list(ArcherPublic.model_fields)
+ARCHER_LINK_FIELDS = [f for f in ArcherWithTournamentData.model_fields if f != "archer"]
+SERIES_FIELDS = list(SeriesPublic.model_fields)
+MATCH_FIELDS = list(MatchPublic.model_fields)
+TEAM_FIELDS = list(TeamPublic.model_fields)
+TOURNAMENT_FIELDS = list(TournamentPublic.model_fields)
+
+# Team members have no places of their own, `ArcherWithTournamentData` defaults
+TEAM_MEMBER_DEFAULTS = {
+    name: field.default
+    for name, field in ArcherWithTournamentData.model_fields.items()
+    if name not in ("archer", "number")
+}
+
+
+# Relationships of each document, and the fields that can be selected on them
+TOURNAMENT_RELATIONS = {
+    "": TOURNAMENT_FIELDS,
+    "matches": MATCH_FIELDS,
+    "matches.series": SERIES_FIELDS,
+    "matches.archers": ARCHER_FIELDS,
+    "teams": TEAM_FIELDS,
+    "teams.archers": [],
+    "archers": ARCHER_LINK_FIELDS,
+}
+MATCH_RELATIONS = {
+    "": MATCH_FIELDS,
+    "series": SERIES_FIELDS,
+    "archers": ARCHER_FIELDS,
+}
+
+
+class Shape:
+    """
+    The part of a document requested with `?fields=` and `?include=`.
+
+    `include` lists relationship paths (`matches.series,teams`), including a
+    path includes its parents, and omitting the parameter includes everything.
+    `fields` lists the fields to keep, prefixed with their relationship path
+    (`name,matches.finished`); relationships without any listed field keep all
+    of them, and ids are always kept.
+
+    :raise ValueError: When a relationship or field does not exist.
+    """
+
+    def __init__(self, relations: Dict[str, List[str]], fields: str = None, include: str = None):
+        self.relations = relations
+
+        if include is None:
+            self.include = set(relations) - {""}
+        else:
+            self.include = set()
+            for path in filter(None, (path.strip() for path in include.split(","))):
+                if path not in relations or not path:
+                    raise ValueError(f"Unknown relationship: {path}")
+                parts = path.split(".")
+                self.include.update(".".join(parts[:i]) for i in range(1, len(parts) + 1))
+
+        self.fields = {}
+        for name in filter(None, (name.strip() for name in (fields or "").split(","))):
+            path, _, field = name.rpartition(".")
+            if path not in relations or field not in relations[path]:
+                raise ValueError(f"Unknown field: {name}")
+            self.fields.setdefault(path, {"id"}).add(field)
+
+    def includes(self, path: str) -> bool:
+        return path in self.include
+
+    def complete(self) -> bool:
+        """
+        Whether the whole document is requested, every field and relationship.
+        """
+        return not self.fields and self.include == set(self.relations) - {""}
+
+    def columns(self, path: str) -> List[str]:
+        requested = self.fields.get(path)
+        if requested is None:
+            return self.relations[path]
+        return [field for field in self.relations[path] if field in requested]
+
+
+def join_path(prefix: str, path: str) -> str:
+    return f"{prefix}.{path}" if prefix else path
+
+
+def columns(model, fields: List[str]):
+    return [model.__table__.c[field] for field in fields]
+
+
+def insertion_order(model):
+    """
+    Link tables have composite keys, ordering by rowid keeps the order in which
+    participants were added, like the relationship lazy loads do.
+    """
+    return literal_column(f"{model.__tablename__}.rowid")
+
+
+def archers_from_row(row, offset: int) -> dict:
+    return dict(zip(ARCHER_FIELDS, row[offset : offset + len(ARCHER_FIELDS)]))
+
+
+def load_matches_with_series(
+    session: Session, match_filter, shape: Shape = None, prefix: str = ""
+) -> Dict[int, List[dict]]:
+    """
+    Loads every match selected by `match_filter` with its series and archers,
+    or the part of them requested by `shape` (`prefix` is the path of the
+    matches in the shape).
+
+    :return: The matches grouped by tournament id, in id order.
+    """
+    shape = shape or Shape(MATCH_RELATIONS)
+    match_ids = select(Match.id).where(match_filter)
+
+    series_path = join_path(prefix, "series")
+    series_fields = shape.columns(series_path)
+    series_by_match = defaultdict(list)
+    if shape.includes(series_path):
+        for row in session.exec(
+            select(
+                Series.match_id,
+                *columns(Series, series_fields),
+                *columns(Archer, ARCHER_FIELDS),
+            )
+            .join(Archer, Archer.id == Series.archer_id)
+            .where(Series.match_id.in_(match_ids))
+            .order_by(Series.id)
+        ):
+            series = dict(zip(series_fields, row[1:]))
+            series["archer"] = archers_from_row(row, 1 + len(series_fields))
+            series_by_match[row[0]].append(series)
+
+    archers_path = join_path(prefix, "archers")
+    archer_fields = shape.columns(archers_path)
+    archers_by_match = defaultdict(list)
+    if shape.includes(archers_path):
+        for row in session.exec(
+            select(ArcherMatchLink.match_id, *columns(Archer, archer_fields))
+            .join(Archer, Archer.id == ArcherMatchLink.archer_id)
+            .where(ArcherMatchLink.match_id.in_(match_ids))
+            .order_by(ArcherMatchLink.match_id, insertion_order(ArcherMatchLink))
+        ):
+            archers_by_match[row[0]].append(dict(zip(archer_fields, row[1:])))
+
+    match_fields = shape.columns(prefix)
+    matches = defaultdict(list)
+    for row in session.exec(
+        select(Match.tournament_id, *columns(Match, match_fields))
+        .where(match_filter)
+        .order_by(Match.id)
+    ):
+        match = dict(zip(match_fields, row[1:]))
+        if shape.includes(series_path):
+            match["series"] = series_by_match[match["id"]]
+        if shape.includes(archers_path):
+            match["archers"] = archers_by_match[match["id"]]
+        matches[row[0]].append(match)
+
+    return matches
+
+
+def load_teams_with_archers(
+    session: Session, team_filter, shape: Shape = None
+) -> Dict[int, List[dict]]:
+    """
+    Loads every team selected by `team_filter` with its archers.
+
+    :return: The teams grouped by tournament id, in id order.
+    """
+    shape = shape or Shape(TOURNAMENT_RELATIONS)
+    team_ids = select(Team.id).where(team_filter)
+
+    members_by_team = defaultdict(list)
+    if shape.includes("teams.archers"):
+        for row in session.exec(
+            select(ArcherTeamLink.team_id, ArcherTeamLink.number, *columns(Archer, ARCHER_FIELDS))
+            .join(Archer, Archer.id == ArcherTeamLink.archer_id)
+            .where(ArcherTeamLink.team_id.in_(team_ids))
+            .order_by(ArcherTeamLink.team_id, insertion_order(ArcherTeamLink))
+        ):
+            members_by_team[row[0]].append(
+                {"archer": archers_from_row(row, 2), "number": row[1], **TEAM_MEMBER_DEFAULTS}
+            )
+
+    team_fields = shape.columns("teams")
+    teams = defaultdict(list)
+    for row in session.exec(
+        select(Team.tournament_id, *columns(Team, team_fields))
+        .where(team_filter)
+        .order_by(Team.id)
+    ):
+        team = dict(zip(team_fields, row[1:]))
+        if shape.includes("teams.archers"):
+            team["archers"] = members_by_team[team["id"]]
+        teams[row[0]].append(team)
+
+    return teams
+
+
+def matches_with_series(
+    session: Session, match_ids: List[int], shape: Shape = None
+) -> List[dict]:
+    """
+    Returns the `MatchWithSeries` documents of the given matches, in id order.
+    """
+    grouped = load_matches_with_series(session, Match.id.in_(match_ids), shape)
+    return sorted(
+        (match for matches in grouped.values() for match in matches),
+        key=lambda match: match["id"],
+    )
+
+
+def encode_cursor(created_at: str, id: int) -> str:
+    raw = json.dumps([created_at, id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """
+    :raise ValueError: When the cursor was not made by `encode_cursor`.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, id = json.loads(raw)
+        return str(created_at), int(id)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def tournament_matches_page(
+    session: Session,
+    tournament_id: int,
+    filters: list,
+    limit: int,
+    cursor: str = None,
+    shape: Shape = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Returns one page of the matches of a tournament in creation order, and
+    the cursor of the next page (None on the last one).
+
+    :raise ValueError: When the cursor is invalid.
+    """
+    # Compared as stored: server and client generated timestamps are not
+    # formatted the same way, converting them would break the ordering
+    created_at = type_coerce(Match.created_at, String)
+
+    stmt = select(Match.id, created_at.label("created_at")).where(
+        Match.tournament_id == tournament_id, *filters
+    )
+    if cursor is not None:
+        after_created_at, after_id = decode_cursor(cursor)
+        stmt = stmt.where(
+            tuple_(created_at, Match.id)
+            > tuple_(literal(after_created_at, String), literal(after_id))
+        )
+    rows = session.exec(stmt.order_by(created_at, Match.id).limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    matches = {
+        match["id"]: match
+        for match in matches_with_series(session, [row.id for row in rows], shape)
+    }
+    return [matches[row.id] for row in rows], next_cursor
+
+
+def tournaments_with_everything(
+    session: Session, tournament_ids: List[int], shape: Shape = None
+) -> List[dict]:
+    """
+    Returns the `TournamentWithEverything` documents of the given tournaments,
+    in id order. Only the relationships included in `shape` are queried.
+    """
+    if not tournament_ids:
+        return []
+    shape = shape or Shape(TOURNAMENT_RELATIONS)
+
+    archer_link_fields = shape.columns("archers")
+    archers_by_tournament = defaultdict(list)
+    if shape.includes("archers"):
+        for row in session.exec(
+            select(
+                ArcherTournamentLink.tournament_id,
+                *columns(ArcherTournamentLink, archer_link_fields),
+                *columns(Archer, ARCHER_FIELDS),
+            )
+            .join(Archer, Archer.id == ArcherTournamentLink.archer_id)
+            .where(ArcherTournamentLink.tournament_id.in_(tournament_ids))
+            .order_by(
+                ArcherTournamentLink.tournament_id, insertion_order(ArcherTournamentLink)
+            )
+        ):
+            link = {"archer": archers_from_row(row, 1 + len(archer_link_fields))}
+            link.update(zip(archer_link_fields, row[1:]))
+            archers_by_tournament[row[0]].append(link)
+
+    teams_by_tournament = {}
+    if shape.includes("teams"):
+        teams_by_tournament = load_teams_with_archers(
+            session, Team.tournament_id.in_(tournament_ids), shape
+        )
+
+    matches_by_tournament = {}
+    if shape.includes("matches"):
+        matches_by_tournament = load_matches_with_series(
+            session, Match.tournament_id.in_(tournament_ids), shape, "matches"
+        )
+
+    tournament_fields = shape.columns("")
+    tournaments = []
+    for row in session.exec(
+        select(*columns(Tournament, tournament_fields))
+        .where(Tournament.id.in_(tournament_ids))
+        .order_by(Tournament.id)
+    ):
+        tournament = dict(zip(tournament_fields, row))
+        if shape.includes("matches"):
+            tournament["matches"] = matches_by_tournament.get(tournament["id"], [])
+        if shape.includes("teams"):
+            tournament["teams"] = teams_by_tournament.get(tournament["id"], [])
+        if shape.includes("archers"):
+            tournament["archers"] = archers_by_tournament[tournament["id"]]
+        tournaments.append(tournament)
+
+    return tournaments
+
+
+def archer_stage_scores(
+    tournament_id: int,
+    stage: TournamentStage,
+    formats: List[MatchFormat],
+    enkin_place: bool = False,
+):
+    """
+    Subquery of the hits and arrows shot by every archer in the matches of a
+    stage, summed from the series counters, and optionally the place drawn in
+    its last Enkin match (the first arrow), which decides a repeated
+    tie-break. Without the place, the series side is read from the
+    `ix_series_match_counters` index alone.
+    """
+    counted = Match.format.in_(formats)
+    enkin_series = aliased(Series)
+    enkin_match = aliased(Match)
+    place = (
+        select(func.json_extract(enkin_series.arrows_raw, "$[0]"))
+        .join(enkin_match, enkin_match.id == enkin_series.match_id)
+        .where(
+            enkin_series.archer_id == Series.archer_id,
+            enkin_match.tournament_id == tournament_id,
+            enkin_match.stage == stage,
+            enkin_match.format == MatchFormat.ENKIN,
+        )
+        .order_by(enkin_series.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    return (
+        select(
+            Series.archer_id,
+            func.sum(case((counted, Series.hits), else_=0)).label("hits"),
+            func.sum(case((counted, Series.arrows_shot), else_=0)).label("arrows"),
+            (place if enkin_place else literal(None)).label("enkin_place"),
+        )
+        .join(Match, Match.id == Series.match_id)
+        .where(Match.tournament_id == tournament_id, Match.stage == stage)
+        .group_by(Series.archer_id)
+        .subquery()
+    )
+
+
+def stage_standings(session: Session, tournament: dict) -> List[dict]:
+    """
+    Hits and arrows shot by every participant in the standard matches of the
+    current stage (tie breaks count with the stage they decide), best first.
+    """
+    stage = tournament["current_stage"]
+    if stage == TournamentStage.QUALIFIERS_TIE_BREAK:
+        stage = TournamentStage.QUALIFIERS
+    elif stage == TournamentStage.FINALS_TIE_BREAK:
+        stage = TournamentStage.FINALS
+
+    scores = archer_stage_scores(tournament["id"], stage, [MatchFormat.STANDARD])
+    hits = func.coalesce(func.sum(scores.c.hits), 0)
+    arrows = func.coalesce(func.sum(scores.c.arrows), 0)
+
+    if tournament["format"] == TournamentFormat.TEAM:
+        query = (
+            select(Team.id, Team.name, Team.number, hits, arrows)
+            .join(ArcherTeamLink, ArcherTeamLink.team_id == Team.id)
+            .outerjoin(scores, scores.c.archer_id == ArcherTeamLink.archer_id)
+            .where(Team.tournament_id == tournament["id"])
+            .group_by(Team.id)
+            .order_by(hits.desc(), Team.number)
+        )
+    else:
+        query = (
+            select(Archer.id, Archer.name, ArcherTournamentLink.number, hits, arrows)
+            .join(Archer, Archer.id == ArcherTournamentLink.archer_id)
+            .outerjoin(scores, scores.c.archer_id == ArcherTournamentLink.archer_id)
+            .where(ArcherTournamentLink.tournament_id == tournament["id"])
+            .group_by(Archer.id)
+            .order_by(hits.desc(), ArcherTournamentLink.number)
+        )
+
+    return [
+        dict(zip(("id", "name", "number", "hits", "arrows"), row))
+        for row in session.exec(query)
+    ]
+
+
+def stage_results(session: Session, tournament: Tournament):
+    """
+    Every participant of a tournament (archers, or teams) with its places,
+    tie-break flags, and the hits and Enkin place of the current stage, from
+    one aggregate over the series of the stage. Sorted by hits, best first,
+    then by participant number. Enkin places are not counted as hits.
+    """
+    scores = archer_stage_scores(
+        tournament.id,
+        tournament.current_stage,
+        [MatchFormat.STANDARD, MatchFormat.IZUME],
+        enkin_place=True,
+    )
+    hits = func.coalesce(func.sum(scores.c.hits), 0)
+
+    is_team = tournament.format == TournamentFormat.TEAM
+    participant = Team if is_team else ArcherTournamentLink
+    participant_id = Team.id if is_team else ArcherTournamentLink.archer_id
+    link = ArcherTeamLink if is_team else ArcherTournamentLink
+
+    query = select(
+        participant_id.label("id"),
+        participant.number,
+        participant.qualifiers_place,
+        participant.finals_place,
+        participant.tie_break_qualifiers,
+        participant.tie_break_finals,
+        hits.label("hits"),
+        func.min(scores.c.enkin_place).label("enkin_place"),
+    )
+    if is_team:
+        query = query.outerjoin(ArcherTeamLink, ArcherTeamLink.team_id == Team.id)
+    query = (
+        query.outerjoin(scores, scores.c.archer_id == link.archer_id)
+        .where(participant.tournament_id == tournament.id)
+        .group_by(participant_id)
+        .order_by(hits.desc(), participant.number)
+    )
+    return session.exec(query).all()
+
+
+def live_summary(session: Session, tournament_id: int) -> Optional[dict]:
+    """
+    Returns the `TournamentLiveSummary` document of a tournament: only its
+    unfinished matches, the rosters of the archers shooting them and the
+    standings of the current stage. The matches, their archers, numbers and
+    series come from a single query on the (tournament_id, finished) index.
+    """
+    row = session.exec(
+        select(*columns(Tournament, TOURNAMENT_FIELDS)).where(
+            Tournament.id == tournament_id
+        )
+    ).first()
+    if row is None:
+        return None
+
+    tournament = dict(zip(TOURNAMENT_FIELDS, row))
+    is_team = tournament["format"] == TournamentFormat.TEAM
+
+    matches = {}
+    series_ids = set()
+    shooting = set()
+    archers = {}
+    for row in session.exec(
+        select(
+            *columns(Match, MATCH_FIELDS),
+            *columns(Archer, ARCHER_FIELDS),
+            *columns(Series, SERIES_FIELDS),
+            *columns(ArcherTournamentLink, ARCHER_LINK_FIELDS),
+        )
+        .join(ArcherMatchLink, ArcherMatchLink.match_id == Match.id)
+        .join(Archer, Archer.id == ArcherMatchLink.archer_id)
+        .outerjoin(
+            Series,
+            and_(Series.match_id == Match.id, Series.archer_id == Archer.id),
+        )
+        .outerjoin(
+            ArcherTournamentLink,
+            and_(
+                ArcherTournamentLink.tournament_id == tournament_id,
+                ArcherTournamentLink.archer_id == Archer.id,
+            ),
+        )
+        .where(Match.tournament_id == tournament_id, Match.finished == False)
+        .order_by(Match.id, insertion_order(ArcherMatchLink), Series.id)
+    ):
+        offset = len(MATCH_FIELDS)
+        match = matches.get(row[0])
+        if match is None:
+            match = matches[row[0]] = dict(zip(MATCH_FIELDS, row[:offset]))
+            match["series"] = []
+            match["archers"] = []
+
+        archer = archers_from_row(row, offset)
+        if archer not in match["archers"]:
+            match["archers"].append(archer)
+        shooting.add(archer["id"])
+        offset += len(ARCHER_FIELDS)
+
+        series = dict(zip(SERIES_FIELDS, row[offset : offset + len(SERIES_FIELDS)]))
+        if series["id"] is not None and series["id"] not in series_ids:
+            series_ids.add(series["id"])
+            series["archer"] = archer
+            match["series"].append(series)
+        offset += len(SERIES_FIELDS)
+
+        if not is_team and archer["id"] not in archers:
+            link = {"archer": archer}
+            link.update(zip(ARCHER_LINK_FIELDS, row[offset:]))
+            archers[archer["id"]] = link
+
+    for match in matches.values():
+        match["series"].sort(key=lambda series: series["id"])
+
+    teams = []
+    if is_team and shooting:
+        shooting_teams = select(ArcherTeamLink.team_id).where(
+            ArcherTeamLink.archer_id.in_(shooting)
+        )
+        teams = load_teams_with_archers(
+            session,
+            and_(Team.tournament_id == tournament_id, Team.id.in_(shooting_teams)),
+        )[tournament_id]
+
+    tournament["matches"] = list(matches.values())
+    tournament["archers"] = list(archers.values())
+    tournament["teams"] = teams
+    tournament["standings"] = stage_standings(session, tournament)
+    return tournament
@@ -3,6 +3,8 @@ from sqlmodel import Session, func, select
 
 from ..api_models import ArcherInput, PaginatedArcher, ArcherSearchInput
 from ..models.models import Archer
+from ..utils.live_store import live_store
+from ..utils.result_snapshots import result_snapshots
 from ..utils.sqlite import get_session
 
 router = APIRouter()
@@ -62,6 +64,8 @@ async def update_archer(
     archer.name = data.name
     archer.position = data.position
     session.commit()
+    live_store.update_archer(session, archer_id)
+    result_snapshots.update_archer(session, archer_id)
     return archer
 
 
@@ -73,4 +77,6 @@ async def delete_archer(archer_id: int, session: Session = Depends(get_session))
 
     session.delete(archer)
     session.commit()
+    live_store.update_archer(session, archer_id)
+    result_snapshots.update_archer(session, archer_id)
     return {"message": "Archer deleted"}
@@ -0,0 +1,60 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlmodel import Session
+
+from ..models.models import Tournament, TournamentEventPublic
+from ..utils.event_log import audit_tournament, get_events, rebuild_state, take_snapshot
+from ..utils.sqlite import get_session
+
+router = APIRouter()
+
+
+def get_tournament_or_404(session: Session, tournament_id: int) -> Tournament:
+    tournament = session.get(Tournament, tournament_id)
+    if not tournament:
+        raise HTTPException(status_code=404, detail="Tournament not found")
+    return tournament
+
+
+@router.get(
+    "/tournaments/{tournament_id}/event-log",
+    response_model=list[TournamentEventPublic],
+)
+async def get_tournament_event_log(
+    tournament_id: int,
+    after: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    session: Session = Depends(get_session),
+):
+    get_tournament_or_404(session, tournament_id)
+    return get_events(session, tournament_id, after=after, limit=limit)
+
+
+@router.get("/tournaments/{tournament_id}/state")
+async def get_tournament_state(
+    tournament_id: int, session: Session = Depends(get_session)
+):
+    get_tournament_or_404(session, tournament_id)
+    state, event_id = rebuild_state(session, tournament_id)
+    return {"event_id": event_id, "state": state}
+
+
+@router.get("/tournaments/{tournament_id}/audit")
+async def audit_tournament_log(
+    tournament_id: int, session: Session = Depends(get_session)
+):
+    get_tournament_or_404(session, tournament_id)
+    _, event_id = rebuild_state(session, tournament_id)
+    return {
+        "event_id": event_id,
+        "differences": audit_tournament(session, tournament_id),
+    }
+
+
+@router.post("/tournaments/{tournament_id}/snapshots")
+async def post_tournament_snapshot(
+    tournament_id: int, session: Session = Depends(get_session)
+):
+    get_tournament_or_404(session, tournament_id)
+    snapshot = take_snapshot(session, tournament_id)
+    session.commit()
+    return {"tournament_id": tournament_id, "event_id": snapshot.event_id}
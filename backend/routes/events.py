@@ -0,0 +1,54 @@
+from fastapi import APIRouter, Depends, Header, Request
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+
+from ..utils.sqlite import get_session
+from ..utils.sse import parse_event_id
+from ..utils.ws_manager import ALL_TOPICS, tournament_topic
+from ..utils.ws_manager_insance import ws_instance
+from .event_log import get_tournament_or_404
+
+router = APIRouter()
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def event_stream(request: Request, topic: str, last_event_id: str = None):
+    epoch, last_seq = parse_event_id(last_event_id)
+    subscription = ws_instance.subscribe(topic, epoch, last_seq)
+
+    async def stream():
+        try:
+            while not await request.is_disconnected():
+                chunk = await subscription.next()
+                if chunk is None:
+                    # Too far behind, the browser reconnects and resumes
+                    break
+                yield chunk
+        finally:
+            ws_instance.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(), media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+
+@router.get("/events")
+async def get_events_stream(
+    request: Request, last_event_id: str = Header(None)
+):
+    return event_stream(request, ALL_TOPICS, last_event_id)
+
+
+@router.get("/tournaments/{tournament_id}/events")
+async def get_tournament_events_stream(
+    tournament_id: int,
+    request: Request,
+    last_event_id: str = Header(None),
+    session: Session = Depends(get_session),
+):
+    """
+    The events of a tournament, and the global ones (e.g. `job updated`).
+    """
+    get_tournament_or_404(session, tournament_id)
+    return event_stream(request, tournament_topic(tournament_id), last_event_id)
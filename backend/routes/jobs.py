@@ -0,0 +1,71 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import ValidationError
+from sqlmodel import Session, select
+
+from ..api_models import JobInput
+from ..models.models import Job, JobPublic
+from ..utils.jobs import ACTIVE_STATUSES, JOB_KINDS, job_runner
+from ..utils.sqlite import get_session
+
+router = APIRouter()
+
+
+def get_job_or_404(session: Session, job_id: int) -> Job:
+    job = session.get(Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/jobs", response_model=JobPublic, status_code=202)
+async def post_job(data: JobInput, session: Session = Depends(get_session)):
+    """
+    Queues a job, whose progress and result are then read from
+    `GET /jobs/{job_id}` or followed through the `job updated` events.
+    """
+    kind = JOB_KINDS.get(data.kind)
+    if kind is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown job kind, expected one of: {', '.join(JOB_KINDS)}",
+        )
+    try:
+        params = kind.params.model_validate(data.params)
+    except ValidationError as error:
+        raise HTTPException(status_code=422, detail=error.errors(include_url=False))
+
+    return await job_runner.submit(session, data.kind, params)
+
+
+@router.get("/jobs", response_model=List[JobPublic])
+async def get_jobs(
+    kind: str = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    session: Session = Depends(get_session),
+):
+    """
+    Recent jobs, newest first.
+    """
+    stmt = select(Job).order_by(Job.id.desc()).limit(limit)
+    if kind is not None:
+        stmt = stmt.where(Job.kind == kind)
+    return session.exec(stmt).all()
+
+
+@router.get("/jobs/{job_id}", response_model=JobPublic)
+async def get_job(job_id: int, session: Session = Depends(get_session)):
+    return get_job_or_404(session, job_id)
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=JobPublic)
+async def cancel_job(job_id: int, session: Session = Depends(get_session)):
+    """
+    Cancels a queued job at once, and a running one at its next progress
+    report: its status stays `running` until then, with `cancel_requested`.
+    """
+    job = get_job_or_404(session, job_id)
+    if job.status not in ACTIVE_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Job is already {job.status.value}")
+    return await job_runner.cancel(session, job)
@@ -2,12 +2,21 @@ import json
 from datetime import datetime
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlmodel import Session, select
-
-from ..api_models import MatchArrowInput, MatchEnkinInput
-from ..models.models import Archer, Match, MatchWithSeries, Series
-from ..models.constants import MatchArrows
-from ..utils.sqlite import get_session
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, func, select
+
+from ..api_models import MatchArrowInput, MatchEnkinInput, ScorerSyncInput, ScorerSyncResult
+from ..models.models import Archer, Match, MatchWithSeries, ScorerReceipt, Series
+from ..models.constants import TournamentEventKind
+from ..models.read_models import MATCH_RELATIONS, Shape, matches_with_series
+from ..utils.arrow_journal import arrow_journal, flush_arrow_journal
+from ..utils.event_log import record_event
+from ..utils.live_store import live_store
+from ..utils.responses import json_response, raw_json_response, sparse_fieldsets
+from ..utils.result_snapshots import result_snapshots
+from ..utils.scoring import append_arrow
+from ..utils.sqlite import get_session, shard_router, tournament_session
+from ..utils.ws_manager import tournament_topic
 from ..utils.ws_manager_insance import ws_instance
 
 router = APIRouter()
@@ -15,6 +24,11 @@ router = APIRouter()
 
 @router.post("/match")
 async def post_match(session: Session = Depends(get_session)):
+    if shard_router is not None:
+        # A match is stored in the shard of its tournament
+        raise HTTPException(
+            status_code=400, detail="Matches are created through their tournament"
+        )
     match = Match()
     session.add(match)
     session.commit()
@@ -23,22 +37,41 @@ async def post_match(session: Session = Depends(get_session)):
 
 
 @router.get("/matches/{match_id}", response_model=MatchWithSeries)
-async def get_match(match_id: int, session: Session = Depends(get_session)):
-    match = session.get(Match, match_id)
-    if not match:
+async def get_match(
+    match_id: int,
+    shape: Shape = Depends(sparse_fieldsets(MATCH_RELATIONS)),
+    session: Session = Depends(get_session),
+):
+    match = live_store.match(match_id, shape)
+    if match is not None:
+        return json_response(match)
+    body = result_snapshots.match(match_id, shape)
+    if body is not None:
+        return raw_json_response(body)
+
+    matches = matches_with_series(session, [match_id], shape)
+    if not matches:
         raise HTTPException(status_code=404, detail="Match not found")
 
-    return match
+    return json_response(matches[0])
 
 
 @router.delete("/matches/{match_id}", status_code=204)
 async def delete_match(match_id: int, session: Session = Depends(get_session)):
+    # Journaled arrows must be in the tables before their series are used
+    await flush_arrow_journal()
+
     match = session.get(Match, match_id)
     if not match:
         raise HTTPException(status_code=404, detail="Match not found")
 
     session.delete(match)
+    session.flush()
+    record_event(
+        session, TournamentEventKind.MATCH_DELETED, match.tournament_id, match_id=match_id
+    )
     session.commit()
+    live_store.update_matches(session, [match_id])
 
 
 @router.get("/matches/{match_id}/archers/{archer_id}/arrows/{arrow_id}")
@@ -48,6 +81,8 @@ async def get_arrow(
     arrow_id: int,
     session: Session = Depends(get_session),
 ):
+    await flush_arrow_journal()
+
     match = session.get(Match, match_id)
     if not match:
         raise HTTPException(status_code=404, detail="Match not found")
@@ -81,6 +116,14 @@ async def add_arrow_to_match(
     data: MatchArrowInput,
     session: Session = Depends(get_session),
 ):
+    """
+    Appends an arrow to the last series of the archer, and returns the series.
+
+    In write-behind mode (`SEISHA_WRITE_BEHIND=1`) the answer is a 202 with
+    `journal_id`, `match_id` and `archer_id` instead: the arrow is durable in
+    the journal, and written to the series by the next group commit, which
+    sends its `new arrow` broadcast.
+    """
     match = session.get(Match, match_id)
     if not match:
         raise HTTPException(status_code=404, detail="Match not found")
@@ -89,39 +132,138 @@ async def add_arrow_to_match(
     if not archer:
         raise HTTPException(status_code=404, detail="Archer not found")
 
-    series = session.exec(
-        select(Series)
-        .where(
-            Series.archer_id == archer_id,
-            Series.match_id == match_id,
+    if arrow_journal is not None:
+        # Write-behind: durable in the journal, written by the next group commit
+        # Broadcast by the group commit that writes it
+        journal_id = await arrow_journal.append(match, archer_id, data.arrow)
+        return json_response(
+            {"journal_id": journal_id, "match_id": match_id, "archer_id": archer_id},
+            status_code=202,
         )
-        .order_by(Series.id.desc())
-    ).first()
-
-    new_arrow = [data.arrow]
-    arrows_per_match = MatchArrows[match.format.name]
-
-    if series and len(series.arrows) < arrows_per_match.value:
-        new_arrows = series.arrows + new_arrow
-        series.arrows_raw = json.dumps(new_arrows)
-    else:
-        series = Series(archer_id=archer_id, match_id=match_id)
-        series.arrows = new_arrow
 
-    await ws_instance.broadcast("new arrow")
+    series = append_arrow(session, match, archer_id, data.arrow)
 
-    session.add(series)
     session.commit()
+    live_store.update_matches(session, [match_id])
     session.refresh(series)
     session.refresh(match)
 
+    await ws_instance.broadcast(
+        "new arrow",
+        {"tournament_id": match.tournament_id, "match_id": match_id, "archer_id": archer_id},
+        topic=tournament_topic(match.tournament_id),
+    )
+
     return series
 
+@router.post("/scorers/sync", response_model=ScorerSyncResult)
+async def sync_scorer_arrows(
+    data: ScorerSyncInput,
+    session: Session = Depends(get_session),
+):
+    """
+    Applies a batch of arrows recorded offline by a scorer client, in sequence
+    order and in one transaction. Arrows whose sequence number was already
+    applied for the client are skipped, so a batch can be retried safely.
+    """
+    await flush_arrow_journal()
+
+    if shard_router is None:
+        return await apply_scorer_batch(session, data)
+
+    tournament_ids = {shard_router.locate("match", arrow.match_id) for arrow in data.arrows}
+    tournament_ids.discard(None)
+    if len(tournament_ids) > 1:
+        raise HTTPException(
+            status_code=400, detail="A batch can only hold arrows of one tournament"
+        )
+    if not tournament_ids:
+        # Unknown matches, rejected on the catalog
+        return await apply_scorer_batch(session, data)
+    with tournament_session(session, tournament_ids.pop()) as shard_session:
+        return await apply_scorer_batch(shard_session, data)
+
+
+async def apply_scorer_batch(session: Session, data: ScorerSyncInput) -> ScorerSyncResult:
+    arrows = sorted({arrow.seq: arrow for arrow in data.arrows}.values(), key=lambda a: a.seq)
+
+    duplicates = set(
+        session.exec(
+            select(ScorerReceipt.seq).where(
+                ScorerReceipt.client_id == data.client_id,
+                ScorerReceipt.seq.in_([arrow.seq for arrow in arrows]),
+            )
+        ).all()
+    )
+    pending = [arrow for arrow in arrows if arrow.seq not in duplicates]
+
+    matches = {
+        match.id: match
+        for match in session.exec(
+            select(Match).where(Match.id.in_({arrow.match_id for arrow in pending}))
+        )
+    }
+    archer_ids = set(
+        session.exec(
+            select(Archer.id).where(Archer.id.in_({arrow.archer_id for arrow in pending}))
+        ).all()
+    )
+    for arrow in pending:
+        if arrow.match_id not in matches:
+            raise HTTPException(status_code=404, detail=f"Match not found (seq {arrow.seq})")
+        if arrow.archer_id not in archer_ids:
+            raise HTTPException(status_code=404, detail=f"Archer not found (seq {arrow.seq})")
+
+    updated = {}
+    try:
+        for arrow in pending:
+            match = matches[arrow.match_id]
+            series = append_arrow(session, match, arrow.archer_id, arrow.arrow)
+            session.add(
+                ScorerReceipt(
+                    client_id=data.client_id,
+                    seq=arrow.seq,
+                    match_id=arrow.match_id,
+                    archer_id=arrow.archer_id,
+                    series_id=series.id,
+                    arrow=arrow.arrow,
+                )
+            )
+            updated[(match.tournament_id, match.id, arrow.archer_id)] = True
+        session.commit()
+    except IntegrityError:
+        # The same batch is being applied by a concurrent retry, whose receipts
+        # conflict on the next autoflush or on the commit
+        session.rollback()
+        raise HTTPException(status_code=409, detail="Upload in progress, retry later")
+    live_store.update_matches(session, {match_id for _, match_id, _ in updated})
+
+    for tournament_id, match_id, archer_id in updated:
+        await ws_instance.broadcast(
+            "new arrow",
+            {"tournament_id": tournament_id, "match_id": match_id, "archer_id": archer_id},
+            topic=tournament_topic(tournament_id),
+        )
+
+    last_seq = session.exec(
+        select(func.max(ScorerReceipt.seq)).where(ScorerReceipt.client_id == data.client_id)
+    ).one()
+
+    return ScorerSyncResult(
+        client_id=data.client_id,
+        applied=[arrow.seq for arrow in pending],
+        duplicates=sorted(duplicates),
+        last_seq=last_seq,
+    )
+
+
 @router.put("/matches/{match_id}/finish")
 async def finish_match(
     match_id: int,
     session: Session = Depends(get_session),
 ):
+    await flush_arrow_journal()
+
     match = session.get(Match, match_id)
     if not match:
         raise HTTPException(status_code=404, detail="Match not found")
@@ -134,10 +276,19 @@ async def finish_match(
     
     match.finished = True
     session.add(match)
+    session.flush()
+    record_event(
+        session, TournamentEventKind.MATCH_FINISHED, match.tournament_id, match_id=match_id
+    )
     session.commit()
+    live_store.update_matches(session, [match_id])
     session.refresh(match)
 
-    await ws_instance.broadcast("match finished")
+    await ws_instance.broadcast(
+        "match finished",
+        {"tournament_id": match.tournament_id, "match_id": match_id},
+        topic=tournament_topic(match.tournament_id),
+    )
 
     return match
 
@@ -150,6 +301,8 @@ async def update_arrow(
     data: dict,
     session: Session = Depends(get_session),
 ):
+    await flush_arrow_journal()
+
     match = session.get(Match, match_id)
     if not match:
         raise HTTPException(status_code=404, detail="Match not found")
@@ -177,13 +330,29 @@ async def update_arrow(
     arrows[arrow_id] = data["arrow"]
     series.arrows_raw = json.dumps(arrows)
 
-    await ws_instance.broadcast("arrow update")
-
     session.add(series)
+    session.flush()
+    record_event(
+        session,
+        TournamentEventKind.ARROW_CORRECTION,
+        match.tournament_id,
+        match_id=match_id,
+        archer_id=archer_id,
+        series_id=series.id,
+        index=arrow_id,
+        arrow=data["arrow"],
+    )
     session.commit()
+    live_store.update_matches(session, [match_id])
     session.refresh(series)
     session.refresh(match)
 
+    await ws_instance.broadcast(
+        "arrow update",
+        {"tournament_id": match.tournament_id, "match_id": match_id, "archer_id": archer_id},
+        topic=tournament_topic(match.tournament_id),
+    )
+
     return series
 
 @router.post("/matches/{match_id}/archers/{archer_id}/enkin-place")
@@ -193,6 +362,8 @@ async def set_enkin_place(
     data: MatchEnkinInput,
     session: Session = Depends(get_session),
 ):
+    await flush_arrow_journal()
+
     match = session.get(Match, match_id)
     if not match:
         raise HTTPException(status_code=404, detail="Match not found")
@@ -215,10 +386,25 @@ async def set_enkin_place(
 
     series.arrows_raw = json.dumps([data.place])
 
-    await ws_instance.broadcast("arrow update")
-
     session.add(series)
+    session.flush()
+    record_event(
+        session,
+        TournamentEventKind.ENKIN_PLACE,
+        match.tournament_id,
+        match_id=match_id,
+        archer_id=archer_id,
+        series_id=series.id,
+        place=data.place,
+    )
     session.commit()
+    live_store.update_matches(session, [match_id])
     session.refresh(series)
 
+    await ws_instance.broadcast(
+        "arrow update",
+        {"tournament_id": match.tournament_id, "match_id": match_id, "archer_id": archer_id},
+        topic=tournament_topic(match.tournament_id),
+    )
+
     return series
\ No newline at end of file
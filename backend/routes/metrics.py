@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Query
+from fastapi.responses import PlainTextResponse
+
+from ..utils.metrics import registry, snapshot
+from ..utils.slow_queries import slow_query_log
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@router.get("/metrics/snapshot")
+async def get_metrics_snapshot():
+    return snapshot()
+
+
+@router.get("/metrics/slow-queries")
+async def get_slow_queries(limit: int = Query(50, ge=1, le=500)):
+    """
+    Slow statements aggregated per fingerprint, by total time, with their
+    latest query plan. Empty unless `SEISHA_SLOW_QUERY_MS` is set.
+    """
+    return slow_query_log.report(limit)
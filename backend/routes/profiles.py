@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from ..utils.profiling import PROFILE_TOKEN, PROFILING_ENABLED, profile_store
+
+router = APIRouter()
+
+
+def check_access(token: str):
+    # Without a token, sampled profiles are only readable on the server
+    if not PROFILING_ENABLED or not PROFILE_TOKEN:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if token != PROFILE_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid profile token")
+
+
+@router.get("/profiles")
+async def get_profiles(
+    route: str = Query(None, description="Route template, e.g. `/tournaments/{tournament_id}`"),
+    limit: int = Query(50, ge=1, le=500),
+    x_profile: str = Header(None),
+):
+    """
+    Recent request profiles, newest first.
+    """
+    check_access(x_profile)
+    return profile_store.list(route, limit)
+
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str, x_profile: str = Header(None)):
+    """
+    Folded stacks of a profile, the input of flamegraph.pl or speedscope.
+    """
+    check_access(x_profile)
+    folded = profile_store.folded(profile_id)
+    if folded is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(folded)
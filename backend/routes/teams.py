@@ -2,18 +2,32 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select
 
 from ..api_models import TeamInput
-from ..models.models import Archer, Team, TeamWithArchers, ArcherTeamLink
+from ..models.constants import TournamentEventKind
+from ..models.models import Archer, Team, TeamWithArchers, ArcherTeamLink, Tournament
+from ..utils.event_log import record_event
+from ..utils.live_store import live_store
+from ..utils.result_snapshots import result_snapshots
+from ..utils.responses import model_response
 from ..utils.sqlite import get_session
 
 router = APIRouter()
 
 
+def get_editable_team(session: Session, team_id: int) -> Team:
+    team = session.get(Team, team_id)
+    if not team:
+        raise HTTPException(status_code=404, detail="Team not found")
+    if session.get(Tournament, team.tournament_id).purged:
+        raise HTTPException(status_code=400, detail="Tournament is purged")
+    return team
+
+
 @router.get("/teams/{team_id}", response_model=TeamWithArchers)
 async def get_team(team_id: int, session: Session = Depends(get_session)):
     team = session.get(Team, team_id)
     if not team:
         raise HTTPException(status_code=404, detail="Team not found")
-    return team
+    return model_response(TeamWithArchers, team)
 
 
 @router.put("/teams/{team_id}")
@@ -22,12 +36,12 @@ async def update_team(
     data: TeamInput,
     session: Session = Depends(get_session),
 ):
-    team = session.get(Team, team_id)
-    if not team:
-        raise HTTPException(status_code=404, detail="Team not found")
+    team = get_editable_team(session, team_id)
 
     team.name = data.name
     session.commit()
+    live_store.update_tournament(session, team.tournament_id)
+    result_snapshots.update(session, team.tournament_id)
     return team
 
 
@@ -37,6 +51,8 @@ async def add_archer_to_team(
     archer_id: int,
     session: Session = Depends(get_session),
 ):
+    team = get_editable_team(session, team_id)
+
     last_entry = session.exec(
         select(ArcherTeamLink)
         .where(ArcherTeamLink.team_id == team_id)
@@ -50,6 +66,8 @@ async def add_archer_to_team(
     )
     session.add(archer_team_link)
     session.commit()
+    live_store.update_tournament(session, team.tournament_id)
+    result_snapshots.update(session, team.tournament_id)
     return {"message": "Archer added to team"}
 
 
@@ -59,6 +77,7 @@ async def remove_archer_from_team(
     archer_id: int,
     session: Session = Depends(get_session),
 ):
+    team = get_editable_team(session, team_id)
     archer_team_link = session.get(ArcherTeamLink, (archer_id, team_id))
     if not archer_team_link:
         raise HTTPException(status_code=404, detail="Archer not found in team")
@@ -80,6 +99,8 @@ async def remove_archer_from_team(
         session.add(link)
 
     session.commit()
+    live_store.update_tournament(session, team.tournament_id)
+    result_snapshots.update(session, team.tournament_id)
     
     return {"message": "Archer removed from team"}
 
@@ -89,17 +110,16 @@ async def remove_team_from_tournament(
     team_id: int,
     session: Session = Depends(get_session),
 ):
-    team = session.get(Team, team_id)
-    if not team:
-        raise HTTPException(status_code=404, detail="Team not found")
+    team = get_editable_team(session, team_id)
 
     removed_number = team.number
+    tournament_id = team.tournament_id
 
     session.delete(team)
 
     stmt = (
         select(Team).where(
-            Team.tournament_id == team.tournament_id, Team.number > removed_number
+            Team.tournament_id == tournament_id, Team.number > removed_number
         )
     ).order_by(Team.number.asc())
     teams_to_update = session.exec(stmt).all()
@@ -108,5 +128,9 @@ async def remove_team_from_tournament(
         team.number -= 1
         session.add(team)
 
+    session.flush()
+    record_event(session, TournamentEventKind.TEAM_REMOVED, tournament_id, team_id=team_id)
     session.commit()
+    live_store.update_tournament(session, tournament_id)
+    result_snapshots.update(session, tournament_id)
     return {"message": "Team removed"}
@@ -1,9 +1,12 @@
+import os
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlmodel import Session, func, select
 
 from ..api_models import (
+    AdvancingParticipant,
+    CursorPaginatedMatches,
     PaginatedTournaments,
     TeamInput,
     TournamentInput,
@@ -11,6 +14,7 @@ from ..api_models import (
     MatchIzumeParticipantsInput,
 )
 from ..models.constants import (
+    TournamentEventKind,
     TournamentFormat,
     TournamentStage,
     TournamentStatus,
@@ -22,9 +26,31 @@ from ..models.models import (
     Match,
     Team,
     Tournament,
+    TournamentLiveSummary,
+    TournamentResults,
     TournamentWithEverything,
 )
-from ..utils.sqlite import get_session
+from ..models.read_models import (
+    MATCH_RELATIONS,
+    TOURNAMENT_RELATIONS,
+    Shape,
+    live_summary,
+    stage_results,
+    tournament_matches_page,
+    tournaments_with_everything,
+)
+from ..utils.arrow_journal import flush_arrow_journal
+from ..utils.event_log import delete_log, participant_places, record_event
+from ..utils.live_store import live_store
+from ..utils.responses import (
+    json_response,
+    model_response,
+    raw_json_response,
+    sparse_fieldsets,
+)
+from ..utils.result_snapshots import result_snapshots
+from ..utils.sqlite import get_session, sessions_by_tournament, shard_router
+from ..utils.ws_manager import tournament_topic
 from ..utils.ws_manager_insance import ws_instance
 
 router = APIRouter()
@@ -48,38 +74,140 @@ async def get_tournaments_paginated(
 
     total_pages = (total + limit - 1) // limit
 
-    return PaginatedTournaments(
-        count=len(tournaments),
-        total=total,
-        page=page,
-        total_pages=total_pages,
-        limit=limit,
-        data=tournaments,
+    return model_response(
+        PaginatedTournaments,
+        {
+            "count": len(tournaments),
+            "total": total,
+            "page": page,
+            "total_pages": total_pages,
+            "limit": limit,
+            "data": tournaments,
+        },
     )
 
 
 @router.get("/tournaments/live", response_model=list[TournamentWithEverything])
 async def get_live_tournaments(
+    shape: Shape = Depends(sparse_fieldsets(TOURNAMENT_RELATIONS)),
     session: Session = Depends(get_session),
 ):
-    tournaments = session.exec(
-        select(Tournament)
+    tournaments = live_store.live_tournaments(shape)
+    if tournaments is not None:
+        return json_response(tournaments)
+
+    tournament_ids = session.exec(
+        select(Tournament.id)
         .where(Tournament.status == TournamentStatus.LIVE)
         .order_by(Tournament.id.asc())
     ).all()
 
-    return tournaments
+    tournaments = []
+    for shard_session, ids in sessions_by_tournament(session, tournament_ids):
+        tournaments.extend(tournaments_with_everything(shard_session, ids, shape))
+    return json_response(tournaments)
 
 
 @router.get("/tournaments/{tournament_id}", response_model=TournamentWithEverything)
 async def get_tournament_by_id(
+    tournament_id: int,
+    shape: Shape = Depends(sparse_fieldsets(TOURNAMENT_RELATIONS)),
+    session: Session = Depends(get_session),
+):
+    tournament = live_store.tournament(tournament_id, shape)
+    if tournament is not None:
+        return json_response(tournament)
+    body = result_snapshots.tournament(tournament_id, shape)
+    if body is not None:
+        return raw_json_response(body)
+
+    tournaments = tournaments_with_everything(session, [tournament_id], shape)
+    if not tournaments:
+        raise HTTPException(status_code=404, detail="Tournament not found")
+
+    return json_response(tournaments[0])
+
+
+@router.get(
+    "/tournaments/{tournament_id}/matches", response_model=CursorPaginatedMatches
+)
+async def get_tournament_matches(
+    tournament_id: int,
+    stage: TournamentStage = None,
+    finished: bool = None,
+    format: MatchFormat = None,
+    cursor: str = None,
+    limit: int = Query(50, ge=1, le=200),
+    shape: Shape = Depends(sparse_fieldsets(MATCH_RELATIONS, default_include="archers")),
+    session: Session = Depends(get_session),
+):
+    if not session.get(Tournament, tournament_id):
+        raise HTTPException(status_code=404, detail="Tournament not found")
+
+    filters = []
+    if stage is not None:
+        filters.append(Match.stage == stage)
+    if finished is not None:
+        filters.append(Match.finished == finished)
+    if format is not None:
+        filters.append(Match.format == format)
+
+    try:
+        matches, next_cursor = tournament_matches_page(
+            session, tournament_id, filters, limit, cursor, shape
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return json_response({"limit": limit, "next_cursor": next_cursor, "data": matches})
+
+
+@router.get(
+    "/tournaments/{tournament_id}/live-summary", response_model=TournamentLiveSummary
+)
+async def get_tournament_live_summary(
     tournament_id: int,
     session: Session = Depends(get_session),
 ):
+    summary = live_summary(session, tournament_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Tournament not found")
+
+    return json_response(summary)
+
+
+@router.get("/tournaments/{tournament_id}/results", response_model=TournamentResults)
+async def get_tournament_results(
+    tournament_id: int,
+    session: Session = Depends(get_session),
+):
+    """
+    Standings of both stages and arrow matrices of a finished tournament,
+    from its result snapshot.
+    """
+    body = result_snapshots.results(tournament_id)
+    if body is None:
+        # Snapshot discarded by a change since the tournament was finished
+        result_snapshots.update(session, tournament_id)
+        body = result_snapshots.results(tournament_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Tournament results not found")
+
+    return raw_json_response(body)
+
+
+def get_editable_tournament(session: Session, tournament_id: int) -> Tournament:
+    """
+    The tournament, unless it is purged (its matches are gone from the tables)
+    or archived (its shard is read-only).
+    """
     tournament = session.get(Tournament, tournament_id)
     if not tournament:
         raise HTTPException(status_code=404, detail="Tournament not found")
-
+    if tournament.purged:
+        raise HTTPException(status_code=400, detail="Tournament is purged")
+    if shard_router is not None and shard_router.archived(tournament_id):
+        raise HTTPException(status_code=400, detail="Tournament is archived")
     return tournament
 
 
@@ -89,9 +217,7 @@ async def update_tournament(
     data: TournamentInput,
     session: Session = Depends(get_session),
 ):
-    tournament = session.get(Tournament, tournament_id)
-    if not tournament:
-        raise HTTPException(status_code=404, detail="Tournament not found")
+    tournament = get_editable_tournament(session, tournament_id)
 
     tournament.name = data.name
     tournament.format = data.format
@@ -102,7 +228,17 @@ async def update_tournament(
     tournament.advancing_count = data.advancing_count
     tournament.target_count = data.target_count
 
+    session.flush()
+    record_event(
+        session,
+        TournamentEventKind.TOURNAMENT_UPDATED,
+        tournament_id,
+        current_stage=TournamentStage(tournament.current_stage).value,
+        status=TournamentStatus(tournament.status).value,
+    )
     session.commit()
+    live_store.update_tournament(session, tournament_id)
+    result_snapshots.update(session, tournament_id)
     session.refresh(tournament)
     return tournament
 
@@ -124,26 +260,89 @@ async def post_tournament(
     )
     session.add(tournament)
     session.commit()
+    live_store.update_tournament(session, tournament.id)
     session.refresh(tournament)
     return tournament
 
 
+def stage_cut(session: Session, tournament: Tournament) -> TournamentNextStageInput:
+    """
+    Computes the participants advancing from the current stage. In the
+    qualifiers and the finals, the `advancing_count` best by hits advance, and
+    everyone tied at the boundary goes to a tie-break. After a tie-break, the
+    remaining places go by Enkin place (individual) or by hits (teams), and
+    the participants still tied at the boundary go to another tie-break.
+    """
+    everyone = stage_results(session, tournament)
+    results = [result for result in everyone if filter_participant(tournament, result)]
+    advancing_count = tournament.advancing_count or 0
+
+    if tournament.current_stage in [TournamentStage.QUALIFIERS, TournamentStage.FINALS]:
+        cutoff = (
+            results[advancing_count - 1].hits
+            if 0 < advancing_count <= len(results)
+            else -1
+        )
+        advancing = [result for result in results if result.hits >= cutoff]
+        return TournamentNextStageInput(
+            advancing_participants=[
+                AdvancingParticipant(id=result.id, hit_count=result.hits)
+                for result in advancing
+            ],
+            tie_breaker_needed=0 < advancing_count < len(advancing),
+        )
+
+    placed = sum(1 for result in everyone if result.qualifiers_place is not None)
+    remaining = max(advancing_count - placed, 0)
+
+    def rank(result):
+        if tournament.format == TournamentFormat.INDIVIDUAL:
+            # Archers without an Enkin place come last
+            return (result.enkin_place is None, result.enkin_place or 0)
+        return (False, -result.hits)
+
+    results.sort(key=rank)
+
+    advancing = results[:remaining]
+    if 0 < remaining < len(results):
+        cutoff = rank(results[remaining - 1])
+        advancing = [result for result in results if rank(result) <= cutoff]
+
+    # Equal ranks get equal hit counts, which marks the tie for `next_stage`
+    ranks = sorted({rank(result) for result in advancing})
+    return TournamentNextStageInput(
+        advancing_participants=[
+            AdvancingParticipant(id=result.id, hit_count=len(ranks) - ranks.index(rank(result)))
+            for result in advancing
+        ],
+        tie_breaker_needed=len(advancing) > remaining,
+    )
+
+
 @router.put("/tournaments/{tournament_id}/stage")
 async def next_stage(
     tournament_id: int,
-    data: TournamentNextStageInput,
+    data: TournamentNextStageInput = None,
     session: Session = Depends(get_session),
 ):
-    tournament = session.get(Tournament, tournament_id)
-    if not tournament:
-        raise HTTPException(status_code=404, detail="Tournament not found")
+    """
+    Closes the current stage. Without `advancing_participants`, the server
+    computes who advances and whether a tie-break is needed.
+    """
+    await flush_arrow_journal()
 
+    tournament = get_editable_tournament(session, tournament_id)
     if tournament.current_stage == TournamentStage.FINALS_TIE_BREAK:
         raise HTTPException(
             status_code=400,
             detail="Tournament is already in the finals tie-break stage",
         )
 
+    if data is None or data.advancing_participants is None:
+        data = stage_cut(session, tournament)
+    if not data.advancing_participants:
+        raise HTTPException(status_code=400, detail="No participant can advance")
+
     sorted_participants = sorted(
         data.advancing_participants, key=lambda x: x.hit_count, reverse=True
     )
@@ -167,6 +366,9 @@ async def next_stage(
         else sorted_participants
     )
 
+    # Places and tie-break flags given to each participant, for the event log
+    participant_updates = {"archers": {}, "teams": {}}
+
     # Update already qualified participants
     for participant in advancing_participants:
         qualifiers_place = sorted_participants.index(participant) + 1
@@ -179,6 +381,9 @@ async def next_stage(
                     status_code=404, detail="Archer not found for advancing"
                 )
             archer.qualifiers_place = qualifiers_place + place_offset
+            participant_updates["archers"][str(participant.id)] = {
+                "qualifiers_place": archer.qualifiers_place
+            }
             session.add(archer)
             session.commit()
             session.refresh(archer)
@@ -190,6 +395,9 @@ async def next_stage(
                     status_code=404, detail="Team not found for advancing"
                 )
             team.qualifiers_place = qualifiers_place + place_offset
+            participant_updates["teams"][str(participant.id)] = {
+                "qualifiers_place": team.qualifiers_place
+            }
             session.add(team)
             session.commit()
             session.refresh(team)
@@ -202,6 +410,25 @@ async def next_stage(
         elif tournament.current_stage == TournamentStage.FINALS:
             tournament.had_finals_tie_break = True
             tournament.current_stage = TournamentStage.FINALS_TIE_BREAK
+        elif tournament.current_stage == TournamentStage.QUALIFIERS_TIE_BREAK:
+            # Another round between the participants still tied, the others
+            # are out
+            tied = {participant.id for participant in tie_break_participants}
+            if tournament.format == TournamentFormat.INDIVIDUAL:
+                links = [(link.archer_id, link, "archers") for link in tournament.archers]
+            else:
+                links = [(team.id, team, "teams") for team in tournament.teams]
+            for link_id, link, kind in links:
+                if (
+                    link.tie_break_qualifiers
+                    and link.qualifiers_place is None
+                    and link_id not in tied
+                ):
+                    link.tie_break_qualifiers = False
+                    participant_updates[kind].setdefault(str(link_id), {}).update(
+                        tie_break_qualifiers=False, tie_break_finals=link.tie_break_finals
+                    )
+                    session.add(link)
         else:
             raise HTTPException(
                 status_code=400, detail="Tie-break not applicable for current stage"
@@ -222,6 +449,10 @@ async def next_stage(
                 elif tournament.current_stage == TournamentStage.FINALS_TIE_BREAK:
                     archer.tie_break_finals = True
 
+                participant_updates["archers"].setdefault(str(participant.id), {}).update(
+                    tie_break_qualifiers=archer.tie_break_qualifiers,
+                    tie_break_finals=archer.tie_break_finals,
+                )
                 session.add(archer)
             elif tournament.format == TournamentFormat.TEAM:
                 team = session.get(Team, participant.id)
@@ -235,6 +466,10 @@ async def next_stage(
                 elif tournament.current_stage == TournamentStage.FINALS_TIE_BREAK:
                     team.tie_break_finals = True
 
+                participant_updates["teams"].setdefault(str(participant.id), {}).update(
+                    tie_break_qualifiers=team.tie_break_qualifiers,
+                    tie_break_finals=team.tie_break_finals,
+                )
                 session.add(team)
     else:
         if tournament.current_stage in [TournamentStage.QUALIFIERS, TournamentStage.QUALIFIERS_TIE_BREAK]:
@@ -249,10 +484,27 @@ async def next_stage(
 
     # Update tournament status
     session.add(tournament)
+    session.flush()
+    record_event(
+        session,
+        TournamentEventKind.STAGE_CHANGED,
+        tournament_id,
+        current_stage=tournament.current_stage.value,
+        status=tournament.status.value,
+        had_qualifiers_tie_break=tournament.had_qualifiers_tie_break,
+        had_finals_tie_break=tournament.had_finals_tie_break,
+        participants=participant_updates,
+    )
     session.commit()
+    live_store.update_tournament(session, tournament_id)
+    result_snapshots.update(session, tournament_id)
     session.refresh(tournament)
 
-    await ws_instance.broadcast("tournament stage advanced")
+    await ws_instance.broadcast(
+        "tournament stage advanced",
+        {"tournament_id": tournament_id},
+        topic=tournament_topic(tournament_id),
+    )
 
     return tournament
 
@@ -263,6 +515,8 @@ async def add_archer_to_tournament(
     archer_id: int,
     session: Session = Depends(get_session),
 ):
+    get_editable_tournament(session, tournament_id)
+
     last_entry = session.exec(
         select(ArcherTournamentLink)
         .where(ArcherTournamentLink.tournament_id == tournament_id)
@@ -275,7 +529,17 @@ async def add_archer_to_tournament(
         number=last_entry.number + 1 if last_entry else 1,
     )
     session.add(archer_tournament_link)
+    session.flush()
+    record_event(
+        session,
+        TournamentEventKind.PARTICIPANT_ADDED,
+        tournament_id,
+        archer_id=archer_id,
+        places=participant_places(archer_tournament_link),
+    )
     session.commit()
+    live_store.update_tournament(session, tournament_id)
+    result_snapshots.update(session, tournament_id)
     return {"message": "Archer added to tournament"}
 
 
@@ -285,9 +549,7 @@ async def add_team_to_tournament(
     tournament_id: int,
     session: Session = Depends(get_session),
 ):
-    tournament = session.get(Tournament, tournament_id)
-    if not tournament:
-        raise HTTPException(status_code=404, detail="Tournament not found")
+    tournament = get_editable_tournament(session, tournament_id)
 
     last_entry = session.exec(
         select(Team)
@@ -299,7 +561,17 @@ async def add_team_to_tournament(
     team = Team(name=data.name, number=team_number)
     tournament.teams.append(team)
     session.add(team)
+    session.flush()
+    record_event(
+        session,
+        TournamentEventKind.TEAM_ADDED,
+        tournament_id,
+        team_id=team.id,
+        places=participant_places(team),
+    )
     session.commit()
+    live_store.update_tournament(session, tournament_id)
+    result_snapshots.update(session, tournament_id)
     session.refresh(tournament)
     return tournament
 
@@ -366,7 +638,8 @@ def filter_participant(
     if tournament.current_stage == TournamentStage.QUALIFIERS:
         return True
     elif tournament.current_stage == TournamentStage.QUALIFIERS_TIE_BREAK:
-        return participant.tie_break_qualifiers
+        # Those placed by a previous round of the tie-break are done
+        return participant.tie_break_qualifiers and participant.qualifiers_place is None
     elif tournament.current_stage == TournamentStage.FINALS:
         return participant.qualifiers_place is not None
     elif tournament.current_stage == TournamentStage.FINALS_TIE_BREAK:
@@ -415,6 +688,16 @@ def generate_individual_match(
     new_match.archers = new_match_archers
 
     session.add(new_match)
+    session.flush()
+    record_event(
+        session,
+        TournamentEventKind.MATCH_CREATED,
+        tournament.id,
+        match_id=new_match.id,
+        format=new_match.format.value,
+        stage=new_match.stage.value,
+        archers=[archer.id for archer in new_match_archers],
+    )
     session.commit()
     session.refresh(new_match)
     session.refresh(tournament)
@@ -454,6 +737,16 @@ def generate_team_match(
     new_match.archers = new_match_archers
 
     session.add(new_match)
+    session.flush()
+    record_event(
+        session,
+        TournamentEventKind.MATCH_CREATED,
+        tournament.id,
+        match_id=new_match.id,
+        format=new_match.format.value,
+        stage=new_match.stage.value,
+        archers=[archer.id for archer in new_match_archers],
+    )
     session.commit()
     session.refresh(new_match)
     session.refresh(tournament)
@@ -469,9 +762,7 @@ async def add_match_to_tournament(
     data: MatchIzumeParticipantsInput,
     session: Session = Depends(get_session),
 ):
-    tournament = session.get(Tournament, tournament_id)
-    if not tournament:
-        raise HTTPException(status_code=404, detail="Tournament not found")
+    tournament = get_editable_tournament(session, tournament_id)
 
     match tournament.format:
         case TournamentFormat.INDIVIDUAL:
@@ -481,9 +772,15 @@ async def add_match_to_tournament(
         case _:
             raise HTTPException(status_code=400, detail="Invalid tournament format")
 
-    await ws_instance.broadcast("new match")
+    live_store.update_tournament(session, tournament_id)
 
-    return tournament
+    await ws_instance.broadcast(
+        "new match",
+        {"tournament_id": tournament_id},
+        topic=tournament_topic(tournament_id),
+    )
+
+    return json_response(tournaments_with_everything(session, [tournament.id])[0])
 
 
 @router.delete("/tournaments/{tournament_id}/archers/{archer_id}")
@@ -492,6 +789,7 @@ async def remove_archer_from_tournament(
     archer_id: int,
     session: Session = Depends(get_session),
 ):
+    get_editable_tournament(session, tournament_id)
     archer_tournament_link = session.get(
         ArcherTournamentLink, (archer_id, tournament_id)
     )
@@ -517,7 +815,13 @@ async def remove_archer_from_tournament(
         link.number -= 1
         session.add(link)
 
+    session.flush()
+    record_event(
+        session, TournamentEventKind.PARTICIPANT_REMOVED, tournament_id, archer_id=archer_id
+    )
     session.commit()
+    live_store.update_tournament(session, tournament_id)
+    result_snapshots.update(session, tournament_id)
 
     return {"message": "Archer removed from tournament"}
 
@@ -530,6 +834,50 @@ async def delete_tournament(
     if not tournament:
         raise HTTPException(status_code=404, detail="Tournament not found")
 
+    # A tournament created later with the same id must not replay this log
+    delete_log(session, tournament_id)
     session.delete(tournament)
     session.commit()
+    live_store.drop(tournament_id)
+    result_snapshots.remove(tournament_id)
+    if shard_router is not None:
+        session.close()
+        shard_router.remove(tournament_id)
     return {"message": "Tournament deleted"}
+
+
+def archivable_tournament(session: Session, tournament_id: int) -> Tournament:
+    if shard_router is None:
+        raise HTTPException(status_code=400, detail="Tournaments are not sharded")
+    tournament = session.get(Tournament, tournament_id)
+    if not tournament:
+        raise HTTPException(status_code=404, detail="Tournament not found")
+    if tournament.status != TournamentStatus.FINISHED:
+        raise HTTPException(status_code=400, detail="Tournament is not finished")
+    return tournament
+
+
+@router.post("/tournaments/{tournament_id}/archive")
+async def archive_tournament(
+    tournament_id: int, session: Session = Depends(get_session)
+):
+    archivable_tournament(session, tournament_id)
+    if not os.path.exists(shard_router.path(tournament_id)):
+        raise HTTPException(status_code=400, detail="Tournament is already archived")
+
+    session.close()
+    shard_router.archive(tournament_id)
+    return {"message": "Tournament archived"}
+
+
+@router.post("/tournaments/{tournament_id}/restore")
+async def restore_tournament(
+    tournament_id: int, session: Session = Depends(get_session)
+):
+    archivable_tournament(session, tournament_id)
+    if not os.path.exists(shard_router.archive_path(tournament_id)):
+        raise HTTPException(status_code=400, detail="Tournament is not archived")
+
+    session.close()
+    shard_router.restore(tournament_id)
+    return {"message": "Tournament restored"}
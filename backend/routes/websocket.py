@@ -1,3 +1,5 @@
+import json
+
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from ..utils.ws_manager_insance import ws_instance
 
@@ -5,10 +7,31 @@ router = APIRouter()
 
 
 @router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await ws_instance.connect(websocket)
+async def websocket_endpoint(
+    websocket: WebSocket, epoch: str = None, last_seq: int = None
+):
+    if not await ws_instance.connect(websocket, epoch, last_seq):
+        return
     try:
         while True:
-            await websocket.receive_text()
+            text = await websocket.receive_text()
+            ws_instance.touch(websocket)
+
+            try:
+                message = json.loads(text)
+            except ValueError:
+                continue
+
+            # {"action": "pong"} answers a ping, the activity is all that counts
+            # {"action": "resume", "epoch": "...", "last_seq": 42}
+            if isinstance(message, dict) and message.get("action") == "resume":
+                last_seq = message.get("last_seq", 0)
+                if type(last_seq) is not int or last_seq < 0:
+                    # Not a position in the stream, the client starts over
+                    last_seq = None
+                await ws_instance.resume(websocket, message.get("epoch"), last_seq)
     except WebSocketDisconnect:
         ws_instance.disconnect(websocket)
+    except RuntimeError:
+        # Closed by the heartbeat while waiting for a message
+        ws_instance.disconnect(websocket)
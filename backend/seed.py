@@ -0,0 +1,261 @@
+"""
+Generates a large synthetic database for performance testing.
+
+Run from the backend directory, the target database is the one the API uses
+(`SEISHA_DB`, `tournament.db` by default):
+
+    SEISHA_DB=perf.db python seed.py --archers 100000 --tournaments 1000 --participants 200
+
+Rows are written with bulk Core inserts in batches, ids are assigned up front
+so no row has to be read back. Existing rows are kept, new ids start after the
+current maximum of each table.
+"""
+
+import argparse
+import json
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+from models.constants import (
+    MatchFormat,
+    TournamentFormat,
+    TournamentStage,
+    TournamentStatus,
+    TournamentType,
+)
+from models.models import (
+    Archer,
+    ArcherMatchLink,
+    ArcherTeamLink,
+    ArcherTournamentLink,
+    Match,
+    Series,
+    Team,
+    Tournament,
+    arrow_counters,
+)
+from setup import create_db_and_tables, generate_rotating_matches
+from sqlalchemy import text
+from sqlmodel import func, select
+from utils.sqlite import engine
+
+POSITIONS = ["zasha", "rissha"]
+
+
+class BulkWriter:
+    """
+    Buffers rows per table and inserts them with one `executemany` per table
+    once `batch_size` rows are pending.
+    """
+
+    def __init__(self, connection, batch_size: int):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.pending = {}
+        self.size = 0
+        self.written = {}
+
+    def add(self, model, row: dict):
+        self.pending.setdefault(model, []).append(row)
+        self.size += 1
+        if self.size >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # Parents first so that foreign keys always point to existing rows
+        for model in (Archer, Tournament, Team, Match, ArcherTournamentLink,
+                      ArcherTeamLink, ArcherMatchLink, Series):
+            rows = self.pending.pop(model, None)
+            if rows:
+                self.connection.execute(model.__table__.insert(), rows)
+                self.written[model] = self.written.get(model, 0) + len(rows)
+        self.connection.commit()
+        self.size = 0
+
+
+def next_id(connection, model) -> int:
+    return (connection.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def tournament_statuses(count: int, completion: float, live_count: int):
+    """
+    The first `completion` share of the tournaments is finished, the next
+    `live_count` are live and the remaining ones are upcoming.
+    """
+    finished = round(count * completion)
+    for i in range(count):
+        if i < finished:
+            yield TournamentStatus.FINISHED
+        elif i < finished + live_count:
+            yield TournamentStatus.LIVE
+        else:
+            yield TournamentStatus.UPCOMING
+
+
+def seed(args):
+    random.seed(args.seed)
+    create_db_and_tables(engine)
+
+    with engine.connect() as connection:
+        connection.execute(text("PRAGMA synchronous = OFF"))
+        connection.execute(text("PRAGMA journal_mode = MEMORY"))
+
+        writer = BulkWriter(connection, args.batch_size)
+        archer_id = next_id(connection, Archer)
+        tournament_id = next_id(connection, Tournament)
+        team_id = next_id(connection, Team)
+        match_id = next_id(connection, Match)
+        series_id = next_id(connection, Series)
+
+        accuracies = {}
+        for i in range(args.archers):
+            accuracies[archer_id + i] = round(random.uniform(0.4, 0.85), 2)
+            writer.add(
+                Archer,
+                {
+                    "id": archer_id + i,
+                    "name": f"Archer {archer_id + i}",
+                    "position": random.choice(POSITIONS),
+                    "accuracy": accuracies[archer_id + i],
+                },
+            )
+        archer_ids = list(accuracies)
+
+        start_date = datetime(2020, 1, 1)
+        statuses = tournament_statuses(args.tournaments, args.completion, args.live)
+
+        for t, status in enumerate(statuses):
+            is_team = random.random() < args.team_ratio
+            date = start_date + timedelta(days=t)
+            writer.add(
+                Tournament,
+                {
+                    "id": tournament_id,
+                    "name": f"Tournament {tournament_id}",
+                    "start_date": date,
+                    "end_date": date,
+                    "format": TournamentFormat.TEAM if is_team else TournamentFormat.INDIVIDUAL,
+                    "type": TournamentType.STANDARD,
+                    "current_stage": TournamentStage.QUALIFIERS,
+                    "advancing_count": args.advancing,
+                    "qualifiers_round_count": args.rounds,
+                    "had_qualifiers_tie_break": False,
+                    "finals_round_count": 0,
+                    "had_finals_tie_break": False,
+                    "target_count": args.target_count,
+                    "status": status,
+                },
+            )
+
+            if is_team:
+                participants = random.sample(archer_ids, args.teams * args.team_size)
+                for n in range(args.teams):
+                    writer.add(
+                        Team,
+                        {
+                            "id": team_id,
+                            "name": f"Team {n + 1}",
+                            "number": n + 1,
+                            "tournament_id": tournament_id,
+                            "tie_break_qualifiers": False,
+                            "tie_break_finals": False,
+                        },
+                    )
+                    members = participants[n * args.team_size : (n + 1) * args.team_size]
+                    for j, aid in enumerate(members):
+                        writer.add(
+                            ArcherTeamLink,
+                            {"archer_id": aid, "team_id": team_id, "number": j + 1},
+                        )
+                    team_id += 1
+            else:
+                participants = random.sample(archer_ids, args.participants)
+                for n, aid in enumerate(participants):
+                    writer.add(
+                        ArcherTournamentLink,
+                        {
+                            "archer_id": aid,
+                            "tournament_id": tournament_id,
+                            "number": n + 1,
+                            "tie_break_qualifiers": False,
+                            "tie_break_finals": False,
+                        },
+                    )
+
+            matches_count = math.ceil(len(participants) / args.target_count) * args.rounds
+            if status == TournamentStatus.UPCOMING:
+                matches_count = 0
+            elif status == TournamentStatus.LIVE:
+                matches_count = round(matches_count * args.completion)
+
+            matches = generate_rotating_matches(
+                participants, args.target_count, matches_count, accuracies
+            )
+            # The last match of a live tournament is still being shot
+            unfinished = 1 if status == TournamentStatus.LIVE else 0
+
+            for m, match_data in enumerate(matches):
+                writer.add(
+                    Match,
+                    {
+                        "id": match_id,
+                        "format": MatchFormat.STANDARD,
+                        "stage": TournamentStage.QUALIFIERS,
+                        "finished": m < len(matches) - unfinished,
+                        "tournament_id": tournament_id,
+                        "created_at": date + timedelta(minutes=10 * m),
+                        "updated_at": date + timedelta(minutes=10 * m),
+                    },
+                )
+                for aid in match_data["archers"]:
+                    writer.add(ArcherMatchLink, {"archer_id": aid, "match_id": match_id})
+                for series in match_data["series"]:
+                    writer.add(
+                        Series,
+                        {
+                            "id": series_id,
+                            "archer_id": series["archer_id"],
+                            "match_id": match_id,
+                            "arrows_raw": json.dumps(series["arrows"]),
+                            # Core inserts skip the listener keeping them in sync
+                            **arrow_counters(series["arrows"]),
+                        },
+                    )
+                    series_id += 1
+                match_id += 1
+
+            tournament_id += 1
+
+        writer.flush()
+        return writer.written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed a large synthetic database")
+    parser.add_argument("--archers", type=int, default=1000)
+    parser.add_argument("--tournaments", type=int, default=10)
+    parser.add_argument("--participants", type=int, default=50, help="Archers per individual tournament")
+    parser.add_argument("--teams", type=int, default=10, help="Teams per team tournament")
+    parser.add_argument("--team-size", type=int, default=3)
+    parser.add_argument("--team-ratio", type=float, default=0.2, help="Share of team tournaments")
+    parser.add_argument("--rounds", type=int, default=4)
+    parser.add_argument("--target-count", type=int, default=5)
+    parser.add_argument("--advancing", type=int, default=8)
+    parser.add_argument("--completion", type=float, default=0.9, help="Share of finished tournaments and progress of the live ones")
+    parser.add_argument("--live", type=int, default=3, help="Number of live tournaments")
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.participants > args.archers or args.teams * args.team_size > args.archers:
+        parser.error("not enough archers for the requested participants")
+
+    start = time.perf_counter()
+    written = seed(args)
+    elapsed = time.perf_counter() - start
+
+    for model, count in written.items():
+        print(f"{model.__tablename__:<22} {count:>10}")
+    print(f"Done in {elapsed:.1f}s")
@@ -122,7 +122,10 @@ individuals = {
 }
 
 
-def generate_rotating_matches(archer_list, target_count, num_matches):
+def generate_rotating_matches(archer_list, target_count, num_matches, accuracies=None):
+    if accuracies is None:
+        accuracies = {i + 1: accuracy for i, accuracy in enumerate(archers_accuracy)}
+
     matches = []
     total = len(archer_list)
     full_cycles = total // target_count
@@ -147,7 +150,7 @@ def generate_rotating_matches(archer_list, target_count, num_matches):
                 "arrows": [
                     random.choices(
                         [0, 1],
-                        [1 - archers_accuracy[aid - 1], archers_accuracy[aid - 1]],
+                        [1 - accuracies[aid], accuracies[aid]],
                     )[0]
                     for _ in range(4)
                 ],
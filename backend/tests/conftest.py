@@ -0,0 +1,45 @@
+import os
+import tempfile
+
+# Read by the modules of the backend when imported, so set before any of them
+WORKDIR = tempfile.mkdtemp(prefix="seisha-tests-")
+os.chdir(WORKDIR)
+os.environ["SEISHA_DB"] = os.path.join(WORKDIR, "tournament.db")
+os.environ["SEISHA_WS_COALESCE_WINDOW"] = "0"
+os.environ["SEISHA_WS_PING_INTERVAL"] = "0"
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlmodel import Session, SQLModel  # noqa: E402
+
+from backend.models import models  # noqa: E402, F401
+from backend.utils.sqlite import engine  # noqa: E402
+
+
+@pytest.fixture
+def session():
+    """
+    A session on empty tables.
+    """
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture
+def client(session, tmp_path):
+    """
+    A client of the app, started on the tables of `session` and with its
+    result snapshots under `tmp_path`.
+    """
+    from backend.api import app
+    from backend.utils.result_snapshots import result_snapshots
+
+    for tournament_id in list(result_snapshots.files):
+        result_snapshots.close(tournament_id)
+    result_snapshots.purged.clear()
+    result_snapshots.directory = str(tmp_path / "snapshots")
+
+    with TestClient(app) as client:
+        yield client
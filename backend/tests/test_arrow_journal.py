@@ -0,0 +1,86 @@
+import asyncio
+
+from sqlmodel import Session, func, select
+
+from backend.benchmarks.fixtures import seed_tournament
+from backend.models.models import ArrowJournalCheckpoint, Match, Series
+from backend.utils.arrow_journal import ArrowJournal
+from backend.utils.sqlite import engine
+
+
+def arrow_target(session: Session):
+    tournament_id = seed_tournament(session, 4, finished_rounds=1)
+    match_id, archer_id = session.exec(
+        select(Match.id, Series.archer_id)
+        .join(Series, Series.match_id == Match.id)
+        .where(Match.tournament_id == tournament_id)
+    ).first()
+    return match_id, archer_id
+
+
+def arrow_count(match_id: int, archer_id: int) -> int:
+    with Session(engine) as session:
+        return session.exec(
+            select(func.sum(func.json_array_length(Series.arrows_raw))).where(
+                Series.match_id == match_id, Series.archer_id == archer_id
+            )
+        ).one()
+
+
+def crash(journal: ArrowJournal):
+    """
+    Stops using a journal without flushing it, like a killed worker.
+    """
+    journal.file.close()
+    journal.file = None
+
+
+def test_journal_replays_arrows_after_a_crash(session, tmp_path):
+    match_id, archer_id = arrow_target(session)
+    before = arrow_count(match_id, archer_id)
+    path = str(tmp_path / "arrows.log")
+
+    journal = ArrowJournal(path, engine=engine)
+    journal.open()
+    for _ in range(3):
+        journal.journal(match_id, archer_id, 1)
+    crash(journal)
+    assert arrow_count(match_id, archer_id) == before
+
+    async def restart():
+        replayed = ArrowJournal(path, engine=engine)
+        await replayed.start()
+        await replayed.stop()
+
+    asyncio.run(restart())
+    assert arrow_count(match_id, archer_id) == before + 3
+    # The journal is emptied once written
+    with open(path) as file:
+        assert len(file.read().splitlines()) == 1
+
+
+def test_journal_skips_arrows_before_its_checkpoint(session, tmp_path):
+    match_id, archer_id = arrow_target(session)
+    before = arrow_count(match_id, archer_id)
+    path = str(tmp_path / "arrows.log")
+
+    journal = ArrowJournal(path, engine=engine)
+    journal.open()
+    for _ in range(2):
+        journal.journal(match_id, archer_id, 1)
+    # Crashes between the group commit and the truncation of the journal
+    journal.commit(engine, list(journal.pending))
+    journal.journal(match_id, archer_id, 0)
+    crash(journal)
+    assert arrow_count(match_id, archer_id) == before + 2
+
+    async def restart():
+        replayed = ArrowJournal(path, engine=engine)
+        await replayed.start()
+        await replayed.stop()
+        return replayed.epoch
+
+    epoch = asyncio.run(restart())
+    # Only the arrow after the checkpoint is written again
+    assert arrow_count(match_id, archer_id) == before + 3
+    assert session.get(ArrowJournalCheckpoint, epoch).last_id == 3
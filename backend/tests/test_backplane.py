@@ -0,0 +1,94 @@
+import asyncio
+import multiprocessing
+import time
+
+from backend.utils.backplane import SQLiteBackplane
+
+WORKERS = 2
+MESSAGES = 5
+
+
+def run_worker(path: str, name: str, ready, results):
+    """
+    A worker publishing `MESSAGES` messages through the backplane, and
+    collecting every message delivered to it, its own and the other's.
+    """
+
+    async def main():
+        delivered = []
+
+        async def deliver(seq: int, message: str):
+            delivered.append((seq, message))
+
+        backplane = SQLiteBackplane(path, poll_interval=0.01)
+        await backplane.start(deliver)
+        # Both workers publish once both are started
+        await asyncio.to_thread(ready.wait)
+        for index in range(MESSAGES):
+            await backplane.publish(f"{name}:{index}")
+
+        deadline = time.monotonic() + 10
+        while len(delivered) < WORKERS * MESSAGES and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        await backplane.stop()
+        return backplane.epoch, delivered
+
+    results.put((name, *asyncio.run(main())))
+
+
+def test_sqlite_backplane_across_processes(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    ready = context.Barrier(WORKERS)
+    results = context.Queue()
+    path = str(tmp_path / "backplane.db")
+
+    processes = [
+        context.Process(target=run_worker, args=(path, f"worker-{index}", ready, results))
+        for index in range(WORKERS)
+    ]
+    for process in processes:
+        process.start()
+    received = {}
+    for _ in processes:
+        name, epoch, delivered = results.get(timeout=30)
+        received[name] = (epoch, delivered)
+    for process in processes:
+        process.join(timeout=10)
+        assert process.exitcode == 0
+
+    (epoch, delivered), (other_epoch, other_delivered) = received.values()
+    # Every worker gets every message, in the same order and with the same
+    # sequence numbers
+    assert epoch == other_epoch
+    assert delivered == other_delivered
+    assert len(delivered) == WORKERS * MESSAGES
+    assert [seq for seq, _ in delivered] == sorted(seq for seq, _ in delivered)
+    for name in received:
+        own = [message for _, message in delivered if message.startswith(f"{name}:")]
+        assert own == [f"{name}:{index}" for index in range(MESSAGES)]
+
+
+def test_sqlite_backplane_prunes_old_messages(tmp_path):
+    async def main():
+        delivered = []
+
+        async def deliver(seq: int, message: str):
+            delivered.append(message)
+
+        backplane = SQLiteBackplane(
+            str(tmp_path / "backplane.db"), poll_interval=0.01, retention=0.05
+        )
+        await backplane.start(deliver)
+        await backplane.publish("old")
+        await asyncio.sleep(0.2)
+        await backplane.publish("new")
+        await asyncio.sleep(0.05)
+        await backplane.stop()
+        return delivered, backplane
+
+    delivered, backplane = asyncio.run(main())
+
+    assert delivered == ["old", "new"]
+    connection = backplane.connect()
+    assert [row[0] for row in connection.execute("SELECT message FROM ws_message")] == ["new"]
+    connection.close()
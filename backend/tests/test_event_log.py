@@ -0,0 +1,60 @@
+from sqlmodel import Session, func, select
+
+from backend.benchmarks.fixtures import seed_tournament
+from backend.models.constants import TournamentEventKind, TournamentStatus
+from backend.models.models import TournamentEvent, TournamentSnapshot
+from backend.utils import event_log
+from backend.utils.event_log import audit_tournament, record_event
+
+
+def update_status(session: Session, tournament_id: int, count: int):
+    for _ in range(count):
+        record_event(
+            session,
+            TournamentEventKind.TOURNAMENT_UPDATED,
+            tournament_id,
+            status=TournamentStatus.LIVE.value,
+        )
+    session.commit()
+
+
+def snapshots(session: Session, tournament_id: int):
+    return session.exec(
+        select(TournamentSnapshot.event_id, TournamentSnapshot.tail_count)
+        .where(TournamentSnapshot.tournament_id == tournament_id)
+        .order_by(TournamentSnapshot.id)
+    ).all()
+
+
+def test_snapshot_taken_every_interval(session, monkeypatch):
+    monkeypatch.setattr(event_log, "SNAPSHOT_INTERVAL", 3)
+    tournament_id = seed_tournament(session, 4, finished_rounds=1)
+
+    # The first event starts the log, the next three fill its tail
+    update_status(session, tournament_id, 4)
+    assert snapshots(session, tournament_id) == [(1, 3), (4, 0)]
+
+    update_status(session, tournament_id, 2)
+    assert snapshots(session, tournament_id) == [(1, 3), (4, 2)]
+    assert audit_tournament(session, tournament_id) == []
+
+
+def test_deleted_tournament_leaves_no_log(client, session):
+    archer = {"name": "Archer", "position": "zasha"}
+    archer_id = client.post("/archers", json=archer).json()["id"]
+    tournament = {
+        "name": "Deleted",
+        "format": "individual",
+        "start_date": "2025-01-01T00:00:00",
+        "end_date": "2025-01-01T00:00:00",
+        "target_count": 3,
+        "advancing_count": 2,
+    }
+    tournament_id = client.post("/tournaments", json=tournament).json()["id"]
+    assert client.post(f"/tournaments/{tournament_id}/archers/{archer_id}").status_code == 200
+    assert snapshots(session, tournament_id)
+
+    assert client.delete(f"/tournaments/{tournament_id}").status_code == 200
+
+    for model in (TournamentEvent, TournamentSnapshot):
+        assert session.exec(select(func.count()).select_from(model)).one() == 0
@@ -0,0 +1,47 @@
+import base64
+
+import pytest
+from sqlmodel import select
+
+from backend.benchmarks.fixtures import seed_tournament
+from backend.models.models import Match
+from backend.models.read_models import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("2025-01-01 10:00:00.123456", 42)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == ("2025-01-01 10:00:00.123456", 42)
+
+
+def test_pages_cover_every_match_once(client, session):
+    tournament_id = seed_tournament(session, 12, finished_rounds=3)
+    match_ids = session.exec(
+        select(Match.id).where(Match.tournament_id == tournament_id).order_by(Match.id)
+    ).all()
+
+    pages = []
+    params = {"limit": 2}
+    while True:
+        page = client.get(f"/tournaments/{tournament_id}/matches", params=params).json()
+        pages.append([match["id"] for match in page["data"]])
+        if page["next_cursor"] is None:
+            break
+        params["cursor"] = page["next_cursor"]
+
+    # Matches created in the same second are ordered by id
+    assert [id for page in pages for id in page] == match_ids
+    assert all(len(page) == 2 for page in pages[:-1])
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    ["not a cursor", base64.urlsafe_b64encode(b"[1]").decode(), encode_cursor("x", 1)[:-2]],
+)
+def test_invalid_cursor_is_rejected(client, session, cursor):
+    tournament_id = seed_tournament(session, 4, finished_rounds=1)
+
+    response = client.get(f"/tournaments/{tournament_id}/matches", params={"cursor": cursor})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
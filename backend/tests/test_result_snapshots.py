@@ -0,0 +1,81 @@
+import os
+
+from sqlmodel import func, select
+
+from backend.benchmarks.fixtures import seed_tournament
+from backend.models.constants import TournamentEventKind
+from backend.models.models import Match, Series, Tournament
+from backend.utils import result_snapshots as result_snapshots_module
+from backend.utils.event_log import record_event
+from backend.utils.result_snapshots import result_snapshots
+
+TOURNAMENT_FIELDS = [
+    "name",
+    "format",
+    "start_date",
+    "end_date",
+    "current_stage",
+    "advancing_count",
+    "target_count",
+]
+
+
+def set_status(client, tournament_id: int, status: str):
+    tournament = client.get(f"/tournaments/{tournament_id}").json()
+    body = {field: tournament[field] for field in TOURNAMENT_FIELDS}
+    return client.put(f"/tournaments/{tournament_id}", json={**body, "status": status})
+
+
+def reads(client, tournament_id: int):
+    tournament = client.get(f"/tournaments/{tournament_id}").json()
+    match_id = tournament["matches"][0]["id"]
+    return (
+        tournament,
+        client.get(f"/matches/{match_id}").json(),
+        client.get(f"/tournaments/{tournament_id}/results").json(),
+    )
+
+
+def test_finished_tournament_is_served_from_its_snapshot(client, session):
+    tournament_id = seed_tournament(session, 4, finished_rounds=1)
+    assert not os.path.exists(result_snapshots.directory)
+
+    assert set_status(client, tournament_id, "finished").status_code == 200
+    # The directory is created by the first snapshot
+    assert os.path.exists(result_snapshots.path(tournament_id))
+    served = reads(client, tournament_id)
+    result_snapshots.close(tournament_id)
+    assert reads(client, tournament_id) == served
+
+    # Any change recorded in the log discards the snapshot on commit
+    result_snapshots.load(tournament_id)
+    record_event(session, TournamentEventKind.TOURNAMENT_UPDATED, tournament_id)
+    session.commit()
+    assert tournament_id not in result_snapshots.files
+    assert not os.path.exists(result_snapshots.path(tournament_id))
+
+
+def test_purged_tournament_is_restored_from_its_snapshot(client, session, monkeypatch):
+    monkeypatch.setattr(result_snapshots_module, "PURGE_FINISHED", True)
+    tournament_id = seed_tournament(session, 4, finished_rounds=1)
+    before = reads(client, tournament_id)
+
+    assert set_status(client, tournament_id, "finished").status_code == 200
+    session.expire_all()
+    assert session.get(Tournament, tournament_id).purged
+    for model in (Match, Series):
+        assert session.exec(select(func.count()).select_from(model)).one() == 0
+    # The matches are served from the snapshot
+    after = reads(client, tournament_id)
+    assert after[0]["matches"] == before[0]["matches"]
+    assert after[1] == before[1]
+
+    # A purged tournament can no longer be reopened
+    assert set_status(client, tournament_id, "live").status_code == 400
+
+    # A restarted worker maps the snapshot again, it is never rebuilt
+    result_snapshots.close(tournament_id)
+    result_snapshots.purged.clear()
+    result_snapshots.warm(session)
+    assert tournament_id in result_snapshots.purged
+    assert reads(client, tournament_id) == after
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlmodel import Session, func, select
+
+from backend.api_models import ScorerSyncInput
+from backend.benchmarks.fixtures import seed_tournament
+from backend.models.models import Match, ScorerReceipt, Series
+from backend.routes import matches
+from backend.routes.matches import apply_scorer_batch
+from backend.utils.sqlite import engine
+
+
+def seed_match(session: Session):
+    tournament_id = seed_tournament(session, 4, finished_rounds=1)
+    return session.exec(
+        select(Match.id, Series.archer_id)
+        .join(Series, Series.match_id == Match.id)
+        .where(Match.tournament_id == tournament_id)
+    ).first()
+
+
+def arrow_count(session: Session) -> int:
+    return session.exec(select(func.sum(func.json_array_length(Series.arrows_raw)))).one()
+
+
+def batch(match_id: int, archer_id: int, seqs) -> dict:
+    return {
+        "client_id": "scorer",
+        "arrows": [
+            {"seq": seq, "match_id": match_id, "archer_id": archer_id, "arrow": 1}
+            for seq in seqs
+        ],
+    }
+
+
+def test_retried_batch_is_applied_once(client, session):
+    match_id, archer_id = seed_match(session)
+    before = arrow_count(session)
+
+    response = client.post("/scorers/sync", json=batch(match_id, archer_id, [2, 1]))
+    assert response.json() == {
+        "client_id": "scorer",
+        "applied": [1, 2],
+        "duplicates": [],
+        "last_seq": 2,
+    }
+
+    # The retry overlaps the first upload
+    response = client.post("/scorers/sync", json=batch(match_id, archer_id, [1, 2, 3]))
+    assert response.json() == {
+        "client_id": "scorer",
+        "applied": [3],
+        "duplicates": [1, 2],
+        "last_seq": 3,
+    }
+    assert arrow_count(session) == before + 3
+
+
+def test_concurrent_retry_is_rejected_with_a_conflict(session, monkeypatch):
+    match_id, archer_id = seed_match(session)
+    before = arrow_count(session)
+    append_arrow = matches.append_arrow
+
+    def append_during_retry(session, match, archer_id, arrow):
+        # Another upload of the same batch commits its receipt first
+        with Session(engine) as other:
+            other.add(
+                ScorerReceipt(
+                    client_id="scorer",
+                    seq=1,
+                    match_id=match_id,
+                    archer_id=archer_id,
+                    series_id=0,
+                    arrow=arrow,
+                )
+            )
+            other.commit()
+        return append_arrow(session, match, archer_id, arrow)
+
+    monkeypatch.setattr(matches, "append_arrow", append_during_retry)
+    data = ScorerSyncInput(**batch(match_id, archer_id, [1]))
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(apply_scorer_batch(session, data))
+
+    assert error.value.status_code == 409
+    session.expire_all()
+    # The rolled back upload wrote no arrow
+    assert arrow_count(session) == before
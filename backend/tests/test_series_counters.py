@@ -0,0 +1,46 @@
+import json
+
+from sqlalchemy import text
+from sqlmodel import create_engine, select
+
+from backend.models.models import Series
+from backend.utils.sqlite import ensure_columns
+
+
+def test_series_counters_follow_its_arrows(session):
+    series = Series(archer_id=1, match_id=1, arrows_raw=json.dumps([1, 2, 0, 1]))
+    session.add(series)
+    session.commit()
+    assert (series.hits, series.ensures, series.arrows_shot) == (2, 1, 4)
+
+    series.arrows = [0, 0]
+    session.add(series)
+    session.commit()
+    assert (series.hits, series.ensures, series.arrows_shot) == (0, 0, 2)
+
+
+def test_ensure_columns_backfills_series_counters(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        # The series table before the counters
+        connection.execute(
+            text(
+                "CREATE TABLE series (id INTEGER PRIMARY KEY, arrows_raw VARCHAR, "
+                "created_at DATETIME, updated_at DATETIME, archer_id INTEGER, "
+                "match_id INTEGER)"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO series (arrows_raw, archer_id, match_id) VALUES "
+                "('[1, 2, 0, 1]', 1, 1), ('[]', 2, 1), ('[2, 2]', 3, 1)"
+            )
+        )
+
+    ensure_columns(engine, [Series.__table__])
+
+    with engine.connect() as connection:
+        counters = connection.execute(
+            select(Series.hits, Series.ensures, Series.arrows_shot).order_by(Series.id)
+        ).all()
+    assert counters == [(2, 1, 4), (0, 0, 0), (0, 2, 2)]
@@ -0,0 +1,65 @@
+import pytest
+
+from backend.benchmarks.fixtures import seed_tournament
+from backend.models.read_models import Shape
+
+RELATIONS = {
+    "": ["id", "name", "status"],
+    "matches": ["id", "finished", "stage"],
+    "matches.series": ["id", "arrows_raw"],
+    "teams": ["id", "name"],
+}
+
+
+def test_shape_without_parameters_is_complete():
+    shape = Shape(RELATIONS)
+
+    assert shape.complete()
+    assert shape.include == {"matches", "matches.series", "teams"}
+    assert shape.columns("matches") == ["id", "finished", "stage"]
+
+
+def test_shape_includes_the_parents_of_a_path():
+    shape = Shape(RELATIONS, include=" matches.series ,")
+
+    assert not shape.complete()
+    assert shape.includes("matches") and shape.includes("matches.series")
+    assert not shape.includes("teams")
+    assert Shape(RELATIONS, include="").include == set()
+
+
+def test_shape_keeps_ids_and_listed_fields():
+    shape = Shape(RELATIONS, fields="status,matches.finished")
+
+    assert not shape.complete()
+    assert shape.columns("") == ["id", "status"]
+    assert shape.columns("matches") == ["id", "finished"]
+    # Relationships without a listed field keep all of them
+    assert shape.columns("teams") == ["id", "name"]
+
+
+@pytest.mark.parametrize(
+    "fields, include, error",
+    [
+        (None, "archers", "Unknown relationship: archers"),
+        (None, "matches.archers", "Unknown relationship: matches.archers"),
+        ("matches.name", None, "Unknown field: matches.name"),
+        ("series.id", None, "Unknown field: series.id"),
+    ],
+)
+def test_shape_rejects_unknown_names(fields, include, error):
+    with pytest.raises(ValueError, match=error):
+        Shape(RELATIONS, fields, include)
+
+
+def test_tournament_read_is_shaped(client, session):
+    tournament_id = seed_tournament(session, 4, finished_rounds=1)
+
+    response = client.get(
+        f"/tournaments/{tournament_id}", params={"fields": "name", "include": ""}
+    )
+    assert response.json() == {"id": tournament_id, "name": "Benchmark 4"}
+
+    response = client.get(f"/tournaments/{tournament_id}", params={"include": "bogus"})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Unknown relationship: bogus"}
@@ -0,0 +1,134 @@
+import json
+from datetime import datetime
+from typing import List
+
+from sqlmodel import Session
+
+from backend.benchmarks.fixtures import seed_tournament
+from backend.models.constants import (
+    MatchFormat,
+    TournamentFormat,
+    TournamentStage,
+    TournamentStatus,
+)
+from backend.models.models import (
+    Archer,
+    ArcherTournamentLink,
+    Match,
+    Series,
+    Team,
+    Tournament,
+)
+from backend.models.read_models import stage_results
+from backend.routes.tournaments import stage_cut
+
+
+def seed_qualifiers(session: Session, hits: List[int], advancing_count: int) -> List[int]:
+    """
+    Seeds a live individual tournament with one qualifier match, in which the
+    n-th archer hits `hits[n]` of its four arrows.
+
+    :return: The tournament id, then the archer ids in order.
+    """
+    tournament = Tournament(
+        name="Cut",
+        format=TournamentFormat.INDIVIDUAL,
+        start_date=datetime(2025, 1, 1),
+        end_date=datetime(2025, 1, 1),
+        status=TournamentStatus.LIVE,
+        current_stage=TournamentStage.QUALIFIERS,
+        advancing_count=advancing_count,
+        target_count=len(hits),
+    )
+    match = Match(tournament=tournament)
+    session.add(match)
+    archer_ids = []
+    for number, hit_count in enumerate(hits, 1):
+        archer = Archer(name=f"Archer {number}")
+        session.add(ArcherTournamentLink(archer=archer, tournament=tournament, number=number))
+        session.add(
+            Series(
+                archer=archer,
+                match=match,
+                arrows_raw=json.dumps([1] * hit_count + [0] * (4 - hit_count)),
+            )
+        )
+        session.flush()
+        archer_ids.append(archer.id)
+    session.commit()
+    return [tournament.id, *archer_ids]
+
+
+def shoot_enkin(session: Session, tournament_id: int, places: dict):
+    match = Match(
+        tournament_id=tournament_id,
+        format=MatchFormat.ENKIN,
+        stage=TournamentStage.QUALIFIERS_TIE_BREAK,
+    )
+    session.add(match)
+    for archer_id, place in places.items():
+        session.add(Series(archer_id=archer_id, match=match, arrows_raw=json.dumps([place])))
+    session.commit()
+
+
+def cut(session: Session, tournament_id: int):
+    session.expire_all()
+    result = stage_cut(session, session.get(Tournament, tournament_id))
+    return (
+        {p.id: p.hit_count for p in result.advancing_participants},
+        result.tie_breaker_needed,
+    )
+
+
+def test_qualifiers_cut_takes_the_best(session):
+    tournament_id, first, second, _, _ = seed_qualifiers(session, [4, 3, 2, 1], 2)
+
+    assert cut(session, tournament_id) == ({first: 4, second: 3}, False)
+
+
+def test_qualifiers_cut_sends_boundary_ties_to_tie_break(session):
+    tournament_id, first, second, third, _ = seed_qualifiers(session, [4, 3, 3, 1], 2)
+
+    assert cut(session, tournament_id) == ({first: 4, second: 3, third: 3}, True)
+
+
+def test_tie_break_ties_go_to_another_tie_break(client, session):
+    tournament_id, first, second, third, fourth = seed_qualifiers(session, [4, 3, 3, 3], 2)
+    assert client.put(f"/tournaments/{tournament_id}/stage").status_code == 200
+    session.expire_all()
+    assert session.get(Tournament, tournament_id).current_stage == (
+        TournamentStage.QUALIFIERS_TIE_BREAK
+    )
+    assert session.get(ArcherTournamentLink, (first, tournament_id)).qualifiers_place == 1
+
+    # One place left, the two best Enkin places are equal
+    shoot_enkin(session, tournament_id, {second: 2, third: 2, fourth: 3})
+    assert cut(session, tournament_id) == ({second: 1, third: 1}, True)
+    assert client.put(f"/tournaments/{tournament_id}/stage").status_code == 200
+    session.expire_all()
+    assert session.get(Tournament, tournament_id).current_stage == (
+        TournamentStage.QUALIFIERS_TIE_BREAK
+    )
+    # The archer behind the tie is out of the next round
+    assert not session.get(ArcherTournamentLink, (fourth, tournament_id)).tie_break_qualifiers
+
+    # The last Enkin match decides
+    shoot_enkin(session, tournament_id, {second: 3, third: 2})
+    assert cut(session, tournament_id) == ({third: 1}, False)
+    assert client.put(f"/tournaments/{tournament_id}/stage").status_code == 200
+    session.expire_all()
+    assert session.get(Tournament, tournament_id).current_stage == TournamentStage.FINALS
+    assert session.get(ArcherTournamentLink, (third, tournament_id)).qualifiers_place == 2
+    assert session.get(ArcherTournamentLink, (second, tournament_id)).qualifiers_place is None
+
+
+def test_team_without_archers_is_in_the_results(session):
+    tournament_id = seed_tournament(session, 4, TournamentFormat.TEAM, finished_rounds=1)
+    empty = Team(name="Empty", number=5, tournament_id=tournament_id)
+    session.add(empty)
+    session.commit()
+
+    results = stage_results(session, session.get(Tournament, tournament_id))
+
+    assert len(results) == 5
+    assert (results[-1].id, results[-1].hits) == (empty.id, 0)
@@ -0,0 +1,126 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from backend.utils.ws_manager import WebSocketManager, tournament_topic
+
+
+class FakeSocket:
+    """
+    Stands for an accepted WebSocket, recording the frames sent to it. A
+    stalled socket never completes a send, like a half-open connection whose
+    buffers are full.
+    """
+
+    def __init__(self, stalled: bool = False):
+        self.client = SimpleNamespace(host="127.0.0.1")
+        self.stalled = stalled
+        self.sent = []
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        if self.stalled:
+            await asyncio.Event().wait()
+        self.sent.append(json.loads(message))
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+
+def test_stalled_socket_does_not_block_broadcasts():
+    async def main():
+        manager = WebSocketManager(coalesce_window=0, ping_interval=0, ping_timeout=0.2)
+        await manager.start()
+        stalled, healthy = FakeSocket(), FakeSocket()
+        await manager.connect(stalled)
+        await manager.connect(healthy)
+        stalled.stalled = True
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await manager.broadcast("new arrow", {"match_id": 1})
+        first = loop.time() - started
+        await manager.broadcast("new arrow", {"match_id": 2})
+        await manager.stop()
+        return manager, stalled, healthy, first
+
+    manager, stalled, healthy, first = asyncio.run(main())
+
+    assert first < 1
+    assert [frame["event"] for frame in healthy.sent] == ["hello", "new arrow", "new arrow"]
+    # The stalled socket is dropped after its first timed out send
+    assert stalled.closed
+    assert manager.active_connections == [healthy]
+
+
+async def connect_after_broadcasts(epoch_of, last_seq: int, replay_buffer_size: int = 256):
+    """
+    Broadcasts three arrows, then connects a socket resuming after `last_seq`
+    with the epoch returned by `epoch_of(manager)`.
+    """
+    manager = WebSocketManager(
+        replay_buffer_size=replay_buffer_size, coalesce_window=0, ping_interval=0
+    )
+    await manager.start()
+    for match_id in (1, 2, 3):
+        await manager.broadcast("new arrow", {"match_id": match_id})
+    socket = FakeSocket()
+    await manager.connect(socket, epoch_of(manager), last_seq)
+    await manager.stop()
+    return manager, socket.sent
+
+
+def test_reconnect_replays_missed_frames():
+    manager, sent = asyncio.run(connect_after_broadcasts(lambda m: m.backplane.epoch, 1))
+
+    assert sent[0] == {"event": "hello", "data": {"epoch": manager.backplane.epoch, "seq": 3}}
+    assert [(frame["seq"], frame["data"]["match_id"]) for frame in sent[1:]] == [(2, 2), (3, 3)]
+
+
+def test_reconnect_after_epoch_change_resyncs():
+    _, sent = asyncio.run(connect_after_broadcasts(lambda m: "another-server", 1))
+
+    assert sent[1:] == [{"event": "resync", "data": {"seq": 3}}]
+
+
+def test_reconnect_past_replay_buffer_resyncs():
+    _, sent = asyncio.run(
+        connect_after_broadcasts(lambda m: m.backplane.epoch, 0, replay_buffer_size=2)
+    )
+
+    assert sent[1:] == [{"event": "resync", "data": {"seq": 3}}]
+
+
+@pytest.mark.parametrize("last_seq", ["x", None, -1, 1.5, True])
+def test_resume_with_invalid_last_seq_resyncs(client, last_seq):
+    with client.websocket_connect("/ws") as websocket:
+        assert websocket.receive_json()["event"] == "hello"
+        websocket.send_json({"action": "resume", "epoch": "e", "last_seq": last_seq})
+        assert websocket.receive_json()["event"] == "resync"
+        # The socket is still served
+        websocket.send_json({"action": "resume", "epoch": "e", "last_seq": 0})
+        assert websocket.receive_json()["event"] == "resync"
+
+
+def test_tournament_stream_gets_global_events():
+    async def main():
+        manager = WebSocketManager(coalesce_window=0, ping_interval=0)
+        await manager.start()
+        subscription = manager.subscribe(tournament_topic(1))
+        await manager.broadcast("job updated", {"id": 1})
+        await manager.broadcast("new arrow", {"match_id": 1}, tournament_topic(1))
+        await manager.broadcast("new arrow", {"match_id": 2}, tournament_topic(2))
+        # Resumes from the start, the missed frames are the same
+        resumed = manager.subscribe(tournament_topic(1), manager.backplane.epoch, 0)
+        await manager.stop()
+        return subscription, resumed
+
+    for subscription in asyncio.run(main()):
+        events = [chunk.decode() for chunk in subscription.chunks]
+        assert len(events) == 2
+        assert '"job updated"' in events[0] and '"match_id": 1' in events[1]
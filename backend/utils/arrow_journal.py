@@ -0,0 +1,272 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from ..models.models import ArrowJournalCheckpoint, Match
+from .live_store import live_store
+from .scoring import append_arrow
+from .sqlite import engine, match_engine
+from .ws_manager import tournament_topic
+from .ws_manager_insance import ws_instance
+
+# Write-behind mode: arrows are acknowledged once appended to the journal and
+# written to the tables in group commits
+WRITE_BEHIND = os.environ.get("SEISHA_WRITE_BEHIND", "0") == "1"
+# One journal per worker process, the file is locked while in use
+JOURNAL_PATH = os.environ.get("SEISHA_ARROW_JOURNAL", "arrow_journal.log")
+# Group commits happen every interval (seconds) or once this many arrows wait
+FLUSH_INTERVAL = float(os.environ.get("SEISHA_JOURNAL_FLUSH_INTERVAL", "0.005"))
+FLUSH_ARROWS = int(os.environ.get("SEISHA_JOURNAL_FLUSH_ARROWS", "200"))
+
+logger = logging.getLogger("seisha.journal")
+
+
+class ArrowJournal:
+    """
+    Append-only file of the arrows not yet written to the tables.
+
+    The first line holds the journal epoch and the next entry id, every other
+    line is one arrow. Appends are fsync'd before the arrow is acknowledged.
+    Group commits write the pending arrows and the id of the last one
+    (`ArrowJournalCheckpoint`) in one transaction per database, then empty
+    the file. On startup, the entries after the checkpoints are replayed.
+
+    Appends and group commits run in threads, the event loop only waits for
+    them. The `new arrow` broadcast of a journaled arrow is sent once a group
+    commit has written it, so that clients refetching on it see the arrow.
+    """
+
+    def __init__(
+        self,
+        path: str = JOURNAL_PATH,
+        flush_interval: float = FLUSH_INTERVAL,
+        flush_arrows: int = FLUSH_ARROWS,
+        engine: Optional[Engine] = None,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_arrows = flush_arrows
+        # None writes every arrow to the database storing its match
+        self.engine = engine
+        self.file = None
+        self.epoch = ""
+        self.next_id = 1
+        self.pending: List[dict] = []
+        # (tournament, match, archer) of the arrows written since the last
+        # broadcast
+        self.written: Set[Tuple[int, int, int]] = set()
+        # Guards the file, `pending` and `written`, used by the loop and the
+        # threads appending and flushing
+        self.lock = threading.Lock()
+        # One group commit at a time
+        self.flush_lock = threading.Lock()
+        self.wake: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def open(self) -> List[dict]:
+        """
+        Opens and locks the journal.
+
+        :return: The entries it contains.
+        """
+        self.file = open(self.path, "a+")
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise RuntimeError(f"Arrow journal {self.path} is used by another process")
+
+        self.file.seek(0)
+        lines = self.file.read().splitlines()
+        entries = []
+        header = None
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Torn write of the last entry, never acknowledged
+                continue
+            if header is None:
+                header = record
+            else:
+                entries.append(record)
+
+        if header is None:
+            self.epoch, self.next_id = uuid.uuid4().hex, 1
+            self.truncate()
+        else:
+            self.epoch, self.next_id = header["epoch"], header["next_id"]
+        if entries:
+            self.next_id = max(self.next_id, entries[-1]["id"] + 1)
+
+        return entries
+
+    def truncate(self):
+        self.file.seek(0)
+        self.file.truncate()
+        self.write({"epoch": self.epoch, "next_id": self.next_id})
+
+    def write(self, record: dict):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    async def start(self):
+        self.pending = self.open()
+        if self.pending:
+            # The entries before the checkpoint are skipped by `flush`
+            logger.info("Replaying up to %d journaled arrows", len(self.pending))
+        await asyncio.to_thread(self.flush)
+
+        self.wake = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        if self.file:
+            await asyncio.to_thread(self.flush)
+            await self.announce()
+            self.file.close()
+            self.file = None
+
+    async def append(self, match: Match, archer_id: int, arrow: int) -> int:
+        """
+        Journals an arrow, it is durable once this returns.
+
+        :return: The id of the journal entry.
+        """
+        entry_id = await asyncio.to_thread(self.journal, match.id, archer_id, arrow)
+        if len(self.pending) >= self.flush_arrows and self.wake:
+            self.wake.set()
+        return entry_id
+
+    def journal(self, match_id: int, archer_id: int, arrow: int) -> int:
+        with self.lock:
+            entry = {
+                "id": self.next_id,
+                "match_id": match_id,
+                "archer_id": archer_id,
+                "arrow": arrow,
+            }
+            self.next_id += 1
+            self.write(entry)
+            self.pending.append(entry)
+        return entry["id"]
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                # Kept in the journal and retried on the next tick
+                logger.exception("Arrow journal group commit failed")
+            await self.announce()
+
+    async def announce(self):
+        """
+        Reloads the matches of the arrows written by the group commits since
+        the last call in the live store, and broadcasts the arrows.
+        """
+        with self.lock:
+            written, self.written = self.written, set()
+        if not written:
+            return
+
+        with Session(self.engine or engine) as session:
+            live_store.update_matches(session, {match_id for _, match_id, _ in written})
+        for tournament_id, match_id, archer_id in written:
+            await ws_instance.broadcast(
+                "new arrow",
+                {"tournament_id": tournament_id, "match_id": match_id, "archer_id": archer_id},
+                topic=tournament_topic(tournament_id),
+            )
+
+    def flush(self):
+        """
+        Writes the pending arrows, in one transaction per database. Arrows
+        journaled meanwhile wait for the next flush.
+        """
+        with self.flush_lock:
+            with self.lock:
+                entries = list(self.pending)
+            if not entries:
+                return
+
+            groups: Dict[Engine, List[dict]] = {}
+            for entry in entries:
+                bind = self.engine or match_engine(entry["match_id"])
+                if bind is None:
+                    # Deleted before its arrows were written
+                    continue
+                groups.setdefault(bind, []).append(entry)
+            for bind, group in groups.items():
+                self.commit(bind, group)
+
+            with self.lock:
+                del self.pending[: len(entries)]
+                if not self.pending:
+                    self.truncate()
+
+    def commit(self, bind: Engine, entries: List[dict]):
+        """
+        Writes arrows to one database along with its checkpoint, skipping the
+        ones it already holds so that a failed flush can be retried.
+        """
+        with Session(bind) as session:
+            checkpoint = session.get(ArrowJournalCheckpoint, self.epoch)
+            if checkpoint is None:
+                checkpoint = ArrowJournalCheckpoint(epoch=self.epoch, last_id=0)
+            entries = [entry for entry in entries if entry["id"] > checkpoint.last_id]
+            if not entries:
+                return
+
+            written = set()
+            matches = {
+                match.id: match
+                for match in session.exec(
+                    select(Match).where(Match.id.in_({e["match_id"] for e in entries}))
+                )
+            }
+            for entry in entries:
+                match = matches.get(entry["match_id"])
+                if match is None:
+                    # Deleted before its arrows were written
+                    continue
+                append_arrow(session, match, entry["archer_id"], entry["arrow"])
+                written.add((match.tournament_id, match.id, entry["archer_id"]))
+
+            checkpoint.last_id = entries[-1]["id"]
+            session.add(checkpoint)
+            session.commit()
+        with self.lock:
+            self.written |= written
+
+
+arrow_journal = ArrowJournal() if WRITE_BEHIND else None
+
+
+async def flush_arrow_journal():
+    """
+    Writes the journaled arrows before a request that changes series, or reads
+    a single arrow. Reads of tournament and match documents do not flush: they
+    lag the journal by up to one group commit, and the `new arrow` broadcast
+    is only sent once the arrow is written.
+    """
+    if arrow_journal is not None:
+        await asyncio.to_thread(arrow_journal.flush)
+        await arrow_journal.announce()
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+# "local" keeps broadcasts inside the process, "sqlite" shares them between
+# every worker using the same backplane file
+BACKPLANE = os.environ.get("SEISHA_WS_BACKPLANE", "local")
+BACKPLANE_DB = os.environ.get("SEISHA_WS_BACKPLANE_DB", "ws_backplane.db")
+BACKPLANE_POLL_INTERVAL = float(os.environ.get("SEISHA_WS_BACKPLANE_POLL", "0.02"))
+BACKPLANE_RETENTION = 60.0
+
+Deliver = Callable[[int, str], Awaitable[None]]
+
+logger = logging.getLogger("seisha.backplane")
+
+
+class Backplane:
+    """
+    Carries broadcast messages between the workers serving the API. Every
+    message gets a sequence number, monotonically increasing across workers,
+    and is delivered in sequence order to every worker, including the one that
+    published it.
+
+    `epoch` identifies the numbering, sequence numbers of different epochs
+    cannot be compared. `start_seq` is the last sequence number published
+    before this worker started.
+    """
+
+    epoch: str
+    start_seq: int = 0
+
+    async def start(self, deliver: Deliver):
+        self.deliver = deliver
+
+    async def stop(self):
+        pass
+
+    async def publish(self, message: str) -> int:
+        raise NotImplementedError
+
+
+class LocalBackplane(Backplane):
+    """
+    Single worker: messages are numbered and delivered right away.
+    """
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex
+        self.seq = 0
+        self.deliver = None
+
+    async def publish(self, message: str) -> int:
+        self.seq += 1
+        if self.deliver is not None:
+            await self.deliver(self.seq, message)
+        return self.seq
+
+
+class SQLiteBackplane(Backplane):
+    """
+    Broker-less backplane for workers on the same host. Messages are appended
+    to a notification table in a small WAL-mode SQLite file, which every
+    worker polls. The row id is the sequence number of the message.
+    """
+
+    def __init__(
+        self,
+        path: str = BACKPLANE_DB,
+        poll_interval: float = BACKPLANE_POLL_INTERVAL,
+        retention: float = BACKPLANE_RETENTION,
+    ):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        # Identifies the rows of this worker when debugging the table
+        self.origin = uuid.uuid4().hex
+        # Used from threads, to keep the loop running while SQLite waits for
+        # the other workers' locks: one connection publishes, the other polls,
+        # each used by one thread at a time
+        self.connection: Optional[sqlite3.Connection] = None
+        self.publish_lock = threading.Lock()
+        self.poll_connection: Optional[sqlite3.Connection] = None
+        self.poll_lock = threading.Lock()
+        self.last_id = 0
+        self.epoch = ""
+        self.task: Optional[asyncio.Task] = None
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute("PRAGMA busy_timeout = 5000")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS ws_message ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "origin TEXT NOT NULL, "
+            "message TEXT NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS ws_epoch (id INTEGER PRIMARY KEY CHECK (id = 1), epoch TEXT NOT NULL)"
+        )
+        connection.execute(
+            "INSERT OR IGNORE INTO ws_epoch (id, epoch) VALUES (1, ?)", (uuid.uuid4().hex,)
+        )
+        return connection
+
+    async def start(self, deliver: Deliver):
+        await super().start(deliver)
+        self.connection = self.connect()
+        self.poll_connection = self.connect()
+        # Only messages published after this worker started are delivered
+        self.epoch = self.connection.execute("SELECT epoch FROM ws_epoch").fetchone()[0]
+        self.last_id = self.start_seq = self.connection.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM ws_message"
+        ).fetchone()[0]
+        self.task = asyncio.create_task(self.poll())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        if self.connection:
+            with self.publish_lock:
+                self.connection.close()
+            self.connection = None
+        if self.poll_connection:
+            with self.poll_lock:
+                self.poll_connection.close()
+            self.poll_connection = None
+
+    async def publish(self, message: str) -> int:
+        """
+        Appends a message to the table, off the event loop: the write waits
+        for the other workers' locks for up to the busy timeout.
+
+        :return: The sequence number of the message, 0 when it could not be
+            written (the message is lost, for every worker).
+        """
+        if self.connection is None:
+            return 0
+
+        try:
+            return await asyncio.to_thread(self.insert, message)
+        except sqlite3.Error:
+            logger.exception("Could not publish a message to the backplane")
+            return 0
+
+    def insert(self, message: str) -> int:
+        with self.publish_lock:
+            cursor = self.connection.execute(
+                "INSERT INTO ws_message (origin, message, created_at) VALUES (?, ?, ?)",
+                (self.origin, message, time.time()),
+            )
+            return cursor.lastrowid
+
+    def fetch(self):
+        with self.poll_lock:
+            return self.poll_connection.execute(
+                "SELECT id, message FROM ws_message WHERE id > ? ORDER BY id",
+                (self.last_id,),
+            ).fetchall()
+
+    def prune(self):
+        with self.poll_lock:
+            self.poll_connection.execute(
+                "DELETE FROM ws_message WHERE created_at < ?",
+                (time.time() - self.retention,),
+            )
+
+    async def poll(self):
+        last_prune = time.monotonic()
+
+        while True:
+            await asyncio.sleep(self.poll_interval)
+
+            # An error must not end the task, the worker would stop receiving
+            # the broadcasts of the other workers
+            try:
+                for id, message in await asyncio.to_thread(self.fetch):
+                    self.last_id = id
+                    await self.deliver(id, message)
+
+                if time.monotonic() - last_prune > self.retention:
+                    last_prune = time.monotonic()
+                    await asyncio.to_thread(self.prune)
+            except sqlite3.OperationalError:
+                # Busy with another worker's write, try again on the next tick
+                continue
+            except Exception:
+                logger.exception("Could not deliver the backplane messages")
+
+
+def create_backplane(kind: str = BACKPLANE) -> Backplane:
+    if kind == "local":
+        return LocalBackplane()
+    if kind == "sqlite":
+        return SQLiteBackplane()
+    raise ValueError(f"Unknown WebSocket backplane: {kind}")
@@ -0,0 +1,139 @@
+import gzip
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from .metrics import http_compressions
+
+try:
+    import brotli
+except ImportError:  # Optional, gzip only without it
+    brotli = None
+
+# Smaller bodies are sent as is, compressing them costs more than it saves
+COMPRESS_MIN_SIZE = int(os.environ.get("SEISHA_COMPRESS_MIN_SIZE", "1024"))
+# Number of compressed bodies kept in memory
+COMPRESS_CACHE_SIZE = int(os.environ.get("SEISHA_COMPRESS_CACHE", "128"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html")
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Picks the encoding to use from an `Accept-Encoding` header, brotli when
+    it is available and accepted, then gzip.
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+class CompressedBodyCache:
+    """
+    LRU cache of compressed bodies keyed by the digest of the body and the
+    encoding. Every viewer refetching a tournament after a broadcast gets the
+    same JSON, which is then compressed once.
+    """
+
+    def __init__(self, size: int = COMPRESS_CACHE_SIZE):
+        self.size = size
+        self.bodies: OrderedDict = OrderedDict()
+
+    def get(self, body: bytes, encoding: str) -> bytes:
+        key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+        compressed = self.bodies.get(key)
+        if compressed is not None:
+            self.bodies.move_to_end(key)
+            http_compressions.inc(encoding=encoding, cache="hit")
+            return compressed
+
+        compressed = compress(body, encoding)
+        self.bodies[key] = compressed
+        if len(self.bodies) > self.size:
+            self.bodies.popitem(last=False)
+        http_compressions.inc(encoding=encoding, cache="miss")
+        return compressed
+
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware compressing the responses negotiated through
+    `Accept-Encoding`. Only complete bodies are compressed, streamed responses
+    (e.g. Server-Sent Events) go through untouched.
+    """
+
+    def __init__(self, app, min_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+        self.cache = CompressedBodyCache()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if "content-encoding" in headers or not content_type.startswith(
+                    COMPRESSIBLE_TYPES
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Held until the body tells whether it is worth compressing
+                    start = message
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.min_size:
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            compressed = self.cache.get(body, encoding)
+            headers = MutableHeaders(raw=list(start["headers"]))
+            headers["content-encoding"] = encoding
+            headers["content-length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send({**start, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,318 @@
+import json
+import os
+from typing import List, Optional, Tuple
+
+from sqlalchemy import delete, update
+from sqlmodel import Session, func, select
+
+from ..models.constants import TournamentEventKind
+from ..models.models import (
+    ArcherMatchLink,
+    ArcherTournamentLink,
+    Match,
+    Series,
+    Team,
+    Tournament,
+    TournamentEvent,
+    TournamentSnapshot,
+)
+
+# Number of events after the latest snapshot that triggers a new snapshot
+SNAPSHOT_INTERVAL = int(os.environ.get("SEISHA_SNAPSHOT_INTERVAL", "200"))
+
+PLACE_FIELDS = [
+    "qualifiers_place",
+    "finals_place",
+    "tie_break_qualifiers",
+    "tie_break_finals",
+]
+
+# The state of a tournament rebuilt from the log is a JSON document:
+#
+#   {
+#       "current_stage": "qualifiers",
+#       "status": "live",
+#       "had_qualifiers_tie_break": false,
+#       "had_finals_tie_break": false,
+#       "matches": {
+#           "<match id>": {
+#               "format": "standard", "stage": "qualifiers", "finished": false,
+#               "archers": [<archer id>, ...],
+#               "series": {"<series id>": {"archer_id": 1, "arrows": [1, 0]}},
+#           },
+#       },
+#       "participants": {"archers": {"<archer id>": {<places>}}, "teams": {...}},
+#   }
+
+
+def empty_state() -> dict:
+    return {
+        "current_stage": None,
+        "status": None,
+        "had_qualifiers_tie_break": False,
+        "had_finals_tie_break": False,
+        "matches": {},
+        "participants": {"archers": {}, "teams": {}},
+    }
+
+
+def participant_places(participant) -> dict:
+    """
+    Places of an `ArcherTournamentLink` or a `Team`, as held in the state.
+    """
+    return {field: getattr(participant, field) for field in PLACE_FIELDS}
+
+
+def state_from_tables(session: Session, tournament_id: int) -> dict:
+    """
+    Reads the current state of a tournament from the tables. Used as the
+    genesis snapshot of tournaments created before the log existed, and to
+    audit the tables against the log.
+    """
+    tournament = session.get(Tournament, tournament_id)
+    state = empty_state()
+    state["current_stage"] = tournament.current_stage.value
+    state["status"] = tournament.status.value
+    state["had_qualifiers_tie_break"] = tournament.had_qualifiers_tie_break
+    state["had_finals_tie_break"] = tournament.had_finals_tie_break
+
+    for match in session.exec(
+        select(Match).where(Match.tournament_id == tournament_id).order_by(Match.id)
+    ):
+        state["matches"][str(match.id)] = {
+            "format": match.format.value,
+            "stage": match.stage.value,
+            "finished": match.finished,
+            "archers": [],
+            "series": {},
+        }
+
+    for match_id, archer_id in session.exec(
+        select(ArcherMatchLink.match_id, ArcherMatchLink.archer_id)
+        .join(Match, Match.id == ArcherMatchLink.match_id)
+        .where(Match.tournament_id == tournament_id)
+    ):
+        state["matches"][str(match_id)]["archers"].append(archer_id)
+
+    for series in session.exec(
+        select(Series)
+        .join(Match, Match.id == Series.match_id)
+        .where(Match.tournament_id == tournament_id)
+        .order_by(Series.id)
+    ):
+        state["matches"][str(series.match_id)]["series"][str(series.id)] = {
+            "archer_id": series.archer_id,
+            "arrows": series.arrows,
+        }
+
+    for link in session.exec(
+        select(ArcherTournamentLink).where(
+            ArcherTournamentLink.tournament_id == tournament_id
+        )
+    ):
+        state["participants"]["archers"][str(link.archer_id)] = participant_places(link)
+
+    for team in session.exec(select(Team).where(Team.tournament_id == tournament_id)):
+        state["participants"]["teams"][str(team.id)] = participant_places(team)
+
+    for match in state["matches"].values():
+        match["archers"].sort()
+
+    return state
+
+
+def apply_event(state: dict, event: TournamentEvent) -> dict:
+    payload = event.payload
+    matches = state["matches"]
+    current_match = matches.get(str(event.match_id))
+
+    match event.kind:
+        case TournamentEventKind.MATCH_CREATED:
+            matches[str(event.match_id)] = {
+                "format": payload["format"],
+                "stage": payload["stage"],
+                "finished": False,
+                "archers": sorted(payload["archers"]),
+                "series": {},
+            }
+        case TournamentEventKind.MATCH_FINISHED:
+            current_match["finished"] = True
+        case TournamentEventKind.MATCH_DELETED:
+            matches.pop(str(event.match_id), None)
+        case TournamentEventKind.ARROW:
+            series = current_match["series"].setdefault(
+                str(payload["series_id"]), {"archer_id": event.archer_id, "arrows": []}
+            )
+            series["arrows"].append(payload["arrow"])
+        case TournamentEventKind.ARROW_CORRECTION:
+            series = current_match["series"][str(payload["series_id"])]
+            series["arrows"][payload["index"]] = payload["arrow"]
+        case TournamentEventKind.ENKIN_PLACE:
+            current_match["series"][str(payload["series_id"])] = {
+                "archer_id": event.archer_id,
+                "arrows": [payload["place"]],
+            }
+        case TournamentEventKind.PARTICIPANT_ADDED:
+            state["participants"]["archers"][str(event.archer_id)] = payload["places"]
+        case TournamentEventKind.PARTICIPANT_REMOVED:
+            state["participants"]["archers"].pop(str(event.archer_id), None)
+        case TournamentEventKind.TEAM_ADDED:
+            state["participants"]["teams"][str(payload["team_id"])] = payload["places"]
+        case TournamentEventKind.TEAM_REMOVED:
+            state["participants"]["teams"].pop(str(payload["team_id"]), None)
+        case TournamentEventKind.STAGE_CHANGED | TournamentEventKind.TOURNAMENT_UPDATED:
+            for key in (
+                "current_stage",
+                "status",
+                "had_qualifiers_tie_break",
+                "had_finals_tie_break",
+            ):
+                if key in payload:
+                    state[key] = payload[key]
+            for kind, participants in payload.get("participants", {}).items():
+                for id, places in participants.items():
+                    state["participants"][kind].setdefault(id, {}).update(places)
+
+    return state
+
+
+def latest_snapshot(
+    session: Session, tournament_id: int
+) -> Optional[TournamentSnapshot]:
+    return session.exec(
+        select(TournamentSnapshot)
+        .where(TournamentSnapshot.tournament_id == tournament_id)
+        .order_by(TournamentSnapshot.event_id.desc())
+    ).first()
+
+
+def get_events(
+    session: Session, tournament_id: int, after: int = 0, limit: int = None
+) -> List[TournamentEvent]:
+    stmt = (
+        select(TournamentEvent)
+        .where(TournamentEvent.tournament_id == tournament_id, TournamentEvent.id > after)
+        .order_by(TournamentEvent.id)
+    )
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return session.exec(stmt).all()
+
+
+def rebuild_state(session: Session, tournament_id: int) -> Tuple[dict, int]:
+    """
+    Rebuilds the state of a tournament from its latest snapshot and the events
+    recorded after it.
+
+    :return: The state and the sequence number of the last applied event.
+    """
+    snapshot = latest_snapshot(session, tournament_id)
+    if snapshot is None:
+        # Nothing was recorded yet, the tables are the whole history
+        return state_from_tables(session, tournament_id), 0
+
+    state, last_event_id = json.loads(snapshot.state_raw), snapshot.event_id
+
+    for event in get_events(session, tournament_id, after=last_event_id):
+        apply_event(state, event)
+        last_event_id = event.id
+
+    return state, last_event_id
+
+
+def take_snapshot(session: Session, tournament_id: int) -> TournamentSnapshot:
+    state, last_event_id = rebuild_state(session, tournament_id)
+    snapshot = TournamentSnapshot(
+        tournament_id=tournament_id,
+        event_id=last_event_id,
+        state_raw=json.dumps(state),
+    )
+    session.add(snapshot)
+    return snapshot
+
+
+def record_event(
+    session: Session,
+    kind: TournamentEventKind,
+    tournament_id: int,
+    match_id: int = None,
+    archer_id: int = None,
+    **payload,
+) -> Optional[TournamentEvent]:
+    """
+    Appends an event to the log of a tournament. Must be called after the
+    change it describes has been flushed, in the same transaction, so that the
+    log and the tables are committed together.
+    """
+    if tournament_id is None:
+        # Matches created outside of a tournament have no log
+        return None
+
+    # Tournaments changed by the transaction, see `ResultSnapshots`
+    session.info.setdefault("changed_tournaments", set()).add(tournament_id)
+
+    event = TournamentEvent(
+        tournament_id=tournament_id,
+        kind=kind,
+        match_id=match_id,
+        archer_id=archer_id,
+        payload_raw=json.dumps(payload),
+    )
+    session.add(event)
+    session.flush()
+
+    # Counts the event on the latest snapshot, one statement per event
+    latest = (
+        select(func.max(TournamentSnapshot.id))
+        .where(TournamentSnapshot.tournament_id == tournament_id)
+        .scalar_subquery()
+    )
+    tail = session.execute(
+        update(TournamentSnapshot)
+        .where(TournamentSnapshot.id == latest)
+        .values(tail_count=TournamentSnapshot.tail_count + 1)
+        .returning(TournamentSnapshot.tail_count)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+    if tail is None:
+        # First event of a tournament: the tables already contain this change,
+        # start the log from a snapshot of them
+        session.add(
+            TournamentSnapshot(
+                tournament_id=tournament_id,
+                event_id=event.id,
+                state_raw=json.dumps(state_from_tables(session, tournament_id)),
+            )
+        )
+    elif tail >= SNAPSHOT_INTERVAL:
+        take_snapshot(session, tournament_id)
+
+    return event
+
+
+def delete_log(session: Session, tournament_id: int):
+    """
+    Deletes the events and snapshots of a tournament, in the transaction of
+    `session`.
+    """
+    for model in (TournamentSnapshot, TournamentEvent):
+        session.execute(delete(model).where(model.tournament_id == tournament_id))
+
+
+def audit_tournament(session: Session, tournament_id: int) -> List[str]:
+    """
+    Compares the state rebuilt from the log with the tables.
+
+    :return: The paths that differ, empty when the tables match the log.
+    """
+    rebuilt, _ = rebuild_state(session, tournament_id)
+    current = state_from_tables(session, tournament_id)
+
+    def diff(a, b, path=""):
+        if isinstance(a, dict) and isinstance(b, dict):
+            for key in sorted(set(a) | set(b)):
+                yield from diff(a.get(key), b.get(key), f"{path}/{key}")
+        elif a != b:
+            yield path or "/"
+
+    return list(diff(rebuilt, current))
@@ -0,0 +1,380 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, NamedTuple, Optional, Type
+
+import orjson
+from pydantic import BaseModel
+from sqlalchemy import update
+from sqlmodel import Session, func, select
+
+from ..api_models import ArcherImportParams, SeriesRecountParams, TournamentExportParams
+from ..models.constants import JobStatus, TournamentStage
+from ..models.models import Archer, Job, Match, Series, Tournament
+from ..models.read_models import stage_standings, tournaments_with_everything
+from .metrics import jobs_finished
+from .sqlite import engine, sessions_by_tournament, shard_router, tournament_session
+
+# Worker processes running the jobs, started with the first job
+JOB_WORKERS = int(os.environ.get("SEISHA_JOB_WORKERS", "2"))
+# Rows written or read per transaction by the jobs, between progress reports
+JOB_BATCH_SIZE = int(os.environ.get("SEISHA_JOB_BATCH_SIZE", "500"))
+
+ACTIVE_STATUSES = (JobStatus.QUEUED, JobStatus.RUNNING)
+
+logger = logging.getLogger("seisha.jobs")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Progress:
+    """
+    Handed to a job function to report its progress, which also raises
+    `JobCancelled` once the job is cancelled: jobs stop at their next report.
+    """
+
+    def __init__(self, job_id: int, updates, cancelled):
+        self.job_id = job_id
+        self.updates = updates
+        self.cancelled = cancelled
+
+    def __call__(self, done: int, total: int, message: str = None):
+        if self.cancelled.get(self.job_id):
+            raise JobCancelled()
+        self.updates.put((self.job_id, done / total if total else 1.0, message))
+
+
+class JobKind(NamedTuple):
+    run: Callable[[BaseModel, Progress], object]
+    params: Type[BaseModel]
+    # Called in the server process with the result of a successful job, to
+    # refresh what the server holds in memory
+    succeeded: Optional[Callable[[Session, dict], None]] = None
+
+
+JOB_KINDS: Dict[str, JobKind] = {}
+
+
+def job_kind(
+    name: str, params: Type[BaseModel], succeeded: Callable[[Session, dict], None] = None
+):
+    def register(function):
+        JOB_KINDS[name] = JobKind(function, params, succeeded)
+        return function
+
+    return register
+
+
+def run(job_id: int, kind: str, params: dict, updates, cancelled):
+    """
+    Entry point of a job in a worker process.
+    """
+    progress = Progress(job_id, updates, cancelled)
+    progress(0, 1, "Started")
+    job = JOB_KINDS[kind]
+    return job.run(job.params.model_validate(params), progress)
+
+
+@job_kind("tournament_export", TournamentExportParams)
+def export_tournament(params: TournamentExportParams, progress: Progress):
+    """
+    The whole tournament document with the standings of both stages.
+    """
+    with Session(engine) as session:
+        tournament = session.get(Tournament, params.tournament_id)
+        if tournament is None:
+            raise ValueError("Tournament not found")
+        if tournament.purged:
+            raise ValueError("Tournament is purged, its results are in its result snapshot")
+
+        with tournament_session(session, params.tournament_id) as shard_session:
+            document = tournaments_with_everything(shard_session, [params.tournament_id])[0]
+            progress(1, 3, "Tournament read")
+            standings = {}
+            for done, stage in enumerate((TournamentStage.QUALIFIERS, TournamentStage.FINALS), 2):
+                standings[stage.value] = stage_standings(
+                    shard_session, {**document, "current_stage": stage}
+                )
+                progress(done, 3, f"Standings of the {stage.value} computed")
+
+    return {"tournament": document, "standings": standings}
+
+
+@job_kind("archer_import", ArcherImportParams)
+def import_archers(params: ArcherImportParams, progress: Progress):
+    """
+    Creates archers in batches. A cancelled import keeps the archers of the
+    batches already committed.
+    """
+    ids = []
+    total = len(params.archers)
+    with Session(engine) as session:
+        for start in range(0, total, JOB_BATCH_SIZE):
+            archers = [
+                Archer(name=archer.name, position=archer.position)
+                for archer in params.archers[start : start + JOB_BATCH_SIZE]
+            ]
+            session.add_all(archers)
+            session.commit()
+            ids.extend(archer.id for archer in archers)
+            progress(len(ids), total, f"{len(ids)} archers created")
+
+    return {"ids": ids}
+
+
+def refresh_recounted(session: Session, result: dict):
+    """
+    Reloads the live documents and result snapshots of the recounted
+    tournaments, which hold the series counters.
+    """
+    # Imported here: the workers import this module, and have no use for the
+    # caches of the server
+    from .live_store import live_store
+    from .result_snapshots import result_snapshots
+
+    for tournament_id in result["tournaments"]:
+        live_store.update_tournament(session, tournament_id)
+        result_snapshots.update(session, tournament_id)
+
+
+@job_kind("series_recount", SeriesRecountParams, succeeded=refresh_recounted)
+def recount_series(params: SeriesRecountParams, progress: Progress):
+    """
+    Recomputes the counters denormalized from the arrows of every series,
+    e.g. after editing `arrows_raw` by hand.
+    """
+    with Session(engine) as session:
+        tournament_ids = params.tournament_ids
+        if tournament_ids is None:
+            tournament_ids = session.exec(select(Tournament.id)).all()
+
+        # Every session (shard) weighs the same in the progress
+        total = len(tournament_ids) if shard_router is not None else 1
+        counted = changed = 0
+        for sessions_done, (shard_session, ids) in enumerate(
+            sessions_by_tournament(session, tournament_ids)
+        ):
+            series_ids = shard_session.exec(
+                select(Series.id)
+                .join(Match, Match.id == Series.match_id)
+                .where(Match.tournament_id.in_(ids))
+                .order_by(Series.id)
+            ).all()
+            for start in range(0, len(series_ids), JOB_BATCH_SIZE):
+                batch = shard_session.exec(
+                    select(Series).where(
+                        Series.id.in_(series_ids[start : start + JOB_BATCH_SIZE])
+                    )
+                ).all()
+                for series in batch:
+                    counters = (series.hits, series.ensures, series.arrows_shot)
+                    series.count_arrows()
+                    changed += counters != (series.hits, series.ensures, series.arrows_shot)
+                shard_session.commit()
+                counted += len(batch)
+                progress(
+                    sessions_done + (start + len(batch)) / len(series_ids),
+                    total,
+                    f"{counted} series recounted",
+                )
+            progress(sessions_done + 1, total, f"{counted} series recounted")
+
+    return {"series": counted, "changed": changed, "tournaments": list(tournament_ids)}
+
+
+class JobRunner:
+    """
+    Runs the jobs in a pool of worker processes, so that exports, imports and
+    recounts use the other cores instead of stalling the event loop, and
+    tracks them in the `Job` table.
+
+    Workers report their progress through a queue drained by `pump`, which
+    writes it to the table and broadcasts a `job updated` event. The pool is
+    started with the first job, so a server that never runs one pays nothing.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.manager = None
+        self.updates = None
+        # Ids of the running jobs asked to stop, read by their `Progress`
+        self.cancelled = None
+        self.futures: Dict[int, Future] = {}
+        self.tasks = set()
+        self.broadcast = None
+
+    async def start(self, broadcast: Callable):
+        self.broadcast = broadcast
+        # Jobs of a previous run died with its workers
+        with Session(engine) as session:
+            session.execute(
+                update(Job)
+                .where(Job.status.in_(ACTIVE_STATUSES))
+                .values(
+                    status=JobStatus.FAILED,
+                    error="Interrupted by a server restart",
+                    finished_at=func.now(),
+                )
+            )
+            session.commit()
+
+    async def stop(self):
+        if self.executor is None:
+            return
+
+        for job_id in self.futures:
+            self.cancelled[job_id] = True
+        await asyncio.to_thread(self.executor.shutdown, wait=True, cancel_futures=True)
+        self.updates.put(None)
+        for task in list(self.tasks):
+            task.cancel()
+        self.manager.shutdown()
+        self.executor = None
+
+    def ensure_pool(self):
+        if self.executor is not None:
+            return
+
+        # Forking a process running threads (the event loop's executors, the
+        # journal flusher) can deadlock the child
+        context = multiprocessing.get_context("spawn")
+        self.manager = context.Manager()
+        self.updates = self.manager.Queue()
+        self.cancelled = self.manager.dict()
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=context)
+        self.spawn(self.pump())
+
+    def spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def submit(self, session: Session, kind: str, params: BaseModel) -> Job:
+        job = Job(kind=kind, params_raw=params.model_dump_json())
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+
+        self.ensure_pool()
+        future = self.executor.submit(
+            run, job.id, kind, params.model_dump(mode="json"), self.updates, self.cancelled
+        )
+        self.futures[job.id] = future
+        self.spawn(self.watch(job.id, kind, future))
+        await self.notify(job)
+        return job
+
+    async def cancel(self, session: Session, job: Job) -> Job:
+        """
+        Cancels a queued job at once, and a running one at its next progress
+        report.
+        """
+        future = self.futures.get(job.id)
+        if job.status not in ACTIVE_STATUSES or future is None:
+            return job
+
+        job.cancel_requested = True
+        session.add(job)
+        session.commit()
+        if not future.cancel():
+            self.cancelled[job.id] = True
+        # A cancelled future is finished by `watch`
+        session.refresh(job)
+        return job
+
+    async def watch(self, job_id: int, kind: str, future: Future):
+        values = {}
+        try:
+            result = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise
+            status = JobStatus.CANCELLED
+        except JobCancelled:
+            status = JobStatus.CANCELLED
+        except Exception as error:
+            logger.warning("Job %s (%s) failed: %r", job_id, kind, error)
+            status = JobStatus.FAILED
+            values["error"] = str(error) or type(error).__name__
+        else:
+            status = JobStatus.SUCCEEDED
+            values["progress"] = 1.0
+            values["result_raw"] = orjson.dumps(result).decode()
+        finally:
+            self.futures.pop(job_id, None)
+            if self.cancelled is not None:
+                self.cancelled.pop(job_id, None)
+
+        jobs_finished.inc(kind=kind, status=status.value)
+        with Session(engine) as session:
+            succeeded = JOB_KINDS[kind].succeeded
+            if status == JobStatus.SUCCEEDED and succeeded is not None:
+                try:
+                    succeeded(session, result)
+                except Exception:
+                    logger.exception("Refreshing after job %s (%s) failed", job_id, kind)
+            session.execute(
+                update(Job)
+                .where(Job.id == job_id)
+                .values(status=status, finished_at=func.now(), **values)
+            )
+            session.commit()
+            await self.notify(session.get(Job, job_id))
+
+    async def pump(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            report = await loop.run_in_executor(None, self.updates.get)
+            if report is None:
+                return
+
+            # Only the latest report of each job is written
+            latest = {report[0]: report}
+            try:
+                while True:
+                    report = self.updates.get_nowait()
+                    if report is None:
+                        self.updates.put(None)
+                        break
+                    latest[report[0]] = report
+            except queue.Empty:
+                pass
+
+            with Session(engine) as session:
+                for job_id, progress, message in latest.values():
+                    job = session.get(Job, job_id)
+                    # Reports can arrive after the job finished
+                    if job is None or job.status not in ACTIVE_STATUSES:
+                        continue
+                    if job.status == JobStatus.QUEUED:
+                        job.status = JobStatus.RUNNING
+                        job.started_at = func.now()
+                    job.progress = progress
+                    job.message = message
+                    session.add(job)
+                    session.commit()
+                    session.refresh(job)
+                    await self.notify(job)
+
+    async def notify(self, job: Job):
+        if self.broadcast is None:
+            return
+        await self.broadcast(
+            "job updated",
+            {
+                "id": job.id,
+                "kind": job.kind,
+                "status": job.status,
+                "progress": job.progress,
+                "message": job.message,
+            },
+        )
+
+
+job_runner = JobRunner()
@@ -0,0 +1,364 @@
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from ..models.constants import TournamentStatus
+from ..models.models import Match, Tournament
+from ..models.read_models import (
+    ARCHER_FIELDS,
+    ARCHER_LINK_FIELDS,
+    MATCH_FIELDS,
+    SERIES_FIELDS,
+    TEAM_FIELDS,
+    TEAM_MEMBER_DEFAULTS,
+    TOURNAMENT_FIELDS,
+    Shape,
+    join_path,
+    load_matches_with_series,
+    tournaments_with_everything,
+)
+from .backplane import BACKPLANE
+from .metrics import live_store_reads, live_store_tournaments
+from .sqlite import sessions_by_tournament, tournament_session
+
+# Every worker would hold its own copy, only the writes it served would reach
+# it: the store is on by default for a single worker only
+LIVE_STORE_ENABLED = (
+    os.environ.get("SEISHA_LIVE_STORE", "1" if BACKPLANE == "local" else "0") == "1"
+)
+
+ARCHER_ID = ARCHER_FIELDS.index("id")
+
+
+class LiveSeries:
+    __slots__ = ("row", "archer")
+
+    def __init__(self, row: tuple, archer: tuple):
+        self.row = row
+        self.archer = archer
+
+
+class LiveMatch:
+    __slots__ = ("row", "series", "archers")
+
+    def __init__(self, row: tuple, series: List[LiveSeries], archers: List[tuple]):
+        self.row = row
+        self.series = series
+        self.archers = archers
+
+
+class LiveTeam:
+    __slots__ = ("row", "members")
+
+    def __init__(self, row: tuple, members: List[Tuple[int, tuple]]):
+        self.row = row
+        # (number, archer row) of every member
+        self.members = members
+
+
+class LiveTournament:
+    __slots__ = ("row", "archers", "teams", "matches")
+
+    def __init__(
+        self,
+        row: tuple,
+        archers: List[Tuple[tuple, tuple]],
+        teams: List[LiveTeam],
+        matches: Dict[int, LiveMatch],
+    ):
+        self.row = row
+        # (link row, archer row) of every participant
+        self.archers = archers
+        self.teams = teams
+        # In id order
+        self.matches = matches
+
+    def put_match(self, match_id: int, match: LiveMatch):
+        appended = match_id not in self.matches
+        self.matches[match_id] = match
+        if appended and len(self.matches) > 1 and match_id < max(self.matches):
+            self.matches = dict(sorted(self.matches.items()))
+
+    def archer_ids(self) -> set:
+        ids = {archer[ARCHER_ID] for _, archer in self.archers}
+        ids.update(archer[ARCHER_ID] for team in self.teams for _, archer in team.members)
+        for match in self.matches.values():
+            ids.update(archer[ARCHER_ID] for archer in match.archers)
+            ids.update(series.archer[ARCHER_ID] for series in match.series)
+        return ids
+
+
+def row_of(document: dict, fields: List[str]) -> tuple:
+    return tuple(document[field] for field in fields)
+
+
+def archer_row(archer: dict, archers: Dict[int, tuple]) -> tuple:
+    """
+    The row of an archer, shared by every place it appears in a tournament.
+    """
+    row = archers.get(archer["id"])
+    if row is None:
+        row = archers[archer["id"]] = row_of(archer, ARCHER_FIELDS)
+    return row
+
+
+def build_match(match: dict, archers: Dict[int, tuple]) -> LiveMatch:
+    return LiveMatch(
+        row_of(match, MATCH_FIELDS),
+        [
+            LiveSeries(row_of(series, SERIES_FIELDS), archer_row(series["archer"], archers))
+            for series in match["series"]
+        ],
+        [archer_row(archer, archers) for archer in match["archers"]],
+    )
+
+
+def build_tournament(tournament: dict) -> LiveTournament:
+    archers = {}
+    return LiveTournament(
+        row_of(tournament, TOURNAMENT_FIELDS),
+        [
+            (row_of(link, ARCHER_LINK_FIELDS), archer_row(link["archer"], archers))
+            for link in tournament["archers"]
+        ],
+        [
+            LiveTeam(
+                row_of(team, TEAM_FIELDS),
+                [
+                    (member["number"], archer_row(member["archer"], archers))
+                    for member in team["archers"]
+                ],
+            )
+            for team in tournament["teams"]
+        ],
+        {match["id"]: build_match(match, archers) for match in tournament["matches"]},
+    )
+
+
+def picker(shape: Shape, path: str):
+    """
+    Returns the function turning a row of the relationship at `path` into the
+    dict of the fields requested by `shape`.
+    """
+    fields = shape.relations[path]
+    pairs = [(field, fields.index(field)) for field in shape.columns(path)]
+    return lambda row: {field: row[i] for field, i in pairs}
+
+
+def archer_document(row: tuple) -> dict:
+    return dict(zip(ARCHER_FIELDS, row))
+
+
+def match_renderer(shape: Shape, prefix: str = ""):
+    """
+    Returns the function rendering a `LiveMatch` like `load_matches_with_series`
+    does for the same shape.
+    """
+    series_path = join_path(prefix, "series")
+    archers_path = join_path(prefix, "archers")
+    include_series = shape.includes(series_path)
+    include_archers = shape.includes(archers_path)
+    match_fields = picker(shape, prefix)
+    series_fields = picker(shape, series_path)
+    archer_fields = picker(shape, archers_path)
+
+    def render(match: LiveMatch) -> dict:
+        document = match_fields(match.row)
+        if include_series:
+            series_documents = []
+            for series in match.series:
+                series_document = series_fields(series.row)
+                series_document["archer"] = archer_document(series.archer)
+                series_documents.append(series_document)
+            document["series"] = series_documents
+        if include_archers:
+            document["archers"] = [archer_fields(archer) for archer in match.archers]
+        return document
+
+    return render
+
+
+def tournament_renderer(shape: Shape):
+    """
+    Returns the function rendering a `LiveTournament` like
+    `tournaments_with_everything` does for the same shape.
+    """
+    tournament_fields = picker(shape, "")
+    team_fields = picker(shape, "teams")
+    link_fields = picker(shape, "archers")
+    render_match = match_renderer(shape, "matches")
+
+    def render_team(team: LiveTeam) -> dict:
+        document = team_fields(team.row)
+        if shape.includes("teams.archers"):
+            document["archers"] = [
+                {"archer": archer_document(archer), "number": number, **TEAM_MEMBER_DEFAULTS}
+                for number, archer in team.members
+            ]
+        return document
+
+    def render_link(link: tuple, archer: tuple) -> dict:
+        document = {"archer": archer_document(archer)}
+        document.update(link_fields(link))
+        return document
+
+    def render(tournament: LiveTournament) -> dict:
+        document = tournament_fields(tournament.row)
+        if shape.includes("matches"):
+            document["matches"] = [render_match(m) for m in tournament.matches.values()]
+        if shape.includes("teams"):
+            document["teams"] = [render_team(team) for team in tournament.teams]
+        if shape.includes("archers"):
+            document["archers"] = [render_link(*link) for link in tournament.archers]
+        return document
+
+    return render
+
+
+class LiveStore:
+    """
+    Process-local copy of the live tournaments, with their matches, series and
+    rosters, serving their reads without querying the database.
+
+    The store is warmed at startup and kept up to date write-through: every
+    route changing a tournament calls one of the `update_*` methods once its
+    transaction is committed, which reloads the changed part. Documents are
+    rendered from the stored rows for the requested `Shape`, identical to the
+    ones built by the read models.
+    """
+
+    def __init__(self, enabled: bool = LIVE_STORE_ENABLED):
+        self.enabled = enabled
+        self.tournaments: Dict[int, LiveTournament] = {}
+        # Tournament of every stored match
+        self.match_tournaments: Dict[int, int] = {}
+
+    def warm(self, session: Session):
+        if not self.enabled:
+            return
+
+        self.tournaments.clear()
+        self.match_tournaments.clear()
+        tournament_ids = session.exec(
+            select(Tournament.id).where(Tournament.status == TournamentStatus.LIVE)
+        ).all()
+        for shard_session, ids in sessions_by_tournament(session, tournament_ids):
+            for tournament in tournaments_with_everything(shard_session, ids):
+                self.put(tournament)
+
+    def put(self, tournament: dict):
+        self.drop(tournament["id"])
+        self.tournaments[tournament["id"]] = build_tournament(tournament)
+        self.tournaments = dict(sorted(self.tournaments.items()))
+        for match in tournament["matches"]:
+            self.match_tournaments[match["id"]] = tournament["id"]
+        live_store_tournaments.set(len(self.tournaments))
+
+    def drop(self, tournament_id: int):
+        tournament = self.tournaments.pop(tournament_id, None)
+        if tournament is not None:
+            for match_id in tournament.matches:
+                self.match_tournaments.pop(match_id, None)
+        live_store_tournaments.set(len(self.tournaments))
+
+    def live_tournaments(self, shape: Shape) -> Optional[List[dict]]:
+        """
+        :return: The documents of the live tournaments, None when the store is
+            disabled.
+        """
+        if not self.enabled:
+            return None
+        live_store_reads.inc(result="hit")
+        render = tournament_renderer(shape)
+        return [render(tournament) for tournament in self.tournaments.values()]
+
+    def tournament(self, tournament_id: int, shape: Shape) -> Optional[dict]:
+        """
+        :return: The document of the tournament, None when it is not live.
+        """
+        if not self.enabled:
+            return None
+        tournament = self.tournaments.get(tournament_id)
+        live_store_reads.inc(result="miss" if tournament is None else "hit")
+        if tournament is None:
+            return None
+        return tournament_renderer(shape)(tournament)
+
+    def match(self, match_id: int, shape: Shape) -> Optional[dict]:
+        """
+        :return: The document of the match, None when its tournament is not
+            live.
+        """
+        if not self.enabled:
+            return None
+        tournament_id = self.match_tournaments.get(match_id)
+        live_store_reads.inc(result="miss" if tournament_id is None else "hit")
+        if tournament_id is None:
+            return None
+        match = self.tournaments[tournament_id].matches[match_id]
+        return match_renderer(shape)(match)
+
+    def update_tournament(self, session: Session, tournament_id: int):
+        """
+        Reloads a tournament after a change, storing it when it is live and
+        dropping it otherwise (finished, deleted).
+        """
+        if not self.enabled:
+            return
+
+        status = session.exec(
+            select(Tournament.status).where(Tournament.id == tournament_id)
+        ).first()
+        if status != TournamentStatus.LIVE:
+            self.drop(tournament_id)
+            return
+        with tournament_session(session, tournament_id) as shard_session:
+            self.put(tournaments_with_everything(shard_session, [tournament_id])[0])
+
+    def update_matches(self, session: Session, match_ids: Iterable[int]):
+        """
+        Reloads stored matches after their series changed, or drops them when
+        they were deleted. New matches come with `update_tournament`.
+        """
+        if not self.enabled:
+            return
+
+        match_ids = {id for id in match_ids if id in self.match_tournaments}
+        if not match_ids:
+            return
+
+        by_tournament: Dict[int, set] = {}
+        for match_id in match_ids:
+            by_tournament.setdefault(self.match_tournaments[match_id], set()).add(match_id)
+        loaded = {}
+        for tournament_id, ids in by_tournament.items():
+            with tournament_session(session, tournament_id) as shard_session:
+                for matches in load_matches_with_series(
+                    shard_session, Match.id.in_(ids)
+                ).values():
+                    loaded.update((match["id"], match) for match in matches)
+        for match_id in match_ids:
+            tournament = self.tournaments[self.match_tournaments[match_id]]
+            if match_id not in loaded:
+                del tournament.matches[match_id]
+                del self.match_tournaments[match_id]
+                continue
+
+            archers = {archer[ARCHER_ID]: archer for _, archer in tournament.archers}
+            tournament.put_match(match_id, build_match(loaded[match_id], archers))
+
+    def update_archer(self, session: Session, archer_id: int):
+        """
+        Reloads the stored tournaments in which an archer appears, after the
+        archer changed.
+        """
+        if not self.enabled:
+            return
+
+        for tournament_id, tournament in list(self.tournaments.items()):
+            if archer_id in tournament.archer_ids():
+                self.update_tournament(session, tournament_id)
+
+
+live_store = LiveStore()
@@ -0,0 +1,344 @@
+import asyncio
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICS_ENABLED = os.environ.get("SEISHA_METRICS", "1") != "0"
+EVENT_LOOP_LAG_INTERVAL = float(os.environ.get("SEISHA_LOOP_LAG_INTERVAL", "0.5"))
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in pairs)
+    return "{" + inner + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+    def snapshot(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(labels)} {_format_value(value)}"
+            for labels, value in self.values.items()
+        ]
+
+    def snapshot(self):
+        return {_format_labels(labels): value for labels, value in self.values.items()}
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, callback: Callable[[], float] = None):
+        super().__init__(name, help)
+        self.value = 0.0
+        self.callback = callback
+
+    def set(self, value: float):
+        self.value = value
+
+    def get(self) -> float:
+        return self.callback() if self.callback else self.value
+
+    def render(self) -> List[str]:
+        return [f"{self.name} {_format_value(self.get())}"]
+
+    def snapshot(self):
+        return self.get()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+        # labels -> [bucket counts..., +Inf count, sum]
+        self.values: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        row = self.values.get(key)
+        if row is None:
+            row = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        row[bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, row in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row):
+                cumulative += count
+                le = ("le", _format_value(bound))
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(labels, le)} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {row[-1]!r}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+    def snapshot(self):
+        return {
+            _format_labels(labels): {
+                "count": sum(row[:-1]),
+                "sum": row[-1],
+                "buckets": dict(zip(map(_format_value, self.buckets + (float("inf"),)), row[:-1])),
+            }
+            for labels, row in self.values.items()
+        }
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+
+registry = Registry()
+
+http_requests = registry.register(
+    Counter("seisha_http_requests_total", "HTTP requests by route, method and status")
+)
+http_latency = registry.register(
+    Histogram("seisha_http_request_duration_seconds", "HTTP request latency by route")
+)
+http_db_statements = registry.register(
+    Histogram(
+        "seisha_http_request_db_statements",
+        "SQL statements executed per HTTP request",
+        COUNT_BUCKETS,
+    )
+)
+http_db_time = registry.register(
+    Histogram(
+        "seisha_http_request_db_duration_seconds",
+        "Time spent executing SQL per HTTP request",
+    )
+)
+http_compressions = registry.register(
+    Counter(
+        "seisha_http_compressions_total",
+        "Compressed responses by encoding and whether the body was cached",
+    )
+)
+db_statements = registry.register(
+    Counter("seisha_db_statements_total", "SQL statements executed")
+)
+db_statement_latency = registry.register(
+    Histogram("seisha_db_statement_duration_seconds", "SQL statement latency")
+)
+db_slow_statements = registry.register(
+    Counter(
+        "seisha_db_slow_statements_total",
+        "SQL statements over the slow query threshold",
+    )
+)
+ws_connections = registry.register(
+    Gauge("seisha_ws_connections", "Active WebSocket connections")
+)
+ws_connects = registry.register(
+    Counter(
+        "seisha_ws_connects_total",
+        "WebSocket connection attempts by result (accepted, or the cap rejecting it)",
+    )
+)
+ws_disconnects = registry.register(
+    Counter(
+        "seisha_ws_disconnects_total",
+        "WebSocket disconnections by reason (closed, idle, send_failed)",
+    )
+)
+sse_connections = registry.register(
+    Gauge("seisha_sse_connections", "Active Server-Sent Events streams")
+)
+ws_broadcasts = registry.register(
+    Counter("seisha_ws_broadcasts_total", "WebSocket broadcasts by event")
+)
+ws_broadcast_latency = registry.register(
+    Histogram(
+        "seisha_ws_broadcast_duration_seconds",
+        "Time to fan out one broadcast to every connection",
+    )
+)
+ws_dropped_messages = registry.register(
+    Counter(
+        "seisha_ws_dropped_messages_total",
+        "WebSocket messages that could not be delivered",
+    )
+)
+ws_coalesced_events = registry.register(
+    Counter(
+        "seisha_ws_coalesced_events_total",
+        "Broadcasts merged into another frame of the same coalescing window",
+    )
+)
+live_store_reads = registry.register(
+    Counter(
+        "seisha_live_store_reads_total",
+        "Reads of the live tournament store by whether the document was held",
+    )
+)
+live_store_tournaments = registry.register(
+    Gauge("seisha_live_store_tournaments", "Tournaments held by the live store")
+)
+result_snapshot_reads = registry.register(
+    Counter(
+        "seisha_result_snapshot_reads_total",
+        "Reads of finished tournaments served from their result snapshot, by document",
+    )
+)
+jobs_finished = registry.register(
+    Counter("seisha_jobs_finished_total", "Background jobs finished, by kind and status")
+)
+event_loop_lag = registry.register(
+    Histogram("seisha_event_loop_lag_seconds", "Event loop scheduling lag")
+)
+
+
+def snapshot() -> dict:
+    """
+    Returns the current value of every metric, keyed by metric name.
+    """
+    return registry.snapshot()
+
+
+class RequestStats:
+    __slots__ = ("statements", "db_time")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar(
+    "current_request", default=None
+)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._seisha_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._seisha_start
+
+    db_statements.inc()
+    db_statement_latency.observe(elapsed)
+
+    stats = current_request.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_time += elapsed
+
+
+def instrument_engine(engine: Engine):
+    if not METRICS_ENABLED:
+        return
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def route_name(scope) -> str:
+    route = scope.get("route")
+    # Unmatched paths are grouped to keep the label cardinality bounded
+    return route.path if route is not None else "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency and SQL usage of every HTTP request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request.reset(token)
+
+            route = route_name(scope)
+            http_requests.inc(route=route, method=scope["method"], status=str(status))
+            http_latency.observe(elapsed, route=route)
+            http_db_statements.observe(stats.statements, route=route)
+            http_db_time.observe(stats.db_time, route=route)
+
+
+async def monitor_event_loop_lag(interval: float = EVENT_LOOP_LAG_INTERVAL):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        event_loop_lag.observe(max(0.0, loop.time() - start - interval))
@@ -0,0 +1,218 @@
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import List, Optional
+from urllib.parse import parse_qs
+
+from starlette.datastructures import MutableHeaders
+
+from .metrics import route_name
+
+# Secret enabling the profiling of a request with the `X-Profile` header or
+# the `profile` query parameter, and guarding the profile endpoints, which
+# are disabled without it
+PROFILE_TOKEN = os.environ.get("SEISHA_PROFILE_TOKEN", "")
+# Fraction of the requests profiled without being asked, e.g. 0.01
+PROFILE_SAMPLE_RATE = float(os.environ.get("SEISHA_PROFILE_SAMPLE_RATE", "0"))
+PROFILING_ENABLED = bool(PROFILE_TOKEN) or PROFILE_SAMPLE_RATE > 0
+PROFILE_DIR = os.environ.get("SEISHA_PROFILE_DIR", "profiles")
+# Seconds between two stack samples
+PROFILE_INTERVAL = float(os.environ.get("SEISHA_PROFILE_INTERVAL", "0.001"))
+# Number of profiles kept, the oldest ones are deleted
+PROFILE_KEEP = int(os.environ.get("SEISHA_PROFILE_KEEP", "200"))
+
+logger = logging.getLogger("seisha.profiling")
+
+_profile_id = re.compile(r"^[0-9]+-[0-9a-f]{8}$")
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{frame.f_globals.get('__name__', '?')}:{name}".replace(";", ",")
+
+
+def fold(frame) -> str:
+    """
+    The stack of a frame in the folded format of flame graphs, root first.
+    """
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Sampler(threading.Thread):
+    """
+    Samples the stack of a thread every `interval` seconds and counts the
+    folded stacks seen. Only the sampling thread pays for the profile, the
+    sampled thread runs untouched.
+    """
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL):
+        super().__init__(name="seisha-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[fold(frame)] += 1
+
+    def stop(self) -> Counter:
+        self.stopped.set()
+        self.join()
+        return self.stacks
+
+
+class ProfileStore:
+    """
+    Profiles written to `directory`, one folded stacks file (`<id>.folded`,
+    readable by flamegraph.pl or speedscope) and one metadata file
+    (`<id>.json`) each. Ids start with the timestamp, so they sort by age.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR, keep: int = PROFILE_KEEP):
+        self.directory = directory
+        self.keep = keep
+
+    def new_id(self) -> str:
+        return f"{time.time_ns() // 1_000_000}-{uuid.uuid4().hex[:8]}"
+
+    def save(self, profile_id: str, stacks: Counter, metadata: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"{profile_id}.folded"), "w") as file:
+            for stack, count in stacks.most_common():
+                file.write(f"{stack} {count}\n")
+        with open(os.path.join(self.directory, f"{profile_id}.json"), "w") as file:
+            json.dump({"id": profile_id, **metadata}, file)
+
+        for old_id in self.ids()[self.keep :]:
+            for extension in ("folded", "json"):
+                path = os.path.join(self.directory, f"{old_id}.{extension}")
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def ids(self) -> List[str]:
+        """
+        Ids of the stored profiles, newest first.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        ids = [
+            name[: -len(".json")]
+            for name in os.listdir(self.directory)
+            if name.endswith(".json")
+        ]
+        return sorted(ids, key=lambda id: int(id.split("-")[0]), reverse=True)
+
+    def list(self, route: str = None, limit: int = 50) -> List[dict]:
+        profiles = []
+        for profile_id in self.ids():
+            with open(os.path.join(self.directory, f"{profile_id}.json")) as file:
+                metadata = json.load(file)
+            if route is None or metadata["route"] == route:
+                profiles.append(metadata)
+                if len(profiles) >= limit:
+                    break
+        return profiles
+
+    def folded(self, profile_id: str) -> Optional[str]:
+        """
+        :return: The folded stacks of a profile, None when it does not exist.
+        """
+        if not _profile_id.match(profile_id):
+            return None
+        path = os.path.join(self.directory, f"{profile_id}.folded")
+        if not os.path.exists(path):
+            return None
+        with open(path) as file:
+            return file.read()
+
+
+profile_store = ProfileStore()
+
+
+def requested(scope) -> bool:
+    """
+    Whether a request asks to be profiled with the profile token, in the
+    `X-Profile` header or the `profile` query parameter.
+    """
+    if not PROFILE_TOKEN:
+        return False
+    for name, value in scope["headers"]:
+        if name == b"x-profile":
+            return value.decode() == PROFILE_TOKEN
+    query = parse_qs(scope.get("query_string", b"").decode())
+    return query.get("profile", [""])[0] == PROFILE_TOKEN
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware profiling the requests that ask for it, or a random
+    sample of them, with a `Sampler` on the event loop thread. The id of the
+    profile is returned in the `X-Profile-Id` header.
+
+    The sampler sees everything the thread runs while the request is in
+    flight, including other requests interleaved with it: one request is
+    profiled at a time, and the profile is only exact on a quiet worker.
+    """
+
+    def __init__(self, app, store: ProfileStore = profile_store):
+        self.app = app
+        self.store = store
+        self.busy = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.busy:
+            return await self.app(scope, receive, send)
+        if not (requested(scope) or random.random() < PROFILE_SAMPLE_RATE):
+            return await self.app(scope, receive, send)
+
+        self.busy = True
+        profile_id = self.store.new_id()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message).append("X-Profile-Id", profile_id)
+            await send(message)
+
+        sampler = Sampler(threading.get_ident())
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            stacks = sampler.stop()
+            elapsed = time.perf_counter() - start
+            self.busy = False
+            try:
+                self.store.save(
+                    profile_id,
+                    stacks,
+                    {
+                        "route": route_name(scope),
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "status": status,
+                        "duration": elapsed,
+                        "samples": sum(stacks.values()),
+                        "timestamp": time.time(),
+                    },
+                )
+            except OSError:
+                logger.exception("Could not store profile %s", profile_id)
@@ -0,0 +1,176 @@
+import json
+import logging
+import os
+import re
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import ORMExecuteState, Session
+
+from .metrics import route_name
+
+# Development only: fingerprinting every statement is too costly for production
+QUERY_CHECK_ENABLED = os.environ.get("SEISHA_QUERY_CHECK", "0") == "1"
+# Maximum number of SQL statements per request, 0 disables the budget
+QUERY_BUDGET = int(os.environ.get("SEISHA_QUERY_BUDGET", "0"))
+# Number of identical statements in one request reported as an N+1 pattern
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("SEISHA_N_PLUS_ONE_THRESHOLD", "5"))
+
+logger = logging.getLogger("seisha.queries")
+
+_string_literal = re.compile(r"'(?:[^']|'')*'")
+_number_literal = re.compile(r"\b\d+(?:\.\d+)?\b")
+_in_list = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_whitespace = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Normalizes a SQL statement so that executions differing only by their
+    literals and bound parameters share the same fingerprint.
+    """
+    statement = _string_literal.sub("?", statement)
+    statement = _number_literal.sub("?", statement)
+    statement = _in_list.sub("IN (...)", statement)
+    return _whitespace.sub(" ", statement).strip()
+
+
+class QueryReport:
+    __slots__ = ("counts", "relationships", "pending_relationship")
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self.relationships: Dict[str, str] = {}
+        self.pending_relationship: Optional[str] = None
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD):
+        return [
+            (statement, count, self.relationships.get(statement))
+            for statement, count in self.counts.most_common()
+            if count >= threshold
+        ]
+
+
+current_report: ContextVar[Optional[QueryReport]] = ContextVar(
+    "current_report", default=None
+)
+
+
+def _do_orm_execute(state: ORMExecuteState):
+    report = current_report.get()
+    if report is None or not state.is_relationship_load:
+        return
+
+    # e.g. "Match.series", picked up by the statement executed right after
+    report.pending_relationship = str(state.loader_strategy_path.path[-1])
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    report = current_report.get()
+    if report is None:
+        return
+
+    key = fingerprint(statement)
+    report.counts[key] += 1
+    if report.pending_relationship is not None:
+        report.relationships.setdefault(key, report.pending_relationship)
+        report.pending_relationship = None
+
+
+def instrument_engine(engine: Engine):
+    if not QUERY_CHECK_ENABLED:
+        return
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    # Session-wide, registered once whatever the number of (shard) engines
+    if not event.contains(Session, "do_orm_execute", _do_orm_execute):
+        event.listen(Session, "do_orm_execute", _do_orm_execute)
+
+
+def log_report(method: str, route: str, report: QueryReport):
+    repeated = report.repeated()
+    over_budget = QUERY_BUDGET and report.total > QUERY_BUDGET
+
+    if not repeated and not over_budget:
+        return
+
+    lines = [f"{method} {route}: {report.total} statements"]
+    if over_budget:
+        lines[0] += f" (budget {QUERY_BUDGET})"
+    for statement, count, relationship in repeated:
+        origin = f" via {relationship}" if relationship else ""
+        lines.append(f"  N+1 {count}x{origin}: {statement}")
+
+    logger.warning("\n".join(lines))
+
+
+class QueryBudgetMiddleware:
+    """
+    Development ASGI middleware reporting repeated statements per request and,
+    when `SEISHA_QUERY_BUDGET` is set, failing requests that exceed it.
+
+    Responses are serialized (and relationships lazily loaded) before the
+    response starts, so the budget is checked when `http.response.start` is
+    sent and the response is replaced by a 500 if it was exceeded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        report = QueryReport()
+        token = current_report.set(report)
+        rejected = False
+
+        async def send_wrapper(message):
+            nonlocal rejected
+
+            if rejected:
+                return
+
+            if (
+                message["type"] == "http.response.start"
+                and QUERY_BUDGET
+                and report.total > QUERY_BUDGET
+            ):
+                rejected = True
+                body = json.dumps(
+                    {
+                        "detail": f"Query budget exceeded: {report.total} statements "
+                        f"(budget {QUERY_BUDGET})",
+                        "repeated": [
+                            {"count": count, "relationship": relationship, "sql": statement}
+                            for statement, count, relationship in report.repeated()
+                        ],
+                    }
+                ).encode()
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": 500,
+                        "headers": [
+                            (b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode()),
+                        ],
+                    }
+                )
+                await send({"type": "http.response.body", "body": body})
+                return
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_report.reset(token)
+            log_report(scope["method"], route_name(scope), report)
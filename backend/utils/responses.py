@@ -0,0 +1,76 @@
+from functools import lru_cache
+from typing import Any, Dict, List
+
+import orjson
+from fastapi import HTTPException, Query, Response
+from pydantic import TypeAdapter
+
+from ..models.read_models import Shape
+
+
+@lru_cache(maxsize=None)
+def get_adapter(model: Any) -> TypeAdapter:
+    return TypeAdapter(model)
+
+
+def dump_model_json(model: Any, content: Any) -> bytes:
+    """
+    Validates `content` (usually ORM objects) against `model` and encodes it
+    straight to JSON bytes with pydantic's serializer.
+    """
+    adapter = get_adapter(model)
+    return adapter.dump_json(adapter.validate_python(content, from_attributes=True))
+
+
+def model_response(model: Any, content: Any, status_code: int = 200) -> Response:
+    """
+    Builds the JSON response for `content` in a single validation pass.
+
+    Returning ORM objects with a `response_model` makes FastAPI validate them,
+    convert the result to JSON-compatible Python objects and only then encode
+    it with `json.dumps`. Routes returning this response skip the last two
+    steps; keep `response_model` on the route for the OpenAPI schema.
+    """
+    return Response(
+        content=dump_model_json(model, content),
+        status_code=status_code,
+        media_type="application/json",
+    )
+
+
+def json_response(content: Any, status_code: int = 200) -> Response:
+    """
+    Encodes already JSON-shaped content (e.g. the prebuilt read models) with
+    orjson, without any validation.
+    """
+    return Response(
+        content=orjson.dumps(content),
+        status_code=status_code,
+        media_type="application/json",
+    )
+
+
+def raw_json_response(body: bytes, status_code: int = 200) -> Response:
+    """
+    Sends JSON that is already encoded, e.g. read from a result snapshot.
+    """
+    return Response(content=body, status_code=status_code, media_type="application/json")
+
+
+def sparse_fieldsets(relations: Dict[str, List[str]], default_include: str = None):
+    """
+    Dependency parsing the `?fields=` and `?include=` parameters of a read
+    into the `Shape` of the document to return. Without `?include=`, the
+    relationships of `default_include` are returned, or all of them.
+    """
+
+    def dependency(
+        fields: str = Query(None, description="Fields to return, e.g. `name,matches.finished`"),
+        include: str = Query(None, description="Relationships to return, e.g. `matches.series,teams`"),
+    ) -> Shape:
+        try:
+            return Shape(relations, fields, include if include is not None else default_include)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return dependency
@@ -0,0 +1,432 @@
+import mmap
+import os
+import struct
+import zlib
+from typing import Dict, Iterable, List, Optional, Set
+
+import orjson
+from sqlalchemy import delete, event, update
+from sqlmodel import Session, select
+
+from ..models.constants import TournamentFormat, TournamentStage, TournamentStatus
+from ..models.models import (
+    Archer,
+    ArcherMatchLink,
+    Match,
+    ScorerReceipt,
+    Series,
+    Tournament,
+    TournamentEvent,
+    TournamentSnapshot,
+)
+from ..models.read_models import (
+    ARCHER_FIELDS,
+    Shape,
+    stage_standings,
+    tournaments_with_everything,
+)
+from .backplane import BACKPLANE
+from .live_store import build_match, build_tournament, match_renderer, tournament_renderer
+from .metrics import result_snapshot_reads
+from .sqlite import sessions_by_tournament, tournament_session
+
+# A worker only discards the snapshots changed by the transactions it
+# committed, the others would keep serving theirs: the snapshots are on by
+# default for a single worker only
+RESULT_SNAPSHOTS_ENABLED = (
+    os.environ.get("SEISHA_RESULT_SNAPSHOTS", "1" if BACKPLANE == "local" else "0")
+    == "1"
+)
+RESULT_SNAPSHOTS_DIR = os.environ.get("SEISHA_RESULT_SNAPSHOTS_DIR", "snapshots")
+# Deletes the rows of a tournament from the tables once its snapshot is written
+PURGE_FINISHED = os.environ.get("SEISHA_PURGE_FINISHED", "0") == "1"
+
+MAGIC = b"SEISHAR1"
+HEADER = struct.Struct("<8sI")
+
+
+class SnapshotFile:
+    """
+    Read-only, memory-mapped snapshot of a finished tournament.
+
+    The file starts with `MAGIC` and the length of the JSON index, followed
+    by the index: the offset and length of every section, the ids of the
+    matches in order and the ids of the archers appearing in the tournament.
+    Each section is a zlib-compressed JSON document.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_length = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError(f"Not a result snapshot: {path}")
+        self.index = orjson.loads(self.map[HEADER.size : HEADER.size + index_length])
+        self.sections: Dict[str, List[int]] = self.index["sections"]
+
+    @property
+    def match_ids(self) -> List[int]:
+        return self.index["matches"]
+
+    @property
+    def archer_ids(self) -> Set[int]:
+        if "archers" not in self.index:
+            # Written before the index listed the archers
+            ids = set()
+            for name in self.sections:
+                ids |= document_archer_ids(orjson.loads(self.section(name)))
+            self.index["archers"] = sorted(ids)
+        return set(self.index["archers"])
+
+    def section(self, name: str) -> bytes:
+        offset, length = self.sections[name]
+        return zlib.decompress(self.map[offset : offset + length])
+
+    def tournament(self) -> bytes:
+        """
+        The JSON of the whole `TournamentWithEverything` document, its matches
+        are stored in their own sections.
+        """
+        head = self.section("tournament")
+        matches = b",".join(self.section(f"match:{id}") for id in self.match_ids)
+        return head[:-1] + b',"matches":[' + matches + b"]}"
+
+    def close(self):
+        self.map.close()
+
+
+def write_snapshot(
+    path: str, sections: Dict[str, bytes], match_ids: List[int], archer_ids: Iterable[int]
+):
+    archer_ids = sorted(archer_ids)
+    compressed = {name: zlib.compress(body, 6) for name, body in sections.items()}
+
+    # The offsets depend on the index length, which depends on the offsets
+    offsets = {}
+    index = b""
+    while True:
+        position = HEADER.size + len(index)
+        for name, body in compressed.items():
+            offsets[name] = [position, len(body)]
+            position += len(body)
+        encoded = orjson.dumps(
+            {"sections": offsets, "matches": match_ids, "archers": archer_ids}
+        )
+        settled = len(encoded) == len(index)
+        index = encoded
+        if settled:
+            break
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(index)))
+        file.write(index)
+        for body in compressed.values():
+            file.write(body)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def arrow_matrices(tournament: dict) -> List[dict]:
+    matrices = []
+    for match in tournament["matches"]:
+        archer_ids = [archer["id"] for archer in match["archers"]]
+        rows = {archer_id: [] for archer_id in archer_ids}
+        for series in match["series"]:
+            rows.setdefault(series["archer"]["id"], []).extend(orjson.loads(series["arrows_raw"]))
+        matrices.append(
+            {"match_id": match["id"], "archer_ids": list(rows), "arrows": list(rows.values())}
+        )
+    return matrices
+
+
+def is_archer(document: dict) -> bool:
+    return "position" in document and "accuracy" in document
+
+
+def document_archer_ids(document) -> Set[int]:
+    """
+    Ids of the archers embedded anywhere in a tournament or match document.
+    """
+    ids = set()
+    if isinstance(document, dict):
+        if is_archer(document):
+            ids.add(document["id"])
+        for value in document.values():
+            ids |= document_archer_ids(value)
+    elif isinstance(document, list):
+        for value in document:
+            ids |= document_archer_ids(value)
+    return ids
+
+
+def replace_archer(document, archer: dict):
+    """
+    Updates, in place, the copies of an archer embedded in a document.
+    """
+    if isinstance(document, dict):
+        if is_archer(document) and document["id"] == archer["id"]:
+            document.update(archer)
+            return
+        for value in document.values():
+            replace_archer(value, archer)
+    elif isinstance(document, list):
+        for value in document:
+            replace_archer(value, archer)
+
+
+class ResultSnapshots:
+    """
+    Compressed, immutable snapshots of the finished tournaments, one file per
+    tournament, serving their reads without querying the tables.
+
+    A snapshot is written when a tournament is finished (`update`), or at
+    startup for the finished tournaments without one, and holds the whole
+    tournament document, every match document, the standings of both stages
+    and the arrow matrices. It is deleted when the tournament is reopened,
+    deleted, or changed by a transaction recording a tournament event; reads
+    then go to the tables until it is finished again. It is rewritten when
+    its roster, its teams or one of its archers change. The snapshot of a
+    purged tournament is kept until the tournament is deleted, changes to its
+    archers are patched into it.
+    """
+
+    def __init__(self, directory: str = RESULT_SNAPSHOTS_DIR, enabled: bool = RESULT_SNAPSHOTS_ENABLED):
+        self.directory = directory
+        self.enabled = enabled
+        self.files: Dict[int, SnapshotFile] = {}
+        # Tournament of every match held in a snapshot
+        self.match_tournaments: Dict[int, int] = {}
+        # Tournaments whose snapshot is the only copy of their matches, kept
+        # until the tournament is deleted
+        self.purged = set()
+
+    def path(self, tournament_id: int) -> str:
+        return os.path.join(self.directory, f"tournament-{tournament_id}.snapshot")
+
+    def start(self):
+        """
+        Discards the snapshots of the tournaments changed by every transaction
+        committed from now on.
+        """
+        listening = event.contains(Session, "after_commit", self.discard_changed)
+        if self.enabled and not listening:
+            event.listen(Session, "after_commit", self.discard_changed)
+
+    def stop(self):
+        if event.contains(Session, "after_commit", self.discard_changed):
+            event.remove(Session, "after_commit", self.discard_changed)
+
+    def warm(self, session: Session):
+        """
+        Maps the existing snapshots, and writes the missing ones.
+        """
+        if not self.enabled:
+            return
+
+        finished = session.exec(
+            select(Tournament.id, Tournament.purged).where(
+                Tournament.status == TournamentStatus.FINISHED
+            )
+        ).all()
+        missing = []
+        for tournament_id, purged in finished:
+            if purged:
+                self.purged.add(tournament_id)
+            if os.path.exists(self.path(tournament_id)):
+                self.load(tournament_id)
+            elif not purged:
+                missing.append(tournament_id)
+        for shard_session, ids in sessions_by_tournament(session, missing):
+            for tournament_id in ids:
+                self.build(shard_session, tournament_id)
+
+    def load(self, tournament_id: int):
+        self.close(tournament_id)
+        snapshot = self.files[tournament_id] = SnapshotFile(self.path(tournament_id))
+        for match_id in snapshot.match_ids:
+            self.match_tournaments[match_id] = tournament_id
+
+    def build(self, session: Session, tournament_id: int):
+        tournaments = tournaments_with_everything(session, [tournament_id])
+        if not tournaments:
+            return
+        tournament = tournaments[0]
+
+        standings = {
+            stage.value: stage_standings(session, {**tournament, "current_stage": stage})
+            for stage in (TournamentStage.QUALIFIERS, TournamentStage.FINALS)
+        }
+        sections = {
+            f"match:{match['id']}": orjson.dumps(match) for match in tournament["matches"]
+        }
+        sections["results"] = orjson.dumps({**standings, "arrows": arrow_matrices(tournament)})
+        head = {key: value for key, value in tournament.items() if key != "matches"}
+        sections["tournament"] = orjson.dumps(head)
+
+        self.close(tournament_id)
+        write_snapshot(
+            self.path(tournament_id),
+            sections,
+            [match["id"] for match in tournament["matches"]],
+            document_archer_ids(tournament),
+        )
+        self.load(tournament_id)
+
+    def update(self, session: Session, tournament_id: int):
+        """
+        Writes the snapshot of a tournament after a change when it is
+        finished, deletes it otherwise. With `PURGE_FINISHED`, the rows of a
+        finished tournament are then deleted from the tables.
+        """
+        if not self.enabled or tournament_id in self.purged:
+            return
+
+        status = session.exec(
+            select(Tournament.status).where(Tournament.id == tournament_id)
+        ).first()
+        if status != TournamentStatus.FINISHED:
+            self.discard(tournament_id)
+            return
+
+        with tournament_session(session, tournament_id) as shard_session:
+            self.build(shard_session, tournament_id)
+            if PURGE_FINISHED:
+                purge(shard_session, tournament_id)
+                self.purged.add(tournament_id)
+
+    def update_archer(self, session: Session, archer_id: int):
+        """
+        Rewrites the snapshots in which an archer appears, after the archer
+        changed. The snapshots of purged tournaments are patched instead, their
+        matches are no longer in the tables.
+        """
+        tournament_ids = [
+            tournament_id
+            for tournament_id, snapshot in self.files.items()
+            if archer_id in snapshot.archer_ids
+        ]
+        if not tournament_ids:
+            return
+
+        archer = session.get(Archer, archer_id)
+        for tournament_id in tournament_ids:
+            if tournament_id not in self.purged:
+                self.update(session, tournament_id)
+            elif archer is not None:
+                # Serialized like the archers of `tournaments_with_everything`
+                fields = {field: getattr(archer, field) for field in ARCHER_FIELDS}
+                self.patch_archer(tournament_id, orjson.loads(orjson.dumps(fields)))
+
+    def patch_archer(self, tournament_id: int, archer: dict):
+        snapshot = self.files[tournament_id]
+        match_ids = snapshot.match_ids
+        archer_ids = snapshot.archer_ids
+        documents = {name: orjson.loads(snapshot.section(name)) for name in snapshot.sections}
+
+        for name, document in documents.items():
+            if name != "results":
+                replace_archer(document, archer)
+        if documents["tournament"]["format"] == TournamentFormat.INDIVIDUAL:
+            # The standings of individual tournaments hold archer names
+            for stage in (TournamentStage.QUALIFIERS, TournamentStage.FINALS):
+                for standing in documents["results"][stage.value]:
+                    if standing["id"] == archer["id"]:
+                        standing["name"] = archer["name"]
+
+        self.close(tournament_id)
+        write_snapshot(
+            self.path(tournament_id),
+            {name: orjson.dumps(document) for name, document in documents.items()},
+            match_ids,
+            archer_ids,
+        )
+        self.load(tournament_id)
+
+    def remove(self, tournament_id: int):
+        """
+        Deletes the snapshot of a deleted tournament, purged or not.
+        """
+        self.purged.discard(tournament_id)
+        self.discard(tournament_id)
+
+    def discard(self, tournament_id: int):
+        if tournament_id in self.purged:
+            return
+        self.close(tournament_id)
+        if os.path.exists(self.path(tournament_id)):
+            os.remove(self.path(tournament_id))
+
+    def close(self, tournament_id: int):
+        snapshot = self.files.pop(tournament_id, None)
+        if snapshot is not None:
+            for match_id in snapshot.match_ids:
+                self.match_tournaments.pop(match_id, None)
+            snapshot.close()
+
+    def discard_changed(self, session: Session):
+        for tournament_id in session.info.pop("changed_tournaments", ()):
+            if tournament_id in self.files:
+                self.discard(tournament_id)
+
+    def tournament(self, tournament_id: int, shape: Shape) -> Optional[bytes]:
+        """
+        :return: The JSON of the tournament document, None without snapshot.
+        """
+        snapshot = self.files.get(tournament_id)
+        if snapshot is None:
+            return None
+        result_snapshot_reads.inc(document="tournament")
+        if shape.complete():
+            return snapshot.tournament()
+        document = build_tournament(orjson.loads(snapshot.tournament()))
+        return orjson.dumps(tournament_renderer(shape)(document))
+
+    def match(self, match_id: int, shape: Shape) -> Optional[bytes]:
+        """
+        :return: The JSON of the match document, None without snapshot.
+        """
+        tournament_id = self.match_tournaments.get(match_id)
+        if tournament_id is None:
+            return None
+        result_snapshot_reads.inc(document="match")
+        body = self.files[tournament_id].section(f"match:{match_id}")
+        if shape.complete():
+            return body
+        return orjson.dumps(match_renderer(shape)(build_match(orjson.loads(body), {})))
+
+    def results(self, tournament_id: int) -> Optional[bytes]:
+        """
+        :return: The JSON of the `TournamentResults` document, None without
+            snapshot.
+        """
+        snapshot = self.files.get(tournament_id)
+        if snapshot is None:
+            return None
+        result_snapshot_reads.inc(document="results")
+        return snapshot.section("results")
+
+
+def purge(session: Session, tournament_id: int):
+    """
+    Deletes the matches, series and event log of a tournament, the bulk of
+    its rows, and flags it as purged: its snapshot is the only copy left of
+    them. Rosters are kept.
+    """
+    match_ids = select(Match.id).where(Match.tournament_id == tournament_id)
+    for statement in (
+        delete(Series).where(Series.match_id.in_(match_ids)),
+        delete(ArcherMatchLink).where(ArcherMatchLink.match_id.in_(match_ids)),
+        delete(ScorerReceipt).where(ScorerReceipt.match_id.in_(match_ids)),
+        delete(Match).where(Match.tournament_id == tournament_id),
+        delete(TournamentSnapshot).where(TournamentSnapshot.tournament_id == tournament_id),
+        delete(TournamentEvent).where(TournamentEvent.tournament_id == tournament_id),
+        update(Tournament).where(Tournament.id == tournament_id).values(purged=True),
+    ):
+        session.execute(statement)
+    session.commit()
+
+
+result_snapshots = ResultSnapshots()
@@ -0,0 +1,43 @@
+import json
+
+from sqlmodel import Session, select
+
+from ..models.constants import MatchArrows, TournamentEventKind
+from ..models.models import Match, Series
+from .event_log import record_event
+
+
+def append_arrow(session: Session, match: Match, archer_id: int, arrow: int) -> Series:
+    """
+    Appends an arrow to the current series of an archer, or starts a new
+    series when it is full, and records it in the tournament log.
+    """
+    series = session.exec(
+        select(Series)
+        .where(
+            Series.archer_id == archer_id,
+            Series.match_id == match.id,
+        )
+        .order_by(Series.id.desc())
+    ).first()
+
+    arrows_per_match = MatchArrows[match.format.name]
+
+    if series and len(series.arrows) < arrows_per_match.value:
+        series.arrows_raw = json.dumps(series.arrows + [arrow])
+    else:
+        series = Series(archer_id=archer_id, match_id=match.id)
+        series.arrows = [arrow]
+
+    session.add(series)
+    session.flush()
+    record_event(
+        session,
+        TournamentEventKind.ARROW,
+        match.tournament_id,
+        match_id=match.id,
+        archer_id=archer_id,
+        series_id=series.id,
+        arrow=arrow,
+    )
+    return series
@@ -0,0 +1,216 @@
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlmodel import SQLModel, create_engine, select
+
+from ..models.models import (
+    ArcherMatchLink,
+    ArcherTeamLink,
+    ArcherTournamentLink,
+    ArrowJournalCheckpoint,
+    Match,
+    ScorerReceipt,
+    Series,
+    ShardRoute,
+    Team,
+    Tournament,
+    TournamentEvent,
+    TournamentSnapshot,
+)
+
+# Tables of the rows belonging to one tournament, stored in its shard. The
+# others (archers, tournaments, shard routes) stay in the catalog.
+SHARD_TABLES = [
+    model.__table__
+    for model in (
+        Match,
+        Series,
+        Team,
+        ArcherMatchLink,
+        ArcherTeamLink,
+        ArcherTournamentLink,
+        TournamentEvent,
+        TournamentSnapshot,
+        ScorerReceipt,
+        ArrowJournalCheckpoint,
+    )
+]
+
+# Path parameters identifying the tournament of a request, and the kind of
+# shard route to look up for them
+ROUTED_PARAMS = {"match_id": "match", "team_id": "team"}
+
+
+class ShardRouter:
+    """
+    Storage split in one SQLite file per tournament (`tournament-<id>.db`)
+    holding its matches, series, teams, links and event log, and the catalog
+    file holding the archers and the tournaments.
+
+    A shard connection has the catalog attached: unqualified table names
+    resolve to the shard first, then to the catalog, so the same queries work
+    on both layouts. Writes to different tournaments take different writer
+    locks. Match and team ids are allocated in the catalog (`ShardRoute`) so
+    that they are unique and can be routed.
+
+    Archived shards are moved to the `archive` directory and attached read
+    only.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        catalog: Engine,
+        catalog_path: str,
+        prepare: Callable[[Engine, List], None],
+    ):
+        self.directory = directory
+        self.archive_directory = os.path.join(directory, "archive")
+        self.catalog = catalog
+        self.catalog_path = os.path.abspath(catalog_path)
+        self.prepare = prepare
+        self.engines: Dict[int, Engine] = {}
+        # Tournament of every match and team looked up so far, they never move
+        self.routes: Dict[tuple, int] = {}
+        self.instruments: List[Callable[[Engine], None]] = []
+        self.lock = threading.Lock()
+
+        os.makedirs(self.archive_directory, exist_ok=True)
+        event.listen(Match, "before_insert", self.allocate_id("match"))
+        event.listen(Team, "before_insert", self.allocate_id("team"))
+
+    def allocate_id(self, kind: str):
+        def allocate(mapper, connection, target):
+            if target.id is None:
+                target.id = connection.execute(
+                    ShardRoute.__table__.insert().values(
+                        kind=kind, tournament_id=target.tournament_id
+                    )
+                ).inserted_primary_key[0]
+            self.routes[(kind, target.id)] = target.tournament_id
+
+        return allocate
+
+    def path(self, tournament_id: int) -> str:
+        return os.path.join(self.directory, f"tournament-{tournament_id}.db")
+
+    def archive_path(self, tournament_id: int) -> str:
+        return os.path.join(self.archive_directory, f"tournament-{tournament_id}.db")
+
+    def instrument(self, callback: Callable[[Engine], None]):
+        """
+        Applies `callback` to every shard engine, opened or to be opened.
+        """
+        with self.lock:
+            self.instruments.append(callback)
+            for engine in self.engines.values():
+                callback(engine)
+
+    def engine(self, tournament_id: int) -> Engine:
+        """
+        Returns the engine of a tournament's shard, creating it on first use.
+        """
+        engine = self.engines.get(tournament_id)
+        if engine is not None:
+            return engine
+
+        with self.lock:
+            engine = self.engines.get(tournament_id)
+            if engine is None:
+                engine = self.open(tournament_id)
+                self.engines[tournament_id] = engine
+        return engine
+
+    def archived(self, tournament_id: int) -> bool:
+        return not os.path.exists(self.path(tournament_id)) and os.path.exists(
+            self.archive_path(tournament_id)
+        )
+
+    def open(self, tournament_id: int) -> Engine:
+        archived = self.archived(tournament_id)
+        if archived:
+            engine = create_engine(
+                f"sqlite:///file:{self.archive_path(tournament_id)}?mode=ro&uri=true"
+            )
+        else:
+            engine = create_engine(f"sqlite:///{self.path(tournament_id)}")
+
+        @event.listens_for(engine, "connect")
+        def attach_catalog(connection, record):
+            connection.execute("ATTACH DATABASE ? AS catalog", (self.catalog_path,))
+
+        if not archived:
+            SQLModel.metadata.create_all(engine, tables=SHARD_TABLES)
+            self.prepare(engine, SHARD_TABLES)
+        for callback in self.instruments:
+            callback(engine)
+        return engine
+
+    def close(self, tournament_id: int):
+        with self.lock:
+            engine = self.engines.pop(tournament_id, None)
+        if engine is not None:
+            engine.dispose()
+
+    def locate(self, kind: str, id: int) -> Optional[int]:
+        """
+        :return: The id of the tournament a match, team or tournament belongs
+            to, None when it does not exist.
+        """
+        key = (kind, id)
+        if key in self.routes:
+            return self.routes[key]
+
+        if kind == "tournament":
+            query = select(Tournament.id).where(Tournament.id == id)
+        else:
+            query = select(ShardRoute.tournament_id).where(
+                ShardRoute.kind == kind, ShardRoute.id == id
+            )
+        with self.catalog.connect() as connection:
+            tournament_id = connection.execute(query).scalar()
+        if tournament_id is not None:
+            self.routes[key] = tournament_id
+        return tournament_id
+
+    def route(self, path_params: dict) -> Engine:
+        """
+        Returns the engine serving a request from its path parameters: the
+        shard of the tournament, match or team addressed, else the catalog.
+        """
+        for name, kind in [("tournament_id", "tournament"), *ROUTED_PARAMS.items()]:
+            if name not in path_params:
+                continue
+            try:
+                tournament_id = self.locate(kind, int(path_params[name]))
+            except ValueError:
+                # Invalid id, rejected by the route's own validation
+                return self.catalog
+            if tournament_id is not None:
+                return self.engine(tournament_id)
+        return self.catalog
+
+    def archive(self, tournament_id: int):
+        """
+        Moves a shard to the archive directory, it is attached read only from
+        then on.
+        """
+        self.close(tournament_id)
+        os.replace(self.path(tournament_id), self.archive_path(tournament_id))
+
+    def restore(self, tournament_id: int):
+        """
+        Moves an archived shard back, making it writable again.
+        """
+        self.close(tournament_id)
+        os.replace(self.archive_path(tournament_id), self.path(tournament_id))
+
+    def remove(self, tournament_id: int):
+        self.close(tournament_id)
+        self.routes.pop(("tournament", tournament_id), None)
+        for path in (self.path(tournament_id), self.archive_path(tournament_id)):
+            if os.path.exists(path):
+                os.remove(path)
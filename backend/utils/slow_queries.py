@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .metrics import db_slow_statements, route_name
+from .query_budget import fingerprint
+
+# Statements slower than this many milliseconds are logged, 0 disables the log
+SLOW_QUERY_THRESHOLD = float(os.environ.get("SEISHA_SLOW_QUERY_MS", "0"))
+SLOW_QUERY_ENABLED = SLOW_QUERY_THRESHOLD > 0
+# JSON lines file of the slow statements, empty to only aggregate them
+SLOW_QUERY_LOG = os.environ.get("SEISHA_SLOW_QUERY_LOG", "slow_queries.log")
+
+logger = logging.getLogger("seisha.slow_queries")
+
+current_scope: ContextVar[Optional[dict]] = ContextVar("current_scope", default=None)
+
+
+def parameter_shape(parameters, executemany: bool):
+    """
+    The types of the bound parameters, without their values.
+    """
+    if executemany:
+        rows = list(parameters)
+        return {"rows": len(rows), "row": parameter_shape(rows[0], False) if rows else []}
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+
+def explain(cursor, statement: str, parameters, executemany: bool) -> List[str]:
+    """
+    The `EXPLAIN QUERY PLAN` of a statement, one line per step indented by
+    depth, run on the raw connection so that it is neither timed nor logged.
+    """
+    if executemany:
+        parameters = next(iter(parameters), ())
+    try:
+        rows = cursor.connection.execute(
+            f"EXPLAIN QUERY PLAN {statement}", parameters or ()
+        ).fetchall()
+    except sqlite3.Error:
+        # Statements without a plan (PRAGMA, BEGIN, ...)
+        return []
+
+    depths = {0: -1}
+    plan = []
+    for id, parent, _, detail in rows:
+        depths[id] = depths.get(parent, -1) + 1
+        plan.append("  " * depths[id] + detail)
+    return plan
+
+
+class SlowQueryLog:
+    """
+    Statements over `threshold` milliseconds, written to the log with their
+    fingerprint, parameter shape, route and query plan, and aggregated per
+    fingerprint. Scans (`SCAN` steps) in the plans of the slowest
+    fingerprints usually point at a missing index.
+    """
+
+    def __init__(self, threshold: float = SLOW_QUERY_THRESHOLD):
+        self.threshold = threshold / 1000
+        self.fingerprints: Dict[str, dict] = {}
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._seisha_slow_start = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._seisha_slow_start
+        if elapsed < self.threshold:
+            return
+
+        scope = current_scope.get()
+        route = route_name(scope) if scope is not None else None
+        key = fingerprint(statement)
+        plan = explain(cursor, statement, parameters, executemany)
+        record = {
+            "timestamp": time.time(),
+            "duration_ms": round(elapsed * 1000, 3),
+            "fingerprint": key,
+            "parameters": parameter_shape(parameters, executemany),
+            "method": scope["method"] if scope is not None else None,
+            "route": route,
+            "plan": plan,
+        }
+        logger.warning(json.dumps(record))
+        db_slow_statements.inc()
+
+        aggregate = self.fingerprints.get(key)
+        if aggregate is None:
+            aggregate = self.fingerprints[key] = {
+                "fingerprint": key,
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "routes": [],
+            }
+        aggregate["count"] += 1
+        aggregate["total_ms"] += record["duration_ms"]
+        aggregate["max_ms"] = max(aggregate["max_ms"], record["duration_ms"])
+        aggregate["plan"] = plan
+        aggregate["scans"] = [step.strip() for step in plan if step.strip().startswith("SCAN ")]
+        if route is not None and route not in aggregate["routes"]:
+            aggregate["routes"].append(route)
+
+    def report(self, limit: int = 50) -> List[dict]:
+        """
+        Fingerprints of the slow statements, by total time spent, worst first.
+        """
+        return sorted(self.fingerprints.values(), key=lambda a: a["total_ms"], reverse=True)[
+            :limit
+        ]
+
+
+slow_query_log = SlowQueryLog()
+
+
+def instrument_engine(engine: Engine):
+    if not SLOW_QUERY_ENABLED:
+        return
+
+    event.listen(engine, "before_cursor_execute", slow_query_log.before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", slow_query_log.after_cursor_execute)
+
+
+def configure_log(path: str = SLOW_QUERY_LOG):
+    """
+    Writes the slow statements to `path`, one JSON document per line.
+    """
+    if not SLOW_QUERY_ENABLED:
+        return
+    if path:
+        handler = logging.FileHandler(path)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+    else:
+        handler = logging.NullHandler()
+    logger.addHandler(handler)
+    logger.propagate = False
+
+
+class SlowQueryMiddleware:
+    """
+    Pure ASGI middleware making the request available to the statement hooks,
+    for the route of the slow statements.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        token = current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_scope.reset(token)
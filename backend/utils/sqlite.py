@@ -1,11 +1,133 @@
-from sqlmodel import Session, create_engine
+import os
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
 
-sqlite_file_name = "tournament.db"
+from fastapi import Request
+from sqlalchemy import inspect, literal, text
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, SQLModel, create_engine
+
+sqlite_file_name = os.environ.get("SEISHA_DB", "tournament.db")
 sqlite_url = f"sqlite:///{sqlite_file_name}"
+# Directory of the per-tournament shards, unset keeps everything in one file
+# (`SEISHA_DB`, which is the catalog otherwise)
+SHARDS_DIR = os.environ.get("SEISHA_SHARDS_DIR")
 
 engine = create_engine(sqlite_url)
 
+# Statements filling a column added to an existing table, run once when the
+# column is added
+BACKFILLS = {
+    ("series", "hits"): "UPDATE series SET hits = "
+    "(SELECT COUNT(*) FROM json_each(series.arrows_raw) WHERE value = 1)",
+    ("series", "ensures"): "UPDATE series SET ensures = "
+    "(SELECT COUNT(*) FROM json_each(series.arrows_raw) WHERE value = 2)",
+    ("series", "arrows_shot"): "UPDATE series SET arrows_shot = "
+    "json_array_length(series.arrows_raw)",
+    ("tournamentsnapshot", "tail_count"): "UPDATE tournamentsnapshot SET tail_count = "
+    "(SELECT COUNT(*) FROM tournamentevent WHERE "
+    "tournamentevent.tournament_id = tournamentsnapshot.tournament_id "
+    "AND tournamentevent.id > tournamentsnapshot.event_id)",
+}
+
+
+def get_session(request: Request):
+    bind = shard_router.route(request.path_params) if shard_router else engine
+    with Session(bind) as session:
+        yield session
+
+
+@contextmanager
+def tournament_session(session: Session, tournament_id: int) -> Iterator[Session]:
+    """
+    Session reaching the tables of a tournament: `session` itself, unless it
+    is bound to another shard.
+    """
+    if shard_router is None:
+        yield session
+        return
 
-def get_session():
-    with Session(engine) as session:
+    bind = shard_router.engine(tournament_id)
+    if session.get_bind() is bind:
         yield session
+        return
+    with Session(bind) as shard_session:
+        yield shard_session
+
+
+def sessions_by_tournament(session: Session, tournament_ids: List[int]):
+    """
+    Yields the sessions reaching the given tournaments, each with the ids of
+    the tournaments it reaches: `session` with all of them unless sharded.
+    """
+    if shard_router is None:
+        yield session, list(tournament_ids)
+        return
+
+    for tournament_id in tournament_ids:
+        with tournament_session(session, tournament_id) as shard_session:
+            yield shard_session, [tournament_id]
+
+
+def match_engine(match_id: int) -> Optional[Engine]:
+    """
+    Returns the engine storing a match, None when it does not exist.
+    """
+    if shard_router is None:
+        return engine
+    tournament_id = shard_router.locate("match", match_id)
+    return shard_router.engine(tournament_id) if tournament_id is not None else None
+
+
+def ensure_columns(engine, tables=None):
+    """
+    Adds the columns declared on the models that an existing table is
+    missing, `create_all` never alters tables, then backfills them.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in tables or SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+
+                definition = f"{column.name} {column.type.compile(engine.dialect)}"
+                if column.default is not None and column.default.is_scalar:
+                    default = literal(column.default.arg, column.type).compile(
+                        dialect=engine.dialect, compile_kwargs={"literal_binds": True}
+                    )
+                    definition += f" NOT NULL DEFAULT {default}"
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {definition}"))
+
+                backfill = BACKFILLS.get((table.name, column.name))
+                if backfill:
+                    connection.execute(text(backfill))
+
+
+def ensure_indexes(engine, tables=None):
+    """
+    Creates the indexes declared on the models that an existing database is
+    missing, `create_all` only adds them along with new tables.
+    """
+    with engine.begin() as connection:
+        for table in tables or SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+
+def prepare_shard(engine, tables):
+    ensure_columns(engine, tables)
+    ensure_indexes(engine, tables)
+
+
+if SHARDS_DIR:
+    # Only imported when sharded: `seed.py` and `setup.py`, run from
+    # `backend/`, import this module outside of the `backend` package
+    from .shards import ShardRouter
+
+    shard_router = ShardRouter(SHARDS_DIR, engine, sqlite_file_name, prepare_shard)
+else:
+    shard_router = None
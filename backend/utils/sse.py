@@ -0,0 +1,77 @@
+import asyncio
+import os
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+# Frames buffered for a slow subscriber before its stream is closed, the
+# browser then reconnects and resumes from its Last-Event-ID
+SSE_QUEUE_SIZE = int(os.environ.get("SEISHA_SSE_QUEUE", "256"))
+# Seconds between comments sent to keep idle connections open through proxies
+SSE_KEEPALIVE = float(os.environ.get("SEISHA_SSE_KEEPALIVE", "15"))
+
+KEEPALIVE_CHUNK = b": keep-alive\n\n"
+
+
+def encode_event(epoch: str, seq: int, frame: str) -> bytes:
+    """
+    Encodes a broadcast frame as a Server-Sent Event. The id carries the epoch
+    so that a resumed stream can tell whether its sequence numbers still mean
+    anything.
+    """
+    return f"id: {epoch}:{seq}\ndata: {frame}\n\n".encode()
+
+
+def parse_event_id(event_id: Optional[str]) -> Tuple[Optional[str], Optional[int]]:
+    """
+    :return: The epoch and sequence number of a `Last-Event-ID` header, or
+        `(None, None)` when it is missing or malformed.
+    """
+    if not event_id:
+        return None, None
+    epoch, _, seq = event_id.rpartition(":")
+    try:
+        return epoch, int(seq)
+    except ValueError:
+        return None, None
+
+
+class Subscription:
+    """
+    Queue of encoded events of one SSE client. The events are encoded once by
+    the manager and shared by every subscription.
+    """
+
+    def __init__(self, topic: str, size: int = SSE_QUEUE_SIZE):
+        self.topic = topic
+        self.size = size
+        self.chunks: Deque[bytes] = deque()
+        self.ready = asyncio.Event()
+        self.overflowed = False
+
+    def push(self, chunk: bytes) -> bool:
+        if len(self.chunks) >= self.size:
+            self.overflowed = True
+            self.ready.set()
+            return False
+        self.chunks.append(chunk)
+        self.ready.set()
+        return True
+
+    async def next(self, keepalive: float = SSE_KEEPALIVE) -> Optional[bytes]:
+        """
+        Waits for the next event.
+
+        :return: The encoded event, a keep-alive comment when nothing happened
+            for `keepalive` seconds, or None once the client fell too far
+            behind and the stream has to end.
+        """
+        if not self.chunks and not self.overflowed:
+            self.ready.clear()
+            try:
+                await asyncio.wait_for(self.ready.wait(), keepalive)
+            except asyncio.TimeoutError:
+                return KEEPALIVE_CHUNK
+
+        if self.overflowed:
+            return None
+        return self.chunks.popleft()
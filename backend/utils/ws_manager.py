@@ -1,22 +1,434 @@
+import asyncio
 import json
-from typing import List
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
 
 from fastapi import WebSocket
 
+from .backplane import Backplane, LocalBackplane
+from .metrics import (
+    sse_connections,
+    ws_broadcast_latency,
+    ws_broadcasts,
+    ws_coalesced_events,
+    ws_connections,
+    ws_connects,
+    ws_disconnects,
+    ws_dropped_messages,
+)
+from .sse import Subscription, encode_event
+
+# Number of recent messages kept per topic for reconnecting clients
+REPLAY_BUFFER_SIZE = int(os.environ.get("SEISHA_WS_REPLAY_BUFFER", "256"))
+# Seconds during which the broadcasts of a topic are merged into one frame,
+# 0 sends every broadcast right away
+COALESCE_WINDOW = float(os.environ.get("SEISHA_WS_COALESCE_WINDOW", "0.05"))
+# Seconds between the pings sent to every socket, 0 disables the heartbeat
+PING_INTERVAL = float(os.environ.get("SEISHA_WS_PING_INTERVAL", "20"))
+# Seconds a ping or a broadcast may take to be sent before the socket is
+# considered dead
+PING_TIMEOUT = float(os.environ.get("SEISHA_WS_PING_TIMEOUT", "5"))
+# Sockets from which nothing (pong or other message) was received for that
+# many seconds are closed
+IDLE_TIMEOUT = float(os.environ.get("SEISHA_WS_IDLE_TIMEOUT", "60"))
+# Connection caps, for the worker and per client address, 0 for no cap
+MAX_CONNECTIONS = int(os.environ.get("SEISHA_WS_MAX_CONNECTIONS", "0"))
+MAX_CONNECTIONS_PER_IP = int(os.environ.get("SEISHA_WS_MAX_CONNECTIONS_PER_IP", "0"))
+# Close code asking the client to retry later
+TRY_AGAIN_LATER = 1013
+GLOBAL_TOPIC = "global"
+# Subscribes a Server-Sent Events stream to every topic
+ALL_TOPICS = "*"
+
+
+def tournament_topic(tournament_id: Optional[int]) -> str:
+    if tournament_id is None:
+        return GLOBAL_TOPIC
+    return f"tournament:{tournament_id}"
+
+
+class Client:
+    __slots__ = ("address", "last_seen")
+
+    def __init__(self, address: Optional[str]):
+        self.address = address
+        self.last_seen = time.monotonic()
+
 
 class WebSocketManager:
-    def __init__(self):
+    def __init__(
+        self,
+        backplane: Backplane = None,
+        replay_buffer_size: int = REPLAY_BUFFER_SIZE,
+        coalesce_window: float = COALESCE_WINDOW,
+        ping_interval: float = PING_INTERVAL,
+        ping_timeout: float = PING_TIMEOUT,
+        idle_timeout: float = IDLE_TIMEOUT,
+        max_connections: int = MAX_CONNECTIONS,
+        max_connections_per_ip: int = MAX_CONNECTIONS_PER_IP,
+    ):
         self.active_connections: List[WebSocket] = []
+        # Address and last activity of every connected socket
+        self.clients: Dict[WebSocket, Client] = {}
+        self.connections_per_ip: Dict[Optional[str], int] = {}
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.idle_timeout = idle_timeout
+        self.max_connections = max_connections
+        self.max_connections_per_ip = max_connections_per_ip
+        self.heartbeat_task: Optional[asyncio.Task] = None
+        self.backplane = backplane or LocalBackplane()
+        self.replay_buffer_size = replay_buffer_size
+        # topic -> (seq, frame) of the latest messages
+        self.history: Dict[str, Deque[Tuple[int, str]]] = {}
+        # topic -> highest seq dropped from its buffer
+        self.evicted_seq: Dict[str, int] = {}
+        self.last_seq = 0
+        self.coalesce_window = coalesce_window
+        # topic -> events waiting for the end of the window, keyed by content
+        self.pending: Dict[str, Dict[str, dict]] = {}
+        self.flush_tasks: Set[asyncio.Task] = set()
+        # Sockets being sent a replay -> live frames held until it is sent
+        self.replaying: Dict[WebSocket, List[str]] = {}
+        # topic -> Server-Sent Events streams of display-only clients
+        self.subscribers: Dict[str, Set[Subscription]] = {}
+
+    async def start(self):
+        await self.backplane.start(self.deliver)
+        self.last_seq = self.backplane.start_seq
+        if self.ping_interval > 0:
+            self.heartbeat_task = asyncio.create_task(self.heartbeat())
+
+    async def stop(self):
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+            self.heartbeat_task = None
+        for task in list(self.flush_tasks):
+            task.cancel()
+        for topic in list(self.pending):
+            await self.flush(topic)
+        await self.backplane.stop()
+
+    def rejection(self, address: Optional[str]) -> Optional[str]:
+        """
+        Returns why a new socket from `address` is over a connection cap, None
+        when it can be accepted.
+        """
+        if self.max_connections and len(self.active_connections) >= self.max_connections:
+            return "global_cap"
+        if (
+            self.max_connections_per_ip
+            and self.connections_per_ip.get(address, 0) >= self.max_connections_per_ip
+        ):
+            return "ip_cap"
+        return None
+
+    async def connect(
+        self, websocket: WebSocket, epoch: str = None, last_seq: int = None
+    ) -> bool:
+        """
+        Accepts a socket, unless it is over a connection cap. A client
+        reconnecting with the epoch and the last sequence number it received
+        gets the messages it missed first.
+
+        :return: Whether the socket was accepted.
+        """
+        address = websocket.client.host if websocket.client else None
+        rejection = self.rejection(address)
+        if rejection is not None:
+            ws_connects.inc(result=rejection)
+            await websocket.close(code=TRY_AGAIN_LATER)
+            return False
 
-    async def connect(self, websocket: WebSocket):
         await websocket.accept()
+        ws_connects.inc(result="accepted")
+
+        # Tells the client where the stream is, to resume from after a reconnect
+        await websocket.send_text(
+            json.dumps(
+                {
+                    "event": "hello",
+                    "data": {"epoch": self.backplane.epoch, "seq": self.last_seq},
+                }
+            )
+        )
+
+        # Collected before the socket joins the broadcast list, with no await
+        # in between, so that no message falls between replay and live frames
+        frames = None if last_seq is None else self.missed_frames(epoch, last_seq)
         self.active_connections.append(websocket)
+        self.clients[websocket] = Client(address)
+        self.connections_per_ip[address] = self.connections_per_ip.get(address, 0) + 1
+        ws_connections.set(len(self.active_connections))
+
+        if last_seq is not None:
+            await self.send_replay(websocket, frames)
+        return True
+
+    def disconnect(self, websocket: WebSocket, reason: str = "closed"):
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
 
-    def disconnect(self, websocket: WebSocket):
         self.active_connections.remove(websocket)
+        self.replaying.pop(websocket, None)
+        count = self.connections_per_ip[client.address] - 1
+        if count:
+            self.connections_per_ip[client.address] = count
+        else:
+            del self.connections_per_ip[client.address]
+        ws_disconnects.inc(reason=reason)
+        ws_connections.set(len(self.active_connections))
+
+    def touch(self, websocket: WebSocket):
+        """
+        Records activity on a socket, any message received (pongs included)
+        keeps it from being reaped.
+        """
+        client = self.clients.get(websocket)
+        if client is not None:
+            client.last_seen = time.monotonic()
+
+    async def heartbeat(self):
+        """
+        Pings every socket each `ping_interval`, and closes the ones idle for
+        longer than `idle_timeout`: half-open sockets never send a disconnect
+        and would otherwise stay in the broadcast list. The pings are sent
+        concurrently, so a stalled socket delays none of the others.
+        """
+        ping = json.dumps({"event": "ping", "data": {}})
+        while True:
+            await asyncio.sleep(self.ping_interval)
+
+            now = time.monotonic()
+            alive = []
+            for websocket, client in list(self.clients.items()):
+                if now - client.last_seen > self.idle_timeout:
+                    self.disconnect(websocket, "idle")
+                    await close_quietly(websocket)
+                else:
+                    alive.append(websocket)
+            await asyncio.gather(*(self.send(websocket, ping) for websocket in alive))
+
+    async def send(self, websocket: WebSocket, message: str) -> bool:
+        """
+        Sends a message to a socket, closing it when the send fails or takes
+        longer than `ping_timeout` (a half-open socket whose buffers are full).
+        """
+        try:
+            await asyncio.wait_for(websocket.send_text(message), self.ping_timeout)
+            return True
+        except Exception:
+            self.disconnect(websocket, "send_failed")
+            await close_quietly(websocket)
+            return False
+
+    async def broadcast(self, event: str, data: dict = {}, topic: str = GLOBAL_TOPIC):
+        ws_broadcasts.inc(event=event)
+
+        if self.coalesce_window <= 0:
+            await self.publish(topic, [{"event": event, "data": data}])
+            return
+
+        pending = self.pending.get(topic)
+        if pending is None:
+            pending = self.pending[topic] = {}
+            task = asyncio.create_task(self.flush_later(topic))
+            self.flush_tasks.add(task)
+            task.add_done_callback(self.flush_tasks.discard)
+
+        # The same event about the same series (match and archer) only tells
+        # clients to refetch it once
+        key = json.dumps([event, data], sort_keys=True)
+        if key in pending:
+            ws_coalesced_events.inc()
+            return
+        pending[key] = {"event": event, "data": data}
+
+    async def flush_later(self, topic: str):
+        await asyncio.sleep(self.coalesce_window)
+        await self.flush(topic)
+
+    async def flush(self, topic: str):
+        pending = self.pending.pop(topic, None)
+        if pending:
+            await self.publish(topic, list(pending.values()))
+
+    async def publish(self, topic: str, events: List[dict]):
+        """
+        Publishes the events of a topic as a single frame, a `batch` frame
+        when there are several of them.
+        """
+        if len(events) == 1:
+            message = {**events[0], "topic": topic}
+        else:
+            ws_coalesced_events.inc(len(events) - 1)
+            message = {"event": "batch", "data": {"events": events}, "topic": topic}
+        await self.backplane.publish(json.dumps(message))
+
+    async def deliver(self, seq: int, envelope: str):
+        """
+        Numbers a message published through the backplane, keeps it for replay
+        and sends it to the sockets connected to this worker.
+        """
+        start = time.perf_counter()
+
+        message = json.loads(envelope)
+        message["seq"] = seq
+        frame = json.dumps(message)
+
+        self.remember(message["topic"], seq, frame)
+        self.send_subscribers(message["topic"], seq, frame)
+        await self.send_local(frame)
+
+        ws_broadcast_latency.observe(time.perf_counter() - start)
+
+    def remember(self, topic: str, seq: int, frame: str):
+        buffer = self.history.get(topic)
+        if buffer is None:
+            buffer = self.history[topic] = deque()
+        if len(buffer) >= self.replay_buffer_size:
+            self.evicted_seq[topic] = buffer.popleft()[0]
+        buffer.append((seq, frame))
+        self.last_seq = seq
+
+    def missed_frames(
+        self, epoch: str, last_seq: int, topic: str = ALL_TOPICS
+    ) -> Optional[List[str]]:
+        """
+        Returns the frames of `topic` (and of the global topic, which every
+        stream gets) sent after `last_seq`, in order, or None when some of them
+        are no longer buffered and the client has to resync.
+        """
+        if epoch != self.backplane.epoch or last_seq > self.last_seq:
+            # Another server (or a restarted one) numbered the client's messages
+            return None
+        if last_seq < self.backplane.start_seq:
+            # Messages sent before this worker started are unknown
+            return None
+
+        topics = list(self.history) if topic == ALL_TOPICS else {topic, GLOBAL_TOPIC}
+        if any(self.evicted_seq.get(t, 0) > last_seq for t in topics):
+            return None
+
+        frames = [
+            (seq, frame)
+            for t in topics
+            for seq, frame in self.history.get(t, ())
+            if seq > last_seq
+        ]
+        return [frame for _, frame in sorted(frames)]
+
+    async def resume(self, websocket: WebSocket, epoch: str, last_seq: Optional[int]):
+        """
+        Sends a socket what it missed since `last_seq`, or a resync when
+        `last_seq` is None.
+        """
+        frames = None if last_seq is None else self.missed_frames(epoch, last_seq)
+        await self.send_replay(websocket, frames)
+
+    async def send_replay(self, websocket: WebSocket, frames: Optional[List[str]]):
+        """
+        Sends the frames a socket missed, then the live frames held for it in
+        the meantime: a live frame sent between two replay frames would make
+        the client skip the rest of the replay.
+
+        Must be awaited right after computing `frames`, with no await in
+        between, so that every later frame is held.
+        """
+        held = self.replaying.setdefault(websocket, [])
+        try:
+            if frames is None:
+                await websocket.send_text(self.resync_frame())
+            else:
+                for frame in frames:
+                    await websocket.send_text(frame)
+            while held:
+                await websocket.send_text(held.pop(0))
+        finally:
+            self.replaying.pop(websocket, None)
+
+    def resync_frame(self) -> str:
+        return json.dumps({"event": "resync", "data": {"seq": self.last_seq}})
+
+    def subscribe(
+        self, topic: str, epoch: str = None, last_seq: int = None
+    ) -> Subscription:
+        """
+        Registers a Server-Sent Events stream. A client resuming with the epoch
+        and sequence number of its `Last-Event-ID` gets what it missed first.
+        """
+        subscription = Subscription(topic)
+
+        if last_seq is not None:
+            frames = self.missed_frames(epoch, last_seq, topic)
+            if frames is None:
+                frames = [(self.last_seq, self.resync_frame())]
+            else:
+                frames = [(json.loads(frame)["seq"], frame) for frame in frames]
+            for seq, frame in frames:
+                subscription.push(encode_event(self.backplane.epoch, seq, frame))
+
+        self.subscribers.setdefault(topic, set()).add(subscription)
+        sse_connections.set(sum(map(len, self.subscribers.values())))
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self.subscribers.get(subscription.topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+        sse_connections.set(sum(map(len, self.subscribers.values())))
+
+    def send_subscribers(self, topic: str, seq: int, frame: str):
+        if topic == GLOBAL_TOPIC:
+            # Global events (e.g. `job updated`) go to every stream, like to
+            # every socket
+            subscriptions = [
+                subscription
+                for subscribers in self.subscribers.values()
+                for subscription in subscribers
+            ]
+        else:
+            subscriptions = [
+                *self.subscribers.get(topic, ()),
+                *self.subscribers.get(ALL_TOPICS, ()),
+            ]
+        if not subscriptions:
+            return
+
+        # Encoded once for every subscriber
+        chunk = encode_event(self.backplane.epoch, seq, frame)
+        for subscription in subscriptions:
+            if not subscription.push(chunk):
+                ws_dropped_messages.inc()
+
+    async def send_local(self, message: str):
+        """
+        Sends a message to the sockets connected to this worker, all at once
+        so that a stalled socket only delays the broadcast by `ping_timeout`.
+        """
+        connections = []
+        for connection in list(self.active_connections):
+            held = self.replaying.get(connection)
+            if held is not None:
+                held.append(message)
+            else:
+                connections.append(connection)
+
+        sent = await asyncio.gather(
+            *(self.send(connection, message) for connection in connections)
+        )
+        dropped = sent.count(False)
+        if dropped:
+            # Sockets gone without their receive loop noticing yet
+            ws_dropped_messages.inc(dropped)
 
-    async def broadcast(self, event: str, data: dict = {}):
-        for connection in self.active_connections:
-            await connection.send_text(json.dumps({"event": event, "data": data}))
 
-ws_instance = WebSocketManager()
+async def close_quietly(websocket: WebSocket):
+    try:
+        await websocket.close()
+    except Exception:
+        # Already closed by the client
+        pass
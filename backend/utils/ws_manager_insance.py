@@ -1,3 +1,4 @@
+from .backplane import create_backplane
 from .ws_manager import WebSocketManager
 
-ws_instance = WebSocketManager()
\ No newline at end of file
+ws_instance = WebSocketManager(create_backplane())
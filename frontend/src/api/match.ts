@@ -11,6 +11,27 @@ export const postArrowToMatch = async (
   return api.post(`/matches/${matchId}/archers/${archerId}/arrows`, { arrow: state })
 }
 
+export type ScorerArrow = {
+  seq: number
+  match_id: number
+  archer_id: number
+  arrow: HitOutcome
+}
+
+export type ScorerSyncResult = {
+  client_id: string
+  applied: number[]
+  duplicates: number[]
+  last_seq: number | null
+}
+
+export const postScorerSync = async (
+  clientId: string,
+  arrows: ScorerArrow[],
+): Promise<AxiosResponse<ScorerSyncResult>> => {
+  return api.post('/scorers/sync', { client_id: clientId, arrows })
+}
+
 export const putArrow = async (
   matchId: number,
   archerId: number,
@@ -6,8 +6,33 @@ export const getPaginatedTournaments = async (page: number, limit: number = 10)
   return api.get(`/tournaments/paginate?page=${page}&limit=${limit}`)
 }
 
-export const getTournament = async (tournamentId: number) => {
-  return api.get(`/tournaments/${tournamentId}`)
+/**
+ * `fields` and `include` select the returned fields and relationships, e.g.
+ * `{ fields: 'name', include: '' }` for the name only. Everything by default.
+ */
+export const getTournament = async (
+  tournamentId: number,
+  shape: { fields?: string; include?: string } = {},
+) => {
+  return api.get(`/tournaments/${tournamentId}`, { params: shape })
+}
+
+export const getTournamentMatches = async (
+  tournamentId: number,
+  params: {
+    stage?: string
+    finished?: boolean
+    format?: string
+    cursor?: string
+    limit?: number
+    include?: string
+  } = {},
+) => {
+  return api.get(`/tournaments/${tournamentId}/matches`, { params })
+}
+
+export const getTournamentLiveSummary = async (tournamentId: number) => {
+  return api.get(`/tournaments/${tournamentId}/live-summary`)
 }
 
 export const getAllLiveTournaments = async () => {
@@ -46,13 +71,6 @@ export const deleteTournamentArcher = async (tournamentId: number, archerId: num
   return api.delete(`/tournaments/${tournamentId}/archers/${archerId}`)
 }
 
-export const putTournamentStage = async (
-  tournamentId: number,
-  advancingParticipants: { id: number; hit_count: number }[],
-  tieBreakerNeeded: boolean,
-) => {
-  return api.put(`/tournaments/${tournamentId}/stage`, {
-    advancing_participants: advancingParticipants,
-    tie_breaker_needed: tieBreakerNeeded,
-  })
+export const putTournamentStage = async (tournamentId: number) => {
+  return api.put(`/tournaments/${tournamentId}/stage`, {})
 }
@@ -69,6 +69,18 @@ export type TournamentWithRelations = Tournament & {
   matches: Match[]
 }
 
+export type Standing = {
+  id: number
+  name: string
+  number: number
+  hits: number
+  arrows: number
+}
+
+export type TournamentLiveSummary = TournamentWithRelations & {
+  standings: Standing[]
+}
+
 export type PaginatedResponse<T> = {
   count: number
   total: number
@@ -0,0 +1,25 @@
+const baseURL = 'http://localhost:8000'
+
+/**
+ * Read-only feed of the server events, for screens that only display data.
+ * The browser reconnects on its own and resumes from the last event it got.
+ */
+export const listen = (path: string, onmessage: (ev: MessageEvent) => void) => {
+  const source = new EventSource(baseURL + path)
+  source.onmessage = onmessage
+  return source
+}
+
+/**
+ * Names of the events carried by a message. Events broadcast within a short
+ * window are grouped by the server into a single `batch` message.
+ */
+export const eventNames = (message: {
+  event: string
+  data?: { events?: { event: string }[] }
+}): string[] => {
+  if (message.event === 'batch') {
+    return (message.data?.events ?? []).map((event) => event.event)
+  }
+  return [message.event]
+}
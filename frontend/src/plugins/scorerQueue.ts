@@ -0,0 +1,83 @@
+import { postScorerSync, type ScorerArrow } from '@/api/match'
+import type { HitOutcome } from '@/models/constants'
+import { isAxiosError } from 'axios'
+
+const storageKey = 'scorer-queue'
+const retryDelay = 5000
+// The server accepts up to 1000 arrows per upload
+const batchSize = 500
+
+/**
+ * Arrows recorded on this device, kept in local storage until the server
+ * acknowledged them. Every arrow gets a sequence number, so an upload that
+ * timed out can be sent again without the server applying it twice.
+ */
+class ScorerQueue {
+  private clientId: string
+  private nextSeq: number
+  private arrows: ScorerArrow[]
+  private syncing: Promise<void> = Promise.resolve()
+  private retry: ReturnType<typeof setTimeout> | null = null
+
+  constructor() {
+    const saved = JSON.parse(localStorage.getItem(storageKey) ?? 'null')
+    this.clientId = saved?.clientId ?? crypto.randomUUID()
+    this.nextSeq = saved?.nextSeq ?? 1
+    this.arrows = saved?.arrows ?? []
+
+    window.addEventListener('online', () => this.sync().catch(() => {}))
+    this.sync().catch(() => {})
+  }
+
+  push(matchId: number, archerId: number, arrow: HitOutcome): Promise<void> {
+    this.arrows.push({ seq: this.nextSeq++, match_id: matchId, archer_id: archerId, arrow })
+    this.save()
+    return this.sync()
+  }
+
+  sync(): Promise<void> {
+    // Uploads run one after the other, each sends everything still queued
+    this.syncing = this.syncing.catch(() => {}).then(() => this.upload())
+    return this.syncing
+  }
+
+  private async upload() {
+    if (this.retry !== null) {
+      clearTimeout(this.retry)
+      this.retry = null
+    }
+
+    try {
+      while (this.arrows.length > 0) {
+        const res = await postScorerSync(this.clientId, this.arrows.slice(0, batchSize))
+        this.acknowledge([...res.data.applied, ...res.data.duplicates])
+      }
+    } catch (err) {
+      const status = isAxiosError(err) ? err.response?.status : undefined
+
+      if (status !== undefined && status >= 400 && status < 500 && status !== 409) {
+        // Rejected (e.g. the match was deleted), sending it again cannot help
+        console.error('Queued arrows rejected:', err)
+        this.acknowledge(this.arrows.slice(0, batchSize).map((arrow) => arrow.seq))
+      } else {
+        this.retry = setTimeout(() => this.sync().catch(() => {}), retryDelay)
+      }
+      throw err
+    }
+  }
+
+  private acknowledge(seqs: number[]) {
+    const done = new Set(seqs)
+    this.arrows = this.arrows.filter((arrow) => !done.has(arrow.seq))
+    this.save()
+  }
+
+  private save() {
+    localStorage.setItem(
+      storageKey,
+      JSON.stringify({ clientId: this.clientId, nextSeq: this.nextSeq, arrows: this.arrows }),
+    )
+  }
+}
+
+export const scorerQueue = new ScorerQueue()
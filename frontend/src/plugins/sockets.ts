@@ -1,5 +1,89 @@
-export const ws = new WebSocket('ws://localhost:8000/ws');
+const url = 'ws://localhost:8000/ws'
+const reconnectDelay = 1000
+// The server pings every 20 seconds, a socket silent for longer is half-open
+const silenceTimeout = 50000
 
-ws.onopen = () => {
-  console.log('WebSocket connection established');
-};
\ No newline at end of file
+/**
+ * WebSocket that reconnects when the connection drops and asks the server for
+ * the messages it missed in the meantime. When the server cannot replay them
+ * it sends a `resync` event, after which listeners should reload their data.
+ */
+class ResumableSocket {
+  onmessage: ((ev: MessageEvent) => void) | null = null
+
+  private epoch: string | null = null
+  private lastSeq: number | null = null
+  private watchdog: ReturnType<typeof setTimeout> | null = null
+
+  constructor(private url: string) {
+    this.connect()
+  }
+
+  private connect() {
+    const params =
+      this.epoch !== null && this.lastSeq !== null
+        ? `?epoch=${this.epoch}&last_seq=${this.lastSeq}`
+        : ''
+    const socket = new WebSocket(this.url + params)
+
+    socket.onopen = () => {
+      console.log('WebSocket connection established')
+      this.watch(socket)
+    }
+
+    socket.onmessage = (ev: MessageEvent) => {
+      this.watch(socket)
+      const message = JSON.parse(ev.data)
+
+      if (message.event === 'ping') {
+        socket.send(JSON.stringify({ action: 'pong' }))
+        return
+      }
+
+      if (message.event === 'hello') {
+        // A new stream numbering means every message since the drop is lost
+        if (this.epoch !== null && this.epoch !== message.data.epoch) {
+          this.dispatchResync(message.data.seq)
+        }
+        this.epoch = message.data.epoch
+        this.lastSeq ??= message.data.seq
+        return
+      }
+
+      if (message.seq !== undefined) {
+        if (this.lastSeq !== null && message.seq <= this.lastSeq) {
+          return
+        }
+        this.lastSeq = message.seq
+      } else if (message.event === 'resync') {
+        this.lastSeq = message.data.seq
+      }
+
+      this.onmessage?.(ev)
+    }
+
+    socket.onclose = () => {
+      if (this.watchdog !== null) {
+        clearTimeout(this.watchdog)
+      }
+      setTimeout(() => this.connect(), reconnectDelay)
+    }
+  }
+
+  /** Closes the socket, to reconnect, when nothing arrives for too long. */
+  private watch(socket: WebSocket) {
+    if (this.watchdog !== null) {
+      clearTimeout(this.watchdog)
+    }
+    this.watchdog = setTimeout(() => socket.close(), silenceTimeout)
+  }
+
+  private dispatchResync(seq: number) {
+    this.lastSeq = seq
+    this.onmessage?.(
+      new MessageEvent('message', { data: JSON.stringify({ event: 'resync', data: { seq } }) }),
+    )
+  }
+}
+
+export const ws = new ResumableSocket(url)